@@ -0,0 +1,30 @@
+# gunicorn -c gunicorn.conf.py makeupAI_hosted.wsgi
+# ASGI: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py makeupAI_hosted.asgi
+import os
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+# "sync" (gthread when threads > 1) for WSGI; uvicorn.workers.UvicornWorker
+# for ASGI, where ASYNC_INFERENCE_WORKERS bounds concurrent inference instead
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Load the models once in the master and share them copy-on-write with the
+# workers (see recommender/AImodels/preload.py). Only the torch backend can be
+# preloaded, so that's the default only for it.
+_torch_backend = os.getenv("INFERENCE_BACKEND", "torch") == "torch"
+preload_app = os.getenv("GUNICORN_PRELOAD", str(_torch_backend)) == "True"
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded, before any worker is forked
+    if preload_app:
+        from recommender.AImodels.preload import preload_models
+        preload_models()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from recommender.AImodels.preload import reset_after_fork
+        reset_after_fork(server.cfg.workers)
@@ -3,6 +3,13 @@ ASGI config for makeupAI project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with the same gunicorn config (preloading, post-fork resets) and
+uvicorn workers, and point clients at the async analysis endpoints
+(/upload/async/, /wordpress/analyze/async/):
+
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \
+        gunicorn -c gunicorn.conf.py makeupAI_hosted.asgi
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -49,7 +49,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', 
+    'recommender.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,6 +88,9 @@ DATABASES = {
         'HOST': os.getenv("DB_HOST", "localhost"),
         'PORT': '',
         "CONN_MAX_AGE": 300,  # don’t keep forever
+        # Not every model has a migration in this repo: build the test
+        # database straight from the models
+        "TEST": {"MIGRATE": False},
 
         # 'ENGINE': os.getenv("DB_ENGINE", "django.db.backends.sqlite3"), #for sqlite3
         # 'NAME': os.getenv("DB_NAME", BASE_DIR / 'db.sqlite3'),
@@ -123,4 +126,164 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 CORS_ALLOWED_ORIGINS = []
 CORS_ALLOW_CREDENTIALS = True
 
+### Inference tuning
+# Cross-request micro-batching for the skin-type, eye-color and acne models.
+# Only useful with threaded workers (e.g. gunicorn --threads), where several
+# requests reach the models at the same time.
+INFERENCE_BATCHING_ENABLED = os.getenv("INFERENCE_BATCHING_ENABLED", "False") == "True"
+INFERENCE_BATCH_MAX_SIZE = int(os.getenv("INFERENCE_BATCH_MAX_SIZE", "8"))
+INFERENCE_BATCH_MAX_WAIT_MS = float(os.getenv("INFERENCE_BATCH_MAX_WAIT_MS", "10"))
 
+# Memory governor: when to run full garbage collections ("off", "every_n", "rss")
+INFERENCE_GC_POLICY = os.getenv("INFERENCE_GC_POLICY", "every_n")
+INFERENCE_GC_EVERY_N = int(os.getenv("INFERENCE_GC_EVERY_N", "20"))
+INFERENCE_GC_RSS_THRESHOLD_MB = int(os.getenv("INFERENCE_GC_RSS_THRESHOLD_MB", "1500"))
+# Gracefully recycle a gunicorn worker once its RSS exceeds this (0 = never)
+WORKER_RECYCLE_RSS_MB = int(os.getenv("WORKER_RECYCLE_RSS_MB", "0"))
+
+# Classifier backend: "torch" or "onnx" (run `manage.py export_onnx` first)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# Intra-op threads per worker for model inference (0 = number of physical cores)
+INFERENCE_NUM_THREADS = int(os.getenv("INFERENCE_NUM_THREADS", "0"))
+# Torch backend precision: "fp32", "int8_dynamic", "int8_static" (run
+# `manage.py calibrate_int8` first) or "bf16" (CPUs with native bfloat16 only)
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32")
+# Map converted classifier weights (`manage.py convert_safetensors`) instead of
+# deserializing the .pth files; ignored for models that were not converted
+INFERENCE_WEIGHTS_MMAP = os.getenv("INFERENCE_WEIGHTS_MMAP", "True") == "True"
+
+# Acne classifier input resolution: "fixed" (640) or "adaptive" (smallest rung
+# of ACNE_RESOLUTIONS covering the face crop's longer side)
+ACNE_RESOLUTION_POLICY = os.getenv("ACNE_RESOLUTION_POLICY", "fixed")
+ACNE_RESOLUTIONS = [int(r) for r in os.getenv("ACNE_RESOLUTIONS", "320,448,640").split(",")]
+
+# Dedicated inference pool (`manage.py run_inference_pool`). When enabled, web
+# workers hand decoded frames to the pool over shared memory and never load
+# the models themselves; when disabled, inference runs in the web worker.
+INFERENCE_POOL_ENABLED = os.getenv("INFERENCE_POOL_ENABLED", "False") == "True"
+INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "2"))
+# Torch intra-op threads per pool process (0 = physical cores / pool size)
+INFERENCE_POOL_TORCH_THREADS = int(os.getenv("INFERENCE_POOL_TORCH_THREADS", "0"))
+INFERENCE_POOL_TIMEOUT = float(os.getenv("INFERENCE_POOL_TIMEOUT", "30"))
+INFERENCE_POOL_SOCKET = os.getenv("INFERENCE_POOL_SOCKET", "/tmp/beautyai-inference.sock")
+
+# Upload decoding: JPEGs whose longer side exceeds UPLOAD_DECODE_MAX_SIDE are
+# decoded at a reduced scale (0 = always full resolution); images that would
+# still decode to more than UPLOAD_MAX_PIXELS pixels are rejected from the header
+UPLOAD_DECODE_MAX_SIDE = int(os.getenv("UPLOAD_DECODE_MAX_SIDE", "2000"))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "25000000"))
+
+# mediapipe FaceMesh graphs per worker, checked out by concurrent request
+# threads (defaults to one per gunicorn thread)
+FACEMESH_POOL_SIZE = int(os.getenv("FACEMESH_POOL_SIZE", os.getenv("GUNICORN_THREADS", "1")))
+# Threads that run decoding and inference for the async (ASGI) analysis
+# views; concurrent requests beyond this wait in the executor
+ASYNC_INFERENCE_WORKERS = int(os.getenv("ASYNC_INFERENCE_WORKERS", str(FACEMESH_POOL_SIZE)))
+# Face detection runs on a proxy with this longer side (0 = full resolution);
+# face and eye crops are still cut from the full-resolution photo
+FACEMESH_PROXY_MAX_SIDE = int(os.getenv("FACEMESH_PROXY_MAX_SIDE", "640"))
+
+# YOLO models per analysis: "both" (best.pt boxes + segmentation) or
+# "seg_only" (boxes derived from the segmentation model, one YOLO pass)
+INFERENCE_YOLO_MODE = os.getenv("INFERENCE_YOLO_MODE", "both")
+
+# Stages of one request that run concurrently (classifiers, detection,
+# segmentation; response JPEG encodes). 1 = run them one after another.
+INFERENCE_STAGE_WORKERS = int(os.getenv("INFERENCE_STAGE_WORKERS", "3"))
+# Torch threads per worker shared by concurrent stages (0 = torch's default)
+INFERENCE_THREAD_BUDGET = int(os.getenv("INFERENCE_THREAD_BUDGET", "0"))
+
+# Default overlay format of upload responses (clients can pass `overlay`):
+# "image" = rendered overlays as base64 JPEGs, "vector" = boxes and mask
+# polygons (decimated to OVERLAY_POLYGON_TOLERANCE px) drawn client-side
+RESPONSE_OVERLAY_MODE = os.getenv("RESPONSE_OVERLAY_MODE", "image")
+OVERLAY_POLYGON_TOLERANCE = float(os.getenv("OVERLAY_POLYGON_TOLERANCE", "1.5"))
+
+# How upload responses deliver their images (clients can pass `images`):
+# "inline" = base64 data URLs, what plugins that don't send `images` expect;
+# "url" = signed URLs into the artifact store, valid ARTIFACT_TTL_SECONDS
+# (keep it well above RESULT_CACHE_TTL_SECONDS), for clients that opt in.
+# The default local store is per node: behind several nodes, use a shared
+# ARTIFACT_ROOT or another ARTIFACT_STORE_BACKEND.
+RESPONSE_IMAGE_MODE = os.getenv("RESPONSE_IMAGE_MODE", "inline")
+ARTIFACT_STORE_BACKEND = os.getenv("ARTIFACT_STORE_BACKEND", "recommender.AImodels.artifacts.LocalArtifactStore")
+ARTIFACT_ROOT = os.getenv("ARTIFACT_ROOT", "/tmp/beautyai-artifacts")
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", "3600"))
+ARTIFACT_MAX_MB = int(os.getenv("ARTIFACT_MAX_MB", "512"))
+# Scheme and host for artifact URLs (empty = the request's own host)
+ARTIFACT_BASE_URL = os.getenv("ARTIFACT_BASE_URL", "")
+
+# Response image encoding profile (see recommender/AImodels/encoding.py;
+# clients can pass `encoding`) and whether the images encode concurrently
+RESPONSE_ENCODING_PROFILE = os.getenv("RESPONSE_ENCODING_PROFILE", "default")
+RESPONSE_ENCODE_CONCURRENT = os.getenv("RESPONSE_ENCODE_CONCURRENT", "True") == "True"
+
+# Per-worker cache of analysis responses keyed by the decoded image content
+# (resubmitted photos skip the models; usage is still counted)
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "True") == "True"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "128"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "600"))
+
+# Job mode (clients pass mode=job): uploads are queued in the AnalysisJob
+# table, analyzed by `manage.py run_analysis_workers` on any node and polled
+# at /jobs/<id>/. Behind several nodes, result images need a shared artifact
+# store (or clients asking for images=inline).
+ANALYSIS_JOBS_ENABLED = os.getenv("ANALYSIS_JOBS_ENABLED", "False") == "True"
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+# A running job whose heartbeat is older than this is re-queued
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "30"))
+# Delay before retry n is n times this
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "5"))
+# Jobs (and their results) are deleted this long after being queued or finished
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "900"))
+# Idle workers look for new jobs this often
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Admission control for the analysis endpoints (see
+# recommender/AImodels/admission.py): analyses running at once per process
+# (defaults to one per gunicorn thread) and per node (flock()ed slot files in
+# ADMISSION_SLOT_DIR, 0 = no node limit), requests waiting for a slot, and how
+# long one may wait before it gets 503 + Retry-After instead
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "True") == "True"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(FACEMESH_POOL_SIZE)))
+ADMISSION_NODE_SLOTS = int(os.getenv("ADMISSION_NODE_SLOTS", "0"))
+ADMISSION_SLOT_DIR = os.getenv("ADMISSION_SLOT_DIR", "/tmp/beautyai-admission")
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "8"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+
+# Shared cache for the rate limits (and the CORS origins) across workers and
+# nodes, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache with
+# CACHE_LOCATION=redis://127.0.0.1:6379/1. The default is per process.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Rate limits of the analysis endpoints (see recommender/ratelimit.py): token
+# buckets per client IP and per shop, checked before the upload is decoded.
+# WordPress shops use their Plan's rates; these apply to Shopify shops.
+# On by default only with a shared CACHE_BACKEND: with the per-process
+# default every worker would keep its own buckets.
+SHARED_CACHE = not CACHES["default"]["BACKEND"].endswith((".LocMemCache", ".DummyCache"))
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", str(SHARED_CACHE)) == "True"
+RATE_LIMIT_SHOP_PER_MINUTE = float(os.getenv("RATE_LIMIT_SHOP_PER_MINUTE", "60"))
+RATE_LIMIT_SHOP_BURST = int(os.getenv("RATE_LIMIT_SHOP_BURST", "10"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "20"))
+RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "5"))
+# Reverse proxies in front of the app that append the client address to
+# X-Forwarded-For. The client IP of the rate limits, FaceAnalysis and visitor
+# logs is the entry the outermost of them added; earlier entries are
+# client-supplied and ignored. 0 (the default) uses the connection's address,
+# as without proxies: set it to the actual number of hops (e.g. 1 behind a
+# single nginx), or every client shares the proxy's IP bucket.
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
+# Cold start without network access: no pretrained-weight downloads, and
+# ultralytics skips its connectivity check, update/font downloads and events
+INFERENCE_OFFLINE = os.getenv("INFERENCE_OFFLINE", "True") == "True"
+if INFERENCE_OFFLINE:
+    os.environ.setdefault("YOLO_OFFLINE", "True")
@@ -0,0 +1,286 @@
+# recommender/AImodels/admission.py
+import fcntl
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+# ----------------------
+# 🚦 Admission control
+# ----------------------
+# Past capacity, requests used to pile up in gunicorn until they timed out,
+# each one still decoding its upload and running FaceMesh first. The analysis
+# views now ask the admission controller before touching the upload:
+#
+# - at most ADMISSION_MAX_CONCURRENT analyses run per process, and at most
+#   ADMISSION_NODE_SLOTS per node (flock()ed slot files shared by all the
+#   workers on the machine, 0 = no node limit);
+# - up to ADMISSION_MAX_QUEUE further requests wait for a free slot;
+# - a request is turned away with 503 + Retry-After when the queue is full,
+#   when its expected wait (queue position x recent analysis time) exceeds
+#   ADMISSION_MAX_WAIT_SECONDS, or when it has waited that long.
+#
+# The JSON views are wrapped in admission_controlled (sync or async). The
+# stream views answer before their analysis has finished, so they acquire()
+# a slot themselves and the analysis thread release()s it when it ends.
+
+
+class Overloaded(Exception):
+    """No capacity for another analysis; retry after `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class _NodeSlots:
+    """ADMISSION_NODE_SLOTS flock()ed files, one per analysis running on this node."""
+
+    def __init__(self, directory, slots):
+        self.directory = directory
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+        self._files = []
+        self._held = set()
+
+    def try_acquire(self):
+        """Index of a slot now held by the caller, or None if all are taken."""
+        with self._lock:
+            self._ensure_files()
+            for index, fd in enumerate(self._files):
+                # flock() locks belong to the open file: slots another thread
+                # of this process holds would look free, so skip them here
+                if index in self._held:
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self._held.add(index)
+                return index
+        return None
+
+    def release(self, index):
+        with self._lock:
+            self._held.discard(index)
+            if self._pid == os.getpid():
+                fcntl.flock(self._files[index], fcntl.LOCK_UN)
+
+    def _ensure_files(self):
+        # Forked workers must open their own files: an inherited descriptor
+        # shares its lock with the parent
+        if self._pid == os.getpid():
+            return
+        for fd in self._files:
+            os.close(fd)
+        os.makedirs(self.directory, exist_ok=True)
+        self._files = [
+            os.open(os.path.join(self.directory, f"slot-{index}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+            for index in range(self.slots)
+        ]
+        self._held = set()
+        self._pid = os.getpid()
+
+
+class AdmissionController:
+    """
+    Bounded concurrency plus a bounded, deadline-limited wait queue for the
+    analysis views. Use `with controller.admit(): ...` around the work;
+    raises Overloaded when the request should be rejected.
+    """
+
+    # Weight of the latest analysis in the moving average of service times
+    EWMA_ALPHA = 0.2
+    # Re-check interval while waiting for a node slot held by another worker
+    NODE_POLL_SECONDS = 0.05
+
+    def __init__(self, max_concurrent=1, max_queue=4, max_wait_seconds=10.0, node_slots=0, slot_dir=None,
+                 enabled=True):
+        self.enabled = enabled
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.max_wait = float(max_wait_seconds)
+        self.node_slots = _NodeSlots(slot_dir, int(node_slots)) if node_slots and slot_dir else None
+
+        self.in_flight = 0
+        self.queued = 0
+        self.peak_in_flight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "expected_wait": 0, "timeout": 0}
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        # Moving average of how long an admitted request holds its slot
+        self.service_seconds = None
+        self._cond = threading.Condition()
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    @contextmanager
+    def admit(self):
+        slot = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(slot)
+
+    def acquire(self):
+        """
+        Take a slot (raises Overloaded if rejected) for work that outlives the
+        caller; pass the return value to release() once the work is done.
+        """
+        if not self.enabled:
+            return None
+        return self._acquire(), time.monotonic()
+
+    def release(self, slot):
+        if slot is None:
+            return
+        node_slot, started = slot
+        self._release(node_slot, time.monotonic() - started)
+
+    def expected_wait(self, position) -> float:
+        """Seconds until the request `position` places back in the queue gets a slot."""
+        service = self.service_seconds or 0.0
+        return service * math.ceil(position / self.max_concurrent)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_wait_seconds": self.max_wait,
+            "node_slots": self.node_slots.slots if self.node_slots else 0,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_in_flight": self.peak_in_flight,
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "mean_wait_ms": round(self.wait_seconds / self.admitted * 1000.0, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000.0, 2),
+            "service_ms": round(self.service_seconds * 1000.0, 2) if self.service_seconds else None,
+        }
+
+    # ----------------------
+    # Internals
+    # ----------------------
+    def _acquire(self):
+        arrived = time.monotonic()
+        deadline = arrived + self.max_wait
+        with self._cond:
+            if self.in_flight >= self.max_concurrent:
+                position = self.queued + 1
+                if position > self.max_queue:
+                    self._reject("queue_full", "Server busy, please retry shortly.", self.expected_wait(position))
+                expected = self.expected_wait(position)
+                if expected > self.max_wait:
+                    self._reject("expected_wait", "Server busy, please retry shortly.", expected)
+
+                self.queued += 1
+                self.peak_queued = max(self.peak_queued, self.queued)
+                try:
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject("timeout", "Timed out waiting for capacity.", self.expected_wait(self.queued))
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        node_slot = None
+        if self.node_slots is not None:
+            try:
+                node_slot = self._acquire_node_slot(deadline)
+            except Overloaded:
+                self._release(None, None)
+                raise
+
+        waited = time.monotonic() - arrived
+        with self._cond:
+            self.admitted += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return node_slot
+
+    def _acquire_node_slot(self, deadline):
+        while True:
+            slot = self.node_slots.try_acquire()
+            if slot is not None:
+                return slot
+            if time.monotonic() >= deadline:
+                with self._cond:
+                    self._reject("timeout", "Timed out waiting for capacity.", self.service_seconds or 1)
+            time.sleep(self.NODE_POLL_SECONDS)
+
+    def _release(self, node_slot, service_seconds):
+        if node_slot is not None:
+            self.node_slots.release(node_slot)
+        with self._cond:
+            self.in_flight -= 1
+            if service_seconds is not None:
+                if self.service_seconds is None:
+                    self.service_seconds = service_seconds
+                else:
+                    self.service_seconds += self.EWMA_ALPHA * (service_seconds - self.service_seconds)
+            self._cond.notify()
+
+    def _reject(self, reason, message, retry_after):
+        # Called with self._cond held
+        self.rejected[reason] += 1
+        raise Overloaded(message, retry_after)
+
+
+analysis_admission = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_wait_seconds=settings.ADMISSION_MAX_WAIT_SECONDS,
+    node_slots=settings.ADMISSION_NODE_SLOTS,
+    slot_dir=settings.ADMISSION_SLOT_DIR,
+    enabled=settings.ADMISSION_ENABLED,
+)
+
+
+def overloaded_response(e) -> JsonResponse:
+    response = JsonResponse({"error": str(e)}, status=503)
+    response["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def admission_controlled(view):
+    """
+    Decorator for the analysis views (sync or async): the view only runs once
+    admitted, otherwise the client gets 503 with a Retry-After header. Async
+    views wait for their slot on a thread, not on the event loop.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            try:
+                slot = await sync_to_async(analysis_admission.acquire, thread_sensitive=False)()
+            except Overloaded as e:
+                return overloaded_response(e)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                analysis_admission.release(slot)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            with analysis_admission.admit():
+                return view(request, *args, **kwargs)
+        except Overloaded as e:
+            return overloaded_response(e)
+    return wrapper
@@ -0,0 +1,40 @@
+# recommender/AImodels/annotate.py
+import cv2
+import numpy as np
+from PIL import Image
+
+# "image": overlays rendered server-side and returned as JPEGs
+# "vector": boxes and simplified mask polygons returned as data, drawn by the client
+OVERLAY_MODES = ("image", "vector")
+
+# ----------------------
+# 🖍️ Detection overlays
+# ----------------------
+def draw_detections(image_bgr, detections):
+    """Draw `detections` ({'bbox', 'label', 'confidence'}) in place on a BGR image."""
+    for detection in detections:
+        x1, y1, x2, y2 = detection["bbox"]
+        cv2.rectangle(image_bgr, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(image_bgr, f"{detection['label']} {detection['confidence']:.2f}", (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    return image_bgr
+
+
+def bgr_to_pil(image_bgr):
+    """PIL image from a writable BGR array (channels swapped in place)."""
+    return Image.fromarray(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB, dst=image_bgr))
+
+
+# ----------------------
+# 📐 Vector overlays
+# ----------------------
+def simplify_polygon(points, tolerance=1.5):
+    """
+    Mask outline (N×2 float array, pixel coordinates) decimated with
+    Douglas-Peucker to within `tolerance` pixels, as [[x, y], ...] ints.
+    """
+    points = np.asarray(points, dtype=np.float32)
+    if len(points) < 3:
+        return []
+    simplified = cv2.approxPolyDP(points.reshape(-1, 1, 2), tolerance, True)
+    return np.rint(simplified.reshape(-1, 2)).astype(int).tolist()
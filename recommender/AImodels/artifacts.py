@@ -0,0 +1,218 @@
+# recommender/AImodels/artifacts.py
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+# ----------------------
+# 🗂️ Short-lived result images
+# ----------------------
+# In "url" image mode the response images are written here once and returned
+# as signed, expiring URLs (served by views.serve_artifact) instead of being
+# base64-inlined in the JSON. Artifacts are content-addressed: the key is a
+# hash of the bytes, which also serves as the HTTP ETag.
+
+SIGNING_SALT = "recommender.artifacts"
+IMAGE_FIELDS = ("cropped_face", "yolo_annotated", "segmentation_overlay")
+
+
+class LocalArtifactStore:
+    """
+    Artifacts as files under `root` (local disk or tmpfs). A janitor thread,
+    started lazily in each process, deletes files older than `ttl_seconds`
+    and then the oldest files while the total exceeds `max_bytes`. Every
+    worker of a node shares the directory, so URLs work from any of them.
+
+    Other backends (e.g. object storage shared by several nodes) implement
+    put/open/exists/stats and are selected with ARTIFACT_STORE_BACKEND.
+    """
+
+    _start_lock = threading.Lock()
+
+    def __init__(self, root=None, ttl_seconds=3600, max_bytes=512 * 1024 * 1024, janitor_interval=60):
+        self.root = root or os.path.join(tempfile.gettempdir(), "beautyai-artifacts")
+        self.ttl = float(ttl_seconds)
+        self.max_bytes = int(max_bytes)
+        self.janitor_interval = float(janitor_interval)
+
+        self.puts = 0
+        self.dedup_puts = 0
+        self.evicted_expired = 0
+        self.evicted_size = 0
+        self.stored_bytes = 0
+        self.stored_files = 0
+        self._pid = None
+        self._thread = None
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    def put(self, data: bytes, suffix=".jpg") -> str:
+        """Store `data` and return its key."""
+        self._ensure_janitor()
+        key = hashlib.blake2b(data, digest_size=16).hexdigest() + suffix
+        path = self._path(key)
+        self.puts += 1
+        if os.path.exists(path):
+            # Same image again: refresh its TTL instead of rewriting it
+            self.dedup_puts += 1
+            os.utime(path)
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return key
+
+    def open(self, key):
+        """Binary file object for `key`, or None if it expired or never existed."""
+        try:
+            return open(self._path(key), "rb")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def exists(self, key) -> bool:
+        try:
+            return os.path.exists(self._path(key))
+        except ValueError:
+            return False
+
+    def cleanup(self):
+        """One janitor pass: TTL first, then size."""
+        now = time.time()
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # removed by another worker's janitor
+                if now - stat.st_mtime > self.ttl:
+                    if self._remove(path):
+                        self.evicted_expired += 1
+                else:
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        while files and total > self.max_bytes:
+            _, size, path = files.pop(0)
+            total -= size
+            if self._remove(path):
+                self.evicted_size += 1
+        self.stored_bytes = total
+        self.stored_files = len(files)
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "ttl_seconds": self.ttl,
+            "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+            "stored_files": self.stored_files,
+            "stored_mb": round(self.stored_bytes / (1024 * 1024), 1),
+            "puts": self.puts,
+            "dedup_puts": self.dedup_puts,
+            "evicted_expired": self.evicted_expired,
+            "evicted_size": self.evicted_size,
+        }
+
+    # ----------------------
+    # Internals
+    # ----------------------
+    def _path(self, key):
+        # Keys are hex digests plus a suffix; anything else is not ours
+        name, _, suffix = key.partition(".")
+        if not name or not all(c in "0123456789abcdef" for c in name) or not suffix.isalnum():
+            raise ValueError(f"Invalid artifact key {key!r}")
+        return os.path.join(self.root, name[:2], key)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _ensure_janitor(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != pid:
+                self._thread = threading.Thread(
+                    target=self._janitor_loop, name="artifact-janitor", daemon=True
+                )
+                self._thread.start()
+                self._pid = pid
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(self.janitor_interval)
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"[ARTIFACTS] janitor pass failed: {e}")
+
+
+artifact_store = import_string(settings.ARTIFACT_STORE_BACKEND)(
+    root=settings.ARTIFACT_ROOT,
+    ttl_seconds=settings.ARTIFACT_TTL_SECONDS,
+    max_bytes=settings.ARTIFACT_MAX_MB * 1024 * 1024,
+)
+
+
+# ----------------------
+# Signed URLs
+# ----------------------
+def artifact_url(key) -> str:
+    """Site-relative URL of `key`, valid for ARTIFACT_TTL_SECONDS."""
+    token = signing.TimestampSigner(salt=SIGNING_SALT).sign(key)
+    return reverse("serve_artifact", args=[token])
+
+
+def artifact_key(token, max_age=None):
+    """Key from a URL token; raises signing.BadSignature (or SignatureExpired)."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).unsign(token, max_age=max_age)
+
+
+def _payload_keys(payload):
+    prefix = reverse("serve_artifact", args=["x"])[:-2]
+    for field in IMAGE_FIELDS:
+        url = payload.get(field)
+        if isinstance(url, str) and url.startswith(prefix):
+            yield artifact_key(url[len(prefix):].rstrip("/"))
+
+
+def artifacts_available(payload) -> bool:
+    """False if a cached payload points at images the janitor already evicted."""
+    return all(artifact_store.exists(key) for key in _payload_keys(payload))
+
+
+def absolute_image_urls(payload, request) -> dict:
+    """
+    Copy of `payload` with site-relative artifact URLs made absolute (the
+    storefront widget runs on the shop's domain). ARTIFACT_BASE_URL, if set,
+    takes precedence over the request's host.
+    """
+    response = dict(payload)
+    for field in IMAGE_FIELDS:
+        url = response.get(field)
+        if isinstance(url, str) and url.startswith("/"):
+            base = settings.ARTIFACT_BASE_URL
+            response[field] = f"{base.rstrip('/')}{url}" if base else request.build_absolute_uri(url)
+    return response
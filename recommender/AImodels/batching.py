@@ -0,0 +1,163 @@
+# recommender/AImodels/batching.py
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import torch
+
+# ----------------------
+# 📦 Cross-request micro-batching
+# ----------------------
+class _PendingItem:
+    __slots__ = ("tensor", "size", "future", "enqueued_at")
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+        self.size = tensor.shape[0]
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Collects input tensors submitted by concurrent requests and runs them
+    through the model in a single forward pass.
+
+    A batch is flushed as soon as it holds `max_batch_size` samples or the
+    oldest waiting sample has waited `max_wait_ms`. Inputs with different
+    spatial sizes are grouped by shape inside a batch. When disabled, `run()`
+    calls the model directly on the caller's thread.
+    """
+
+    LOG_EVERY_N_BATCHES = 100
+    _start_lock = threading.Lock()
+
+    def __init__(self, name, model_fn, enabled=False, max_batch_size=8, max_wait_ms=10):
+        self.name = name
+        self.model_fn = model_fn
+        self.enabled = enabled
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self.batch_sizes = Counter()
+        self._pid = None
+        self._thread = None
+        self._cond = None
+        self._pending = []
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    def run(self, tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Run `tensor` (shape [N, C, H, W]) through the model and return the
+        N corresponding output rows.
+        """
+        if not self.enabled:
+            with torch.no_grad():
+                return self.model_fn(tensor)
+        return self.submit(tensor).result()
+
+    def submit(self, tensor: torch.Tensor) -> Future:
+        self._ensure_worker()
+        item = _PendingItem(tensor)
+        with self._cond:
+            self._pending.append(item)
+            self._cond.notify()
+        return item.future
+
+    def stats(self) -> dict:
+        batches = sum(self.batch_sizes.values())
+        samples = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "enabled": self.enabled,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": batches,
+            "samples": samples,
+            "mean_batch_size": round(samples / batches, 2) if batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
+
+    # ----------------------
+    # Worker thread
+    # ----------------------
+    def _ensure_worker(self):
+        # Threads do not survive fork(): a gunicorn worker forked from a
+        # preloaded master starts its own batching thread on first use.
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._cond = threading.Condition()
+            self._pending = []
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._worker, name=f"batcher-{self.name}", daemon=True
+            )
+            self._thread.start()
+
+    def _worker(self):
+        cond = self._cond
+        while True:
+            with cond:
+                while not self._pending:
+                    cond.wait()
+
+                deadline = self._pending[0].enqueued_at + self.max_wait
+                while self._queued_samples() < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    cond.wait(remaining)
+
+                batch = self._take_batch()
+
+            self._run_batch(batch)
+
+    def _queued_samples(self):
+        return sum(item.size for item in self._pending)
+
+    def _take_batch(self):
+        # Always take at least one item, even if it alone exceeds the limit.
+        batch, samples = [], 0
+        while self._pending:
+            item = self._pending[0]
+            if batch and samples + item.size > self.max_batch_size:
+                break
+            batch.append(self._pending.pop(0))
+            samples += item.size
+        return batch
+
+    def _run_batch(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault(tuple(item.tensor.shape[1:]), []).append(item)
+
+        for items in groups.values():
+            try:
+                inputs = torch.cat([item.tensor for item in items], dim=0)
+                with torch.no_grad():
+                    outputs = self.model_fn(inputs)
+                offset = 0
+                for item in items:
+                    item.future.set_result(outputs[offset:offset + item.size])
+                    offset += item.size
+                self._record(inputs.shape[0])
+            except Exception as e:
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+    def _record(self, batch_size):
+        self.batch_sizes[batch_size] += 1
+        batches = sum(self.batch_sizes.values())
+        if batches % self.LOG_EVERY_N_BATCHES == 0:
+            stats = self.stats()
+            print(
+                f"[BATCH] {self.name}: {stats['batches']} batches, "
+                f"mean size {stats['mean_batch_size']}, histogram {stats['batch_size_histogram']}"
+            )
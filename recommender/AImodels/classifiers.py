@@ -0,0 +1,164 @@
+# recommender/AImodels/classifiers.py
+import os
+import torch
+import torch.nn as nn
+from torchvision import models
+
+# Architectures and weight loading for the skin-type, eye-color and acne
+# classifiers. Kept free of import-time side effects so management commands
+# (ONNX export, reports) can build the models without loading ml_model.
+
+# ----------------------
+# 📍 Path Setup
+# ----------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SKIN_TYPE_MODEL_PATH = os.path.join(BASE_DIR, "skin_model.pth")
+EYE_COLOR_MODEL_PATH = os.path.join(BASE_DIR, "eye_color_model.pth")
+ACNE_MODEL_PATH = os.path.join(BASE_DIR, "acne.pth")
+
+# ----------------------
+# 🧠 Model Definitions
+# ----------------------
+class SkinCNN(nn.Module):
+    def __init__(self):
+        super(SkinCNN, self).__init__()
+        self.conv = nn.Sequential(
+            nn.Conv2d(3, 16, 3), nn.ReLU(), nn.MaxPool2d(2),
+            nn.Conv2d(16, 32, 3), nn.ReLU(), nn.MaxPool2d(2)
+        )
+        self.fc = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(32 * 30 * 30, 128), nn.ReLU(),
+            nn.Linear(128, 3)
+        )
+    def forward(self, x):
+        x_conv = self.conv(x)
+        return x_conv, self.fc(x_conv)
+
+class EyeColorResNet(nn.Module):
+    def __init__(self, num_classes=6, pretrained=False):
+        super(EyeColorResNet, self).__init__()
+        # ImageNet weights only matter as a training starting point; for
+        # inference they are overwritten by eye_color_model.pth right away, so
+        # don't download/read them on every worker start.
+        weights = models.ResNet18_Weights.DEFAULT if pretrained else None
+        self.base_model = models.resnet18(weights=weights)
+        self.base_model.fc = nn.Linear(self.base_model.fc.in_features, num_classes)
+    def forward(self, x):
+        return self.base_model(x)
+
+class AcneResNet(nn.Module):
+    def __init__(self, num_classes=5):
+        super(AcneResNet, self).__init__()
+        self.backbone = models.resnet18(weights=None)
+        self.backbone.fc = nn.Linear(self.backbone.fc.in_features, num_classes)
+    def forward(self, x):
+        return self.backbone(x)
+
+# ----------------------
+# 🏷️ Class Labels
+# ----------------------
+skin_type_labels = ['dry', 'normal', 'oily']
+eye_color_labels = ['Amber', 'Blue', 'Brown', 'Green', 'Grey', 'Hazel']
+acne_labels = ['0', '1', '2', '3', 'Clear']
+
+# Input resolution of each model
+TYPE_INPUT_SIZE = 128
+EYE_INPUT_SIZE = 224
+ACNE_INPUT_SIZE = 640
+
+INPUT_SIZES = {
+    "skin_type": TYPE_INPUT_SIZE,
+    "eye_color": EYE_INPUT_SIZE,
+    "acne": ACNE_INPUT_SIZE,
+}
+
+# The acne ResNet ends in adaptive pooling, so it accepts any input size.
+# Smaller rungs trade a little accuracy for a large CPU saving.
+def pick_acne_resolution(height: int, width: int, resolutions) -> int:
+    """
+    Smallest rung that is at least the crop's longer side (no upsampling
+    past the native detail), capped at the largest rung.
+    """
+    rungs = sorted(resolutions)
+    native = max(height, width)
+    for size in rungs:
+        if size >= native:
+            return size
+    return rungs[-1]
+
+# ----------------------
+# ⚙️ Load Models
+# ----------------------
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+MODEL_PATHS = {
+    "skin_type": SKIN_TYPE_MODEL_PATH,
+    "eye_color": EYE_COLOR_MODEL_PATH,
+    "acne": ACNE_MODEL_PATH,
+}
+
+
+class SkinTypeLogits(nn.Module):
+    """SkinCNN returns (features, logits); expose the logits only."""
+    def __init__(self, model):
+        super(SkinTypeLogits, self).__init__()
+        self.model = model
+    def forward(self, x):
+        return self.model(x)[1]
+
+
+def safetensors_path(model_path):
+    """Converted weights (manage.py convert_safetensors) live next to the .pth file."""
+    return os.path.splitext(model_path)[0] + ".safetensors"
+
+
+def load_weights(build, model_path, mmap=True):
+    """
+    Build a model with `build()` and load `model_path`'s weights into it.
+
+    With `mmap` and a converted .safetensors file, the model is built on the
+    meta device (no initial weights allocated) and the parameters are
+    assigned as views of the file mapping: loading is mostly page faults and
+    the pages are shared through the OS page cache by every process using
+    the same file. Otherwise the .pth file is deserialized.
+    """
+    converted = safetensors_path(model_path)
+    if mmap and device.type == "cpu" and os.path.exists(converted):
+        from safetensors.torch import load_file
+        with torch.device("meta"):
+            model = build()
+        model.load_state_dict(load_file(converted), assign=True)
+        model.weights_mmapped = True
+    else:
+        model = build().to(device)
+        model.load_state_dict(torch.load(model_path, map_location=device))
+    return model
+
+
+def load_type_model(mmap=True):
+    return load_weights(SkinCNN, SKIN_TYPE_MODEL_PATH, mmap).eval()
+
+
+def load_eye_model(mmap=True):
+    return load_weights(lambda: EyeColorResNet(num_classes=6), EYE_COLOR_MODEL_PATH, mmap).eval()
+
+
+def load_acne_model(mmap=True):
+    return load_weights(lambda: AcneResNet(num_classes=5), ACNE_MODEL_PATH, mmap).eval()
+
+
+def load_torch_models(mmap=True) -> dict:
+    """{name: eval-mode torch model returning logits}"""
+    return {
+        "skin_type": SkinTypeLogits(load_type_model(mmap)).eval(),
+        "eye_color": load_eye_model(mmap),
+        "acne": load_acne_model(mmap),
+    }
+
+
+CLASS_LABELS = {
+    "skin_type": skin_type_labels,
+    "eye_color": eye_color_labels,
+    "acne": acne_labels,
+}
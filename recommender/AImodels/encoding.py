@@ -0,0 +1,92 @@
+# recommender/AImodels/encoding.py
+import io
+import threading
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from recommender.AImodels.stages import StageExecutor
+
+# ----------------------
+# 🖼️ Response image encoding
+# ----------------------
+# format: "JPEG" or "WEBP"; subsampling: JPEG chroma subsampling ("4:4:4",
+# "4:2:2", "4:2:0"); max_edge: longer side of the encoded image in pixels
+# (0 = crop resolution); method: WebP effort (0 fast .. 6 small).
+EncodingProfile = namedtuple(
+    "EncodingProfile", "format quality subsampling max_edge method", defaults=(None, 0, 4)
+)
+
+ENCODING_PROFILES = {
+    # Pillow's defaults at full crop resolution (what responses always used)
+    "default": EncodingProfile("JPEG", 75, "4:2:0"),
+    "hq": EncodingProfile("JPEG", 90, "4:4:4"),
+    "balanced": EncodingProfile("JPEG", 80, "4:2:0", max_edge=1024),
+    "preview": EncodingProfile("JPEG", 70, "4:2:0", max_edge=512),
+    "webp": EncodingProfile("WEBP", 75, max_edge=1024, method=2),
+    "webp_preview": EncodingProfile("WEBP", 65, max_edge=512, method=2),
+}
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+SUFFIXES = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+# One output buffer per thread, reused across encodes instead of growing a
+# fresh BytesIO for every image
+_buffers = threading.local()
+
+
+def get_profile(profile) -> EncodingProfile:
+    """EncodingProfile from a profile name (or the profile itself)."""
+    return ENCODING_PROFILES[profile] if isinstance(profile, str) else profile
+
+
+def fit_to_edge(image, max_edge):
+    """`image` (PIL) scaled down so its longer side is at most `max_edge`; as-is otherwise."""
+    if not max_edge or max(image.size) <= max_edge:
+        return image
+    scale = max_edge / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def encode_image(image, profile="default") -> bytes:
+    """Encode an RGB ndarray or PIL image with an encoding profile (name or EncodingProfile)."""
+    profile = get_profile(profile)
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    resized = fit_to_edge(image, profile.max_edge)
+
+    options = {"quality": profile.quality}
+    if profile.format == "JPEG" and profile.subsampling:
+        options["subsampling"] = profile.subsampling
+    if profile.format == "WEBP":
+        options["method"] = profile.method
+
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _buffers.buffer = io.BytesIO()
+    buffer.seek(0)
+    try:
+        resized.save(buffer, format=profile.format, **options)
+        size = buffer.tell()
+        with buffer.getbuffer() as view:
+            return bytes(view[:size])
+    finally:
+        if resized is not image:
+            resized.close()
+
+
+# PIL releases the GIL while encoding, so the response images encode in parallel
+encode_stages = StageExecutor(
+    "encode",
+    max_workers=settings.INFERENCE_STAGE_WORKERS if settings.RESPONSE_ENCODE_CONCURRENT else 1,
+)
+
+
+def encode_images(images: dict, profile="default") -> dict:
+    """{name: image} -> {name: encoded bytes}, concurrently unless RESPONSE_ENCODE_CONCURRENT is off."""
+    encoded, _ = encode_stages.run({name: partial(encode_image, image, profile) for name, image in images.items()})
+    return encoded
@@ -1,219 +1,214 @@
-import cv2
 import numpy as np
 from PIL import Image
 import mediapipe as mp
-import gc
+from django.conf import settings
+
+from recommender.AImodels.instance_pool import InstancePool
+from recommender.AImodels.preprocess import to_rgb_array, crop_region, center_brightness, downscale
 
 mp_face_mesh = mp.solutions.face_mesh
 
 # ----------------------
-# Global FaceMesh instance
+# FaceMesh pool
+# ----------------------
+# A FaceMesh graph handles one image at a time, so concurrent request threads
+# each check one out of a bounded pool (FACEMESH_POOL_SIZE graphs, created on
+# first use) instead of serializing on a single global instance.
+def _create_face_mesh():
+    return mp_face_mesh.FaceMesh(
+        static_image_mode=True,
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5
+    )
+
+face_mesh_pool = InstancePool("facemesh", _create_face_mesh, size=settings.FACEMESH_POOL_SIZE)
+
+
+def reset_face_mesh():
+    """
+    Empty the FaceMesh pool after a fork: the graphs' threads exist only in
+    the parent process, so inherited instances must not be used (or closed)
+    in the child.
+    """
+    face_mesh_pool.reset()
+
+# ----------------------
+# 📐 Array-backed landmarks
 # ----------------------
-mp_face_mesh_instance = mp_face_mesh.FaceMesh(
-    static_image_mode=True,
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.5
-)
+# Landmarks are converted once per image into a (478, 3) float32 array of
+# normalized (x, y, z) — cheap to slice, vectorize over and pickle — instead
+# of walking mediapipe's protobuf list point by point.
+NUM_LANDMARKS = 478
+
+# Eye-aspect-ratio points per eye, ordered p1..p6 (corner, top, top, corner, bottom, bottom)
+EAR_INDICES = np.array([
+    [362, 385, 387, 263, 373, 380],
+    [33, 160, 158, 133, 153, 144],
+])
+EAR_THRESHOLD = 0.20
+MAX_TILT_DEGREES = 30
+
+LEFT_EYE_CROP_INDICES = np.array([33, 133, 160, 159, 158, 144, 153, 154, 155, 133])
+RIGHT_EYE_CROP_INDICES = np.array([362, 263, 387, 386, 385, 373, 380, 381, 382, 362])
+
+
+def landmarks_to_array(landmark_list) -> np.ndarray:
+    """mediapipe NormalizedLandmark list -> (N, 3) float32 array of (x, y, z)."""
+    return np.fromiter(
+        (v for lm in landmark_list for v in (lm.x, lm.y, lm.z)),
+        dtype=np.float32,
+        count=3 * len(landmark_list),
+    ).reshape(-1, 3)
+
+
+def landmark_pixels(landmarks: np.ndarray, image_dims, indices=None) -> np.ndarray:
+    """(x, y) pixel coordinates of `landmarks` (optionally only `indices`) for a w×h image."""
+    points = landmarks[:, :2] if indices is None else landmarks[indices, :2]
+    return points * np.asarray(image_dims, dtype=np.float32)
+
+
+def eye_aspect_ratios(landmarks: np.ndarray, image_dims) -> np.ndarray:
+    """EAR of both eyes at once, in EAR_INDICES order."""
+    pts = landmark_pixels(landmarks, image_dims, EAR_INDICES)  # (2, 6, 2)
+    vertical = (np.linalg.norm(pts[:, 1] - pts[:, 5], axis=-1)
+                + np.linalg.norm(pts[:, 2] - pts[:, 4], axis=-1))
+    horizontal = np.linalg.norm(pts[:, 0] - pts[:, 3], axis=-1)
+    return vertical / (2.0 * horizontal)
+
+
+def tilt_degrees(landmarks: np.ndarray, image_dims) -> float:
+    """Angle of the line between the two eye centres."""
+    centers = landmark_pixels(landmarks, image_dims, EAR_INDICES).mean(axis=1)
+    dx, dy = centers[1] - centers[0]
+    return float(np.degrees(np.arctan2(dy, dx)))
+
+
+def _crop_landmarks(image: np.ndarray, landmarks: np.ndarray, image_dims, indices=None, margin=10) -> np.ndarray:
+    pts = landmark_pixels(landmarks, image_dims, indices)
+    return crop_region(image, pts[:, 0], pts[:, 1], margin=margin)
+
 
 # ----------------------
 # Detect and crop face with landmarks caching
 # ----------------------
-def detect_and_crop_face(pil_image: Image.Image):
+def detect_and_crop_face(image, proxy_max_side=None):
     """
     Detect face, check lighting and tilt, and check if eyes are closed.
-    Returns (cropped_face: PIL.Image, left_closed: bool, right_closed: bool, landmarks: list)
+    Accepts an RGB frame (ndarray) or a PIL image.
+    Detection runs on a proxy downscaled to `proxy_max_side` pixels
+    (FACEMESH_PROXY_MAX_SIDE by default, 0 = full resolution); the crops
+    are cut from the full-resolution frame.
+    Returns (cropped_face: ndarray view of the frame, left_closed: bool, right_closed: bool,
+    landmarks: (478, 3) float32 ndarray, (w, h))
     Raises ValueError only if lighting is poor or no face found.
     """
-    image = None
-    gray = None
-    face_region = None
     results = None
-    face_crop = None
-    cropped_face_result = None
+    proxy = None
+    if proxy_max_side is None:
+        proxy_max_side = settings.FACEMESH_PROXY_MAX_SIDE
     
     try:
-        image = np.array(pil_image.convert("RGB"))
+        image = to_rgb_array(image)
         h, w, _ = image.shape
-
-        # Brightness check
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        center_x, center_y = w // 2, h // 2
-        sample_size = 100
-        x1 = max(center_x - sample_size // 2, 0)
-        y1 = max(center_y - sample_size // 2, 0)
-        x2 = min(center_x + sample_size // 2, w)
-        y2 = min(center_y + sample_size // 2, h)
-
-        face_region = gray[y1:y2, x1:x2]
-        brightness = np.mean(face_region)
+        # FaceMesh works on ~192 px inputs internally: detecting on a proxy
+        # avoids pushing full 12 MP frames through the graph
+        proxy = downscale(image, proxy_max_side)
+
+        # Brightness check (centre patch only, no full-frame grayscale copy).
+        # Sampled on the full-resolution frame: 100 px of the proxy would
+        # cover a larger share of the photo and change what the threshold means
+        brightness = center_brightness(image, sample_size=100)
         if brightness < 50:
             raise ValueError("Poor lighting detected. Please use a well-lit photo.")
 
-        results = mp_face_mesh_instance.process(image)
+        with face_mesh_pool.checkout() as face_mesh:
+            results = face_mesh.process(proxy)
 
         if not results.multi_face_landmarks or len(results.multi_face_landmarks) != 1:
             raise ValueError("Please upload a clear photo with exactly one face.")
 
-        landmarks = results.multi_face_landmarks[0].landmark
+        # Normalized landmarks map directly onto the full-resolution frame
+        landmarks = landmarks_to_array(results.multi_face_landmarks[0].landmark)
+        image_dims = (w, h)
 
-        # Eye closed check
-        def is_eye_closed(indices):
-            pts = np.array([(landmarks[i].x * w, landmarks[i].y * h) for i in indices])
-            vertical = np.linalg.norm(pts[1] - pts[5]) + np.linalg.norm(pts[2] - pts[4])
-            horizontal = np.linalg.norm(pts[0] - pts[3])
-            ratio = vertical / (2.0 * horizontal)
-            return ratio < 0.20
-
-        left_eye_indices = [362, 385, 387, 263, 373, 380]
-        right_eye_indices = [33, 160, 158, 133, 153, 144]
-
-        left_closed = is_eye_closed(left_eye_indices)
-        right_closed = is_eye_closed(right_eye_indices)
+        # Eye closed check (both eyes in one pass)
+        left_closed, right_closed = (bool(c) for c in eye_aspect_ratios(landmarks, image_dims) < EAR_THRESHOLD)
 
         # Tilt check — soft warning
-        def get_eye_center(indices):
-            pts = np.array([(landmarks[i].x * w, landmarks[i].y * h) for i in indices])
-            return np.mean(pts, axis=0)
-
-        left_center = get_eye_center(left_eye_indices)
-        right_center = get_eye_center(right_eye_indices)
-
-        dx = right_center[0] - left_center[0]
-        dy = right_center[1] - left_center[1]
-        angle = np.degrees(np.arctan2(dy, dx))
-        if abs(angle) > 30:
+        angle = tilt_degrees(landmarks, image_dims)
+        if abs(angle) > MAX_TILT_DEGREES:
             print(f"[WARN] Face tilt angle too high: {angle:.1f} degrees")
 
-        # Crop face tightly
-        xs = [int(lm.x * w) for lm in landmarks]
-        ys = [int(lm.y * h) for lm in landmarks]
-        x_min, x_max = max(min(xs) - 20, 0), min(max(xs) + 20, w)
-        y_min, y_max = max(min(ys) - 20, 0), min(max(ys) + 20, h)
-
-        face_crop = image[y_min:y_max, x_min:x_max]
-        cropped_face_result = Image.fromarray(face_crop)
+        # Crop face tightly (a view into the frame, no copy)
+        face_crop = _crop_landmarks(image, landmarks, image_dims, margin=20)
         
-        return cropped_face_result, left_closed, right_closed, landmarks, (w, h)
+        return face_crop, left_closed, right_closed, landmarks, image_dims
         
     finally:
         # Clean up all intermediate objects
-        if image is not None:
-            del image
-        if gray is not None:
-            del gray
-        if face_region is not None:
-            del face_region
-        if face_crop is not None:
-            del face_crop
         if results is not None:
             del results
-            
-        # Force garbage collection
-        gc.collect()
+        if proxy is not None:
+            del proxy
 
 
 # ----------------------
 # Crop eye from cached landmarks - optimized version
 # ----------------------
-def _crop_eye_from_landmarks(pil_image: Image.Image, eye_indices: list, landmarks, image_dims) -> Image.Image:
+def _crop_eye_from_landmarks(image, eye_indices, landmarks: np.ndarray, image_dims) -> np.ndarray:
     """
-    Crop eye using pre-computed landmarks to avoid reprocessing.
+    Crop eye using pre-computed landmarks (the array from detect_and_crop_face)
+    to avoid reprocessing. Returns a view into the frame.
     """
-    image = None
-    eye_crop = None
-    eye_result = None
-    
-    try:
-        image = np.array(pil_image.convert("RGB"))
-        h, w = image_dims
-        
-        eye_points = [(int(landmarks[i].x * w), int(landmarks[i].y * h)) for i in eye_indices]
-        xs, ys = zip(*eye_points)
-        x_min, x_max = max(min(xs) - 10, 0), min(max(xs) + 10, w)
-        y_min, y_max = max(min(ys) - 10, 0), min(max(ys) + 10, h)
-        eye_crop = image[y_min:y_max, x_min:x_max]
-        eye_result = Image.fromarray(eye_crop)
-        
-        return eye_result
-        
-    finally:
-        # Clean up all intermediate objects
-        if image is not None:
-            del image
-        if eye_crop is not None:
-            del eye_crop
-            
-        # Force garbage collection
-        gc.collect()
+    return _crop_landmarks(to_rgb_array(image), landmarks, image_dims, eye_indices, margin=10)
 
 
 # ----------------------
 # Crop eye from landmarks (legacy version for backward compatibility)
 # ----------------------
-def _crop_eye(pil_image: Image.Image, eye_indices: list) -> Image.Image:
-    image = None
+def _crop_eye(pil_image: Image.Image, eye_indices) -> Image.Image:
     results = None
-    eye_crop = None
     
     try:
-        image = np.array(pil_image.convert("RGB"))
+        image = to_rgb_array(pil_image)
         h, w, _ = image.shape
-        results = mp_face_mesh_instance.process(image)
+        with face_mesh_pool.checkout() as face_mesh:
+            results = face_mesh.process(downscale(image, settings.FACEMESH_PROXY_MAX_SIDE))
 
         if not results.multi_face_landmarks or len(results.multi_face_landmarks) != 1:
             raise ValueError("Please upload a clear photo with exactly one face.")
 
-        landmarks = results.multi_face_landmarks[0].landmark
-        eye_points = [(int(landmarks[i].x * w), int(landmarks[i].y * h)) for i in eye_indices]
-        xs, ys = zip(*eye_points)
-        x_min, x_max = max(min(xs) - 10, 0), min(max(xs) + 10, w)
-        y_min, y_max = max(min(ys) - 10, 0), min(max(ys) + 10, h)
-        eye_crop = image[y_min:y_max, x_min:x_max]
-        eye_result = Image.fromarray(eye_crop)
+        landmarks = landmarks_to_array(results.multi_face_landmarks[0].landmark)
+        eye_result = Image.fromarray(_crop_landmarks(image, landmarks, (w, h), eye_indices, margin=10))
         
         return eye_result
         
     finally:
         # Clean up all intermediate objects
-        if image is not None:
-            del image
-        if eye_crop is not None:
-            del eye_crop
         if results is not None:
             del results
-            
-        # Force garbage collection
-        gc.collect()
 
 
 # ----------------------
 # Public crop eye functions - optimized versions
 # ----------------------
-def crop_left_eye_from_landmarks(pil_image: Image.Image, landmarks, image_dims) -> Image.Image:
+def crop_left_eye_from_landmarks(image, landmarks, image_dims) -> np.ndarray:
     """Optimized version that reuses landmarks."""
-    return _crop_eye_from_landmarks(pil_image, [
-        33, 133, 160, 159, 158, 144, 153, 154, 155, 133
-    ], landmarks, image_dims)
+    return _crop_eye_from_landmarks(image, LEFT_EYE_CROP_INDICES, landmarks, image_dims)
 
 
-def crop_right_eye_from_landmarks(pil_image: Image.Image, landmarks, image_dims) -> Image.Image:
+def crop_right_eye_from_landmarks(image, landmarks, image_dims) -> np.ndarray:
     """Optimized version that reuses landmarks."""
-    return _crop_eye_from_landmarks(pil_image, [
-        362, 263, 387, 386, 385, 373, 380, 381, 382, 362
-    ], landmarks, image_dims)
+    return _crop_eye_from_landmarks(image, RIGHT_EYE_CROP_INDICES, landmarks, image_dims)
 
 
 # ----------------------
 # Public crop eye functions - legacy versions for backward compatibility
 # ----------------------
 def crop_left_eye(pil_image: Image.Image) -> Image.Image:
-    return _crop_eye(pil_image, eye_indices=[
-        33, 133, 160, 159, 158, 144, 153, 154, 155, 133
-    ])
+    return _crop_eye(pil_image, eye_indices=LEFT_EYE_CROP_INDICES)
 
 
 def crop_right_eye(pil_image: Image.Image) -> Image.Image:
-    return _crop_eye(pil_image, eye_indices=[
-        362, 263, 387, 386, 385, 373, 380, 381, 382, 362
-    ])
+    return _crop_eye(pil_image, eye_indices=RIGHT_EYE_CROP_INDICES)
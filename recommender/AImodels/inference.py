@@ -0,0 +1,140 @@
+# recommender/AImodels/inference.py
+import threading
+
+from django.conf import settings
+
+from recommender.AImodels.annotate import OVERLAY_MODES
+from recommender.AImodels.artifacts import artifact_store
+from recommender.AImodels.encoding import ENCODING_PROFILES
+from recommender.AImodels.inference_pool import InferencePoolClient, InferenceUnavailable  # noqa: F401
+from recommender.AImodels.offload import inference_offloader
+from recommender.AImodels.response import build_analysis_payload, format_predictions, payload_sections
+from recommender.AImodels.result_cache import analysis_cache
+
+# ----------------------
+# 🔀 Where analyses run
+# ----------------------
+# With INFERENCE_POOL_ENABLED the views hand frames to the inference pool
+# (`manage.py run_inference_pool`) and this process never loads the models.
+# Otherwise everything runs in-process, as before.
+
+POOL_ENABLED = settings.INFERENCE_POOL_ENABLED
+
+if POOL_ENABLED:
+    pool_client = InferencePoolClient(
+        settings.INFERENCE_POOL_SOCKET,
+        authkey=settings.SECRET_KEY.encode(),
+        timeout=settings.INFERENCE_POOL_TIMEOUT,
+    )
+
+    def analyze(frame, overlay="image") -> dict:
+        """Full analysis of an RGB frame (see pipeline.run_analysis)."""
+        return pool_client.analyze(frame, overlay=overlay)
+
+else:
+    from recommender.AImodels.pipeline import run_analysis as analyze  # noqa: F401
+
+
+# "inline": response images as base64 data URLs (older plugin versions)
+# "url": signed, expiring artifact URLs (see artifacts.py)
+IMAGE_MODES = ("inline", "url")
+
+
+def response_options(params) -> dict:
+    """
+    analyze_payload() options requested by a client (`overlay`, `images`,
+    `encoding` request parameters, defaulting to the RESPONSE_* settings).
+    Raises ValueError for unknown values.
+    """
+    options = {
+        "overlay": params.get("overlay") or settings.RESPONSE_OVERLAY_MODE,
+        "images": params.get("images") or settings.RESPONSE_IMAGE_MODE,
+        "encoding": params.get("encoding") or settings.RESPONSE_ENCODING_PROFILE,
+    }
+    for name, choices in (("overlay", OVERLAY_MODES), ("images", IMAGE_MODES), ("encoding", ENCODING_PROFILES)):
+        if options[name] not in choices:
+            raise ValueError(f"Unknown {name} {options[name]!r}, expected one of {', '.join(choices)}.")
+    return options
+
+
+def analyze_payload(frame, overlay="image", images="inline", encoding="default"):
+    """
+    Response payload for a decoded frame (see response.build_analysis_payload),
+    served from the result cache when the same photo was analyzed recently.
+    `overlay` is "image" (rendered overlays as JPEGs) or "vector" (boxes and
+    mask polygons only, see annotate.OVERLAY_MODES); `images` is one of
+    IMAGE_MODES and `encoding` a name from encoding.ENCODING_PROFILES.
+    Returns (payload, "hit" | "miss" | "coalesced"); the payload is shared with
+    the cache and must not be modified.
+    """
+    return analysis_cache.get_or_compute(
+        analysis_cache.key(frame, overlay, images, encoding),
+        lambda: build_analysis_payload(analyze(frame, overlay=overlay), images=images, encoding=encoding),
+    )
+
+
+def analyze_payload_streaming(frame, on_section, overlay="image", images="inline", encoding="default"):
+    """
+    analyze_payload() that also hands the payload out section by section
+    (response.PAYLOAD_SECTIONS) through `on_section(name, fields)` as soon
+    as each is known: the classifier results while YOLO is still running,
+    the images last. `on_section` is called from the stage threads. Results
+    from the inference pool or the result cache arrive all at once.
+    """
+    sent = set()
+    sent_lock = threading.Lock()
+
+    def report(fields):
+        for name, section in payload_sections(fields):
+            with sent_lock:
+                if name in sent:
+                    continue
+                sent.add(name)
+            on_section(name, section)
+
+    def compute():
+        if POOL_ENABLED:
+            preds = analyze(frame, overlay=overlay)
+        else:
+            preds = analyze(
+                frame, overlay=overlay,
+                on_stage=lambda fields: report(format_predictions(fields, partial=True)),
+            )
+        return build_analysis_payload(preds, images=images, encoding=encoding)
+
+    payload, status = analysis_cache.get_or_compute(analysis_cache.key(frame, overlay, images, encoding), compute)
+    if "error" not in payload:
+        # Whatever wasn't streamed yet: the images, or everything on a cache hit
+        report(payload)
+    return payload, status
+
+
+async def analyze_payload_async(frame, overlay="image", images="inline", encoding="default"):
+    """analyze_payload() for async views, run on the bounded offload executor."""
+    return await inference_offloader.run(analyze_payload, frame, overlay=overlay, images=images, encoding=encoding)
+
+
+def inference_stats() -> dict:
+    from recommender.AImodels.encoding import encode_stages
+
+    if POOL_ENABLED:
+        return {
+            "pool": pool_client.stats(),
+            "encoding": encode_stages.stats(),
+            "result_cache": analysis_cache.stats(),
+            "artifacts": artifact_store.stats(),
+            "offload": inference_offloader.stats(),
+        }
+
+    from recommender.AImodels.facemesh_model import face_mesh_pool
+    from recommender.AImodels.ml_model import batching_stats
+    from recommender.AImodels.pipeline import analysis_stages
+    return {
+        "facemesh": face_mesh_pool.stats(),
+        "batching": batching_stats(),
+        "stages": analysis_stages.stats(),
+        "encoding": encode_stages.stats(),
+        "result_cache": analysis_cache.stats(),
+        "artifacts": artifact_store.stats(),
+        "offload": inference_offloader.stats(),
+    }
@@ -0,0 +1,184 @@
+# recommender/AImodels/inference_pool.py
+import multiprocessing as mp
+import os
+import signal
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+# ----------------------
+# 🏭 Dedicated inference worker pool
+# ----------------------
+# `manage.py run_inference_pool` starts a fixed number of inference processes
+# that own the models. They share one Unix socket listener, so the kernel
+# hands each connection to whichever process is idle.
+#
+# For every analysis, a Django worker copies the decoded frame into a
+# multiprocessing.shared_memory block and sends only its name, shape and dtype
+# over the socket. The inference process maps the block (no pickling of
+# pixels) and sends back the analysis result. Django workers then never load
+# the models and are not holding five models each.
+
+
+class InferenceUnavailable(Exception):
+    """The pool did not answer (not running, crashed or timed out)."""
+
+
+def _attach(name):
+    shm = SharedMemory(name=name)
+    # The client owns the block; don't let this process' resource tracker
+    # unlink it (or warn about a leak) when the worker exits.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# ----------------------
+# Server side
+# ----------------------
+def _worker_main(listener, threads):
+    import torch
+    torch.set_num_threads(threads)
+
+    # Import (and load the models) only in the child processes
+    from recommender.AImodels.pipeline import run_analysis
+    from recommender.AImodels.memory import memory_governor
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    print(f"[POOL] worker {os.getpid()} ready ({threads} torch threads)")
+
+    while not memory_governor.recycle_requested:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            print(f"[POOL] worker {os.getpid()} rejected connection: {e}")
+            continue
+
+        with conn:
+            try:
+                request = conn.recv()
+            except EOFError:
+                continue
+
+            shm = None
+            frame = None
+            try:
+                shm = _attach(request["shm"])
+                frame = np.ndarray(request["shape"], dtype=request["dtype"], buffer=shm.buf)
+                frame.flags.writeable = False
+                result = run_analysis(frame, overlay=request.get("overlay", "image"))
+            except Exception as e:
+                result = {"exception": f"{type(e).__name__}: {e}"}
+            finally:
+                del frame
+                if shm is not None:
+                    shm.close()
+
+            try:
+                conn.send(result)
+            except (BrokenPipeError, ConnectionResetError):
+                print("[POOL] client went away before the result was sent (timeout?)")
+
+        memory_governor.after_request()
+
+    # Leaving the loop lets the supervisor start a fresh process
+    print(f"[POOL] worker {os.getpid()} recycling")
+
+
+def serve(address, authkey, workers=2, threads=1):
+    """Run the pool in the foreground until SIGTERM/SIGINT."""
+    if os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    ctx = mp.get_context("fork")
+
+    def start():
+        process = ctx.Process(target=_worker_main, args=(listener, threads), daemon=True)
+        process.start()
+        return process
+
+    processes = [start() for _ in range(workers)]
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping:
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    print(f"[POOL] worker {process.pid} exited ({process.exitcode}), starting a new one")
+                    processes[i] = start()
+            time.sleep(0.5)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+        listener.close()
+        if os.path.exists(address):
+            os.unlink(address)
+
+
+# ----------------------
+# Client side (Django workers)
+# ----------------------
+class InferencePoolClient:
+    def __init__(self, address, authkey, timeout=30.0):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+
+    def analyze(self, frame: np.ndarray, overlay="image") -> dict:
+        self.requests += 1
+        started = time.perf_counter()
+
+        shm = SharedMemory(create=True, size=frame.nbytes)
+        try:
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)[...] = frame
+            try:
+                conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                self.failures += 1
+                raise InferenceUnavailable(f"Inference pool is not running ({e})")
+
+            with conn:
+                conn.send({"shm": shm.name, "shape": frame.shape, "dtype": frame.dtype.str, "overlay": overlay})
+                if not conn.poll(self.timeout):
+                    self.timeouts += 1
+                    raise InferenceUnavailable("Inference pool timed out")
+                try:
+                    result = conn.recv()
+                except EOFError:
+                    self.failures += 1
+                    raise InferenceUnavailable("Inference worker exited during the analysis")
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if "exception" in result:
+            self.failures += 1
+            raise RuntimeError(result["exception"])
+        self.total_seconds += time.perf_counter() - started
+        return result
+
+    def stats(self) -> dict:
+        completed = self.requests - self.failures - self.timeouts
+        return {
+            "address": self.address,
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "mean_ms": round(self.total_seconds / completed * 1000, 1) if completed > 0 else 0.0,
+        }
@@ -0,0 +1,112 @@
+# recommender/AImodels/instance_pool.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# ----------------------
+# 🏊 Bounded pool of non-thread-safe instances
+# ----------------------
+class InstancePool:
+    """
+    Up to `size` instances made by `factory` (e.g. mediapipe FaceMesh graphs,
+    which must not be used by two threads at once), created lazily on first
+    demand. `checkout()` hands one instance to the calling thread; when all
+    are in use the caller waits for one to be returned, and the wait is
+    recorded in `stats()`.
+
+    Instances don't survive fork: a pool used in a new process starts empty
+    (the inherited instances are dropped, not closed).
+    """
+
+    def __init__(self, name, factory, size=1):
+        self.name = name
+        self.factory = factory
+        self.size = max(1, int(size))
+
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.peak_in_use = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    @contextmanager
+    def checkout(self):
+        instance = self._acquire()
+        try:
+            yield instance
+        finally:
+            self._release(instance)
+
+    def reset(self):
+        """Forget every instance (call in a freshly forked child)."""
+        with self._cond:
+            self._pid = os.getpid()
+            self._idle = []
+            self._created = 0
+            self._in_use = 0
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "created": self._created,
+            "in_use": self._in_use,
+            "peak_in_use": self.peak_in_use,
+            "checkouts": self.checkouts,
+            # checkouts that found every instance busy
+            "waits": self.waits,
+            "mean_wait_ms": round(self.wait_seconds / self.waits * 1000.0, 2) if self.waits else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000.0, 2),
+        }
+
+    # ----------------------
+    # Internals
+    # ----------------------
+    def _acquire(self):
+        if self._pid != os.getpid():
+            self.reset()
+
+        with self._cond:
+            self.checkouts += 1
+            if not self._idle and self._created >= self.size:
+                started = time.monotonic()
+                while not self._idle and self._created >= self.size:
+                    self._cond.wait()
+                waited = time.monotonic() - started
+                self.waits += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+            self._in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self._in_use)
+            if self._idle:
+                return self._idle.pop()
+            # Reserve the slot, build the instance outside the lock
+            self._created += 1
+
+        try:
+            return self.factory()
+        except BaseException:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, instance):
+        with self._cond:
+            if self._pid != os.getpid():
+                # Checked out before a fork (reset since): don't mix it in
+                return
+            self._in_use -= 1
+            self._idle.append(instance)
+            self._cond.notify()
@@ -0,0 +1,139 @@
+# recommender/AImodels/memory.py
+import gc
+import os
+import signal
+import sys
+import time
+
+import psutil
+import torch
+from django.conf import settings
+
+# ----------------------
+# 🧹 Memory governor
+# ----------------------
+# Full collections over a heap holding torch, mediapipe and ultralytics objects
+# cost tens of ms, so they no longer run inside every inference function.
+# Instead the views report each finished request here and the configured
+# policy decides when to collect:
+#   "off"      never collect explicitly
+#   "every_n"  collect after every INFERENCE_GC_EVERY_N requests
+#   "rss"      collect when RSS exceeds INFERENCE_GC_RSS_THRESHOLD_MB
+# Independently, WORKER_RECYCLE_RSS_MB asks the gunicorn worker to exit
+# gracefully after the in-flight request once RSS stays above the watermark.
+
+MB = 1024 * 1024
+GC_POLICIES = ("off", "every_n", "rss")
+
+# Minimum RSS growth since the last collection before "rss" collects again,
+# so a heap that simply stays large is not collected on every request.
+RSS_REGROWTH_BYTES = 32 * MB
+
+
+def current_rss() -> int:
+    return psutil.Process().memory_info().rss
+
+
+def freeze_after_load():
+    """
+    Move everything allocated so far (models, graphs, modules) into the
+    permanent generation so later collections never traverse it.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+class MemoryGovernor:
+    def __init__(self, policy="every_n", every_n=20, rss_threshold_mb=1500, recycle_rss_mb=0):
+        if policy not in GC_POLICIES:
+            raise ValueError(f"Unknown GC policy {policy!r}, expected one of {GC_POLICIES}")
+        self.policy = policy
+        self.every_n = max(1, int(every_n))
+        self.rss_threshold = int(rss_threshold_mb) * MB
+        self.recycle_rss = int(recycle_rss_mb) * MB
+
+        self.requests = 0
+        self.collections = 0
+        self.objects_reclaimed = 0
+        self.bytes_reclaimed = 0
+        self.collect_seconds = 0.0
+        self.recycle_requested = False
+        self._requests_since_collect = 0
+        self._rss_after_collect = 0
+
+    def after_request(self):
+        """Called by the analysis views once a request is done with the models."""
+        self.requests += 1
+        self._requests_since_collect += 1
+
+        rss = None
+        if self.policy == "every_n" and self._requests_since_collect >= self.every_n:
+            rss = self.collect("every_n")
+        elif self.policy == "rss":
+            rss = current_rss()
+            if rss > self.rss_threshold and rss > self._rss_after_collect + RSS_REGROWTH_BYTES:
+                rss = self.collect("rss")
+
+        if self.recycle_rss:
+            rss = rss if rss is not None else current_rss()
+            if rss > self.recycle_rss:
+                self.request_recycle(rss)
+
+    def collect(self, reason: str) -> int:
+        """Run a full collection, log what it reclaimed and return the new RSS."""
+        rss_before = current_rss()
+        started = time.perf_counter()
+        objects = gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        elapsed = time.perf_counter() - started
+        rss_after = current_rss()
+
+        self.collections += 1
+        self.objects_reclaimed += objects
+        self.bytes_reclaimed += max(rss_before - rss_after, 0)
+        self.collect_seconds += elapsed
+        self._requests_since_collect = 0
+        self._rss_after_collect = rss_after
+
+        print(
+            f"[GC] collection #{self.collections} ({reason}) after {self.requests} requests: "
+            f"{objects} objects, RSS {rss_before / MB:.1f} -> {rss_after / MB:.1f} MB "
+            f"in {elapsed * 1000:.1f} ms"
+        )
+        return rss_after
+
+    def request_recycle(self, rss: int):
+        """
+        Ask gunicorn to replace this worker. SIGTERM makes a gunicorn worker
+        finish the request it is serving and then exit; the arbiter forks a
+        fresh one. Outside gunicorn (runserver, management commands) we only warn.
+        """
+        if self.recycle_requested:
+            return
+        self.recycle_requested = True
+        if "gunicorn" not in sys.modules:
+            print(f"[GC] RSS {rss / MB:.1f} MB above recycle watermark (not running under gunicorn)")
+            return
+        print(f"[GC] RSS {rss / MB:.1f} MB above recycle watermark, recycling worker {os.getpid()}")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "requests": self.requests,
+            "collections": self.collections,
+            "objects_reclaimed": self.objects_reclaimed,
+            "mb_reclaimed": round(self.bytes_reclaimed / MB, 1),
+            "collect_ms_total": round(self.collect_seconds * 1000, 1),
+            "rss_mb": round(current_rss() / MB, 1),
+            "recycle_requested": self.recycle_requested,
+        }
+
+
+memory_governor = MemoryGovernor(
+    policy=settings.INFERENCE_GC_POLICY,
+    every_n=settings.INFERENCE_GC_EVERY_N,
+    rss_threshold_mb=settings.INFERENCE_GC_RSS_THRESHOLD_MB,
+    recycle_rss_mb=settings.WORKER_RECYCLE_RSS_MB,
+)
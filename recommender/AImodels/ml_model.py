@@ -1,114 +1,100 @@
 # recommender/AImodels/ml_model.py
-import os
 import torch
-import torch.nn as nn
 import torch.nn.functional as F
-from torchvision import models, transforms
-from PIL import Image
-import gc
-
+from django.conf import settings
+
+from recommender.AImodels.classifiers import (  # model classes re-exported for existing imports
+    SkinCNN, EyeColorResNet, AcneResNet, MODEL_PATHS, device, load_torch_models,
+    TYPE_INPUT_SIZE, EYE_INPUT_SIZE, ACNE_INPUT_SIZE, pick_acne_resolution,
+    skin_type_labels, eye_color_labels, acne_labels,
+)
+from recommender.AImodels.batching import MicroBatcher
+from recommender.AImodels.memory import freeze_after_load
+from recommender.AImodels.precision import apply_precision_modes
+from recommender.AImodels.preprocess import to_rgb_array, to_input_tensor
 from recommender.AImodels.facemesh_model import detect_and_crop_face, crop_left_eye_from_landmarks, crop_right_eye_from_landmarks
 
 # ----------------------
-# 📍 Path Setup
+# 🔁 Image Transforms
 # ----------------------
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-SKIN_TYPE_MODEL_PATH = os.path.join(BASE_DIR, "skin_model.pth")
-EYE_COLOR_MODEL_PATH = os.path.join(BASE_DIR, "eye_color_model.pth")
-ACNE_MODEL_PATH = os.path.join(BASE_DIR, "acne.pth")
+# Resize + scaling + normalization run as tensor ops (see preprocess.py)
+def transform_type(rgb):
+    return to_input_tensor(rgb, TYPE_INPUT_SIZE, normalize=False)
 
-# ----------------------
-# 🧠 Model Definitions
-# ----------------------
-class SkinCNN(nn.Module):
-    def __init__(self):
-        super(SkinCNN, self).__init__()
-        self.conv = nn.Sequential(
-            nn.Conv2d(3, 16, 3), nn.ReLU(), nn.MaxPool2d(2),
-            nn.Conv2d(16, 32, 3), nn.ReLU(), nn.MaxPool2d(2)
-        )
-        self.fc = nn.Sequential(
-            nn.Flatten(),
-            nn.Linear(32 * 30 * 30, 128), nn.ReLU(),
-            nn.Linear(128, 3)
-        )
-    def forward(self, x):
-        x_conv = self.conv(x)
-        return x_conv, self.fc(x_conv)
-
-class EyeColorResNet(nn.Module):
-    def __init__(self, num_classes=6):
-        super(EyeColorResNet, self).__init__()
-        self.base_model = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
-        self.base_model.fc = nn.Linear(self.base_model.fc.in_features, num_classes)
-    def forward(self, x):
-        return self.base_model(x)
-
-class AcneResNet(nn.Module):
-    def __init__(self, num_classes=5):
-        super(AcneResNet, self).__init__()
-        self.backbone = models.resnet18(weights=None)
-        self.backbone.fc = nn.Linear(self.backbone.fc.in_features, num_classes)
-    def forward(self, x):
-        return self.backbone(x)
 
-# ----------------------
-# 🔁 Image Transforms
-# ----------------------
-transform_type = transforms.Compose([
-    transforms.Resize((128, 128)),
-    transforms.ToTensor(),
-])
-
-transform_eye = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
-
-transform_acne = transforms.Compose([
-    transforms.Resize((640, 640)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+def transform_eye(rgb):
+    return to_input_tensor(rgb, EYE_INPUT_SIZE)
+
+
+# Acne input size: "fixed" always uses ACNE_INPUT_SIZE, "adaptive" picks a
+# rung of ACNE_RESOLUTIONS from the face crop's native size.
+ACNE_RESOLUTION_POLICY = settings.ACNE_RESOLUTION_POLICY
+ACNE_RESOLUTIONS = sorted(settings.ACNE_RESOLUTIONS)
 
-# ----------------------
-# ⚙️ Load Models
-# ----------------------
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-type_model = SkinCNN().to(device)
-type_model.load_state_dict(torch.load(SKIN_TYPE_MODEL_PATH, map_location=device))
-type_model.eval()
+def acne_input_size(rgb) -> int:
+    if ACNE_RESOLUTION_POLICY == "adaptive":
+        return pick_acne_resolution(rgb.shape[0], rgb.shape[1], ACNE_RESOLUTIONS)
+    return ACNE_INPUT_SIZE
 
-eye_model = EyeColorResNet(num_classes=6).to(device)
-eye_model.load_state_dict(torch.load(EYE_COLOR_MODEL_PATH, map_location=device))
-eye_model.eval()
 
-acne_model = AcneResNet(num_classes=5).to(device)
-acne_model.load_state_dict(torch.load(ACNE_MODEL_PATH, map_location=device))
-acne_model.eval()
+def transform_acne(rgb, size=None):
+    return to_input_tensor(rgb, size or acne_input_size(rgb))
 
 # ----------------------
-# 🏷️ Class Labels
+# ⚙️ Load Models
+# ----------------------
+# Backend used by predict()/predict_acne(): "torch" (eager PyTorch) or "onnx"
+INFERENCE_BACKEND = settings.INFERENCE_BACKEND
+
+if INFERENCE_BACKEND == "onnx":
+    from recommender.AImodels.onnx_backend import load_onnx_models
+    if settings.INFERENCE_PRECISION != "fp32":
+        print(f"[WARN] INFERENCE_PRECISION={settings.INFERENCE_PRECISION} only applies to the torch backend")
+    _models = load_onnx_models(MODEL_PATHS)
+elif INFERENCE_BACKEND == "torch":
+    _models = apply_precision_modes(load_torch_models(mmap=settings.INFERENCE_WEIGHTS_MMAP), settings.INFERENCE_PRECISION)
+else:
+    raise ValueError(f"Unknown INFERENCE_BACKEND {INFERENCE_BACKEND!r}, expected 'torch' or 'onnx'")
+
+type_model = _models["skin_type"]
+eye_model = _models["eye_color"]
+acne_model = _models["acne"]
+
+# Models (and the FaceMesh graph) are long-lived: keep them out of GC scans
+freeze_after_load()
+
 # ----------------------
-skin_type_labels = ['dry', 'normal', 'oily']
-eye_color_labels = ['Amber', 'Blue', 'Brown', 'Green', 'Grey', 'Hazel']
-acne_labels = ['0', '1', '2', '3', 'Clear']
+# 📦 Micro-batchers (one per model, shared by all request threads)
+# ----------------------
+_batching_options = {
+    "enabled": settings.INFERENCE_BATCHING_ENABLED,
+    "max_batch_size": settings.INFERENCE_BATCH_MAX_SIZE,
+    "max_wait_ms": settings.INFERENCE_BATCH_MAX_WAIT_MS,
+}
+type_batcher = MicroBatcher("skin_type", type_model, **_batching_options)
+eye_batcher = MicroBatcher("eye_color", eye_model, **_batching_options)
+acne_batcher = MicroBatcher("acne", acne_model, **_batching_options)
+
+
+def batching_stats() -> dict:
+    """Achieved batch sizes per model, for tuning throughput vs. latency."""
+    return {b.name: b.stats() for b in (type_batcher, eye_batcher, acne_batcher)}
 
 # ----------------------
 # 🔮 Prediction Functions
 # ----------------------
-def predict_acne(image: Image.Image) -> dict:
+def predict_acne(image) -> dict:
     input_tensor = None
     outputs = None
     probs = None
     
     try:
-        image = image.convert("RGB")
-        input_tensor = transform_acne(image).unsqueeze(0).to(device)
+        image = to_rgb_array(image)
+        input_size = acne_input_size(image)
+        input_tensor = transform_acne(image, input_size).to(device)
+        outputs = acne_batcher.run(input_tensor)
         with torch.no_grad():
-            outputs = acne_model(input_tensor)
             probs = torch.softmax(outputs, dim=1).cpu().numpy()[0]
             pred_idx = probs.argmax()
             confidence = probs[pred_idx]
@@ -116,7 +102,8 @@ def predict_acne(image: Image.Image) -> dict:
         result = {
             "acne_pred": acne_labels[pred_idx],
             "acne_probs": probs.tolist(),
-            "acne_confidence": float(confidence)
+            "acne_confidence": float(confidence),
+            "acne_input_size": input_size,
         }
         
         return result
@@ -129,105 +116,93 @@ def predict_acne(image: Image.Image) -> dict:
             del outputs
         if probs is not None:
             del probs
-            
-        # Clear CUDA cache if using GPU
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            
-        # Force garbage collection
-        gc.collect()
-
-def predict(image: Image.Image) -> dict:
-    face_image = None
-    left_eye = None
-    right_eye = None
+
+def locate_face(image) -> dict:
+    """
+    Face detection stage: the face crop and open-eye crops as views of the
+    RGB frame, or {"error": message} when the photo is unusable.
+    """
+    image = to_rgb_array(image)
+    try:
+        face_image, left_closed, right_closed, landmarks, image_dims = detect_and_crop_face(image)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    return {
+        "face": face_image,
+        "left_eye": None if left_closed else crop_left_eye_from_landmarks(image, landmarks, image_dims),
+        "right_eye": None if right_closed else crop_right_eye_from_landmarks(image, landmarks, image_dims),
+    }
+
+
+def predict_skin_type(face_image) -> dict:
     input_type = None
-    input_left_eye = None
-    input_right_eye = None
     type_out = None
-    left_eye_out = None
-    right_eye_out = None
-    landmarks = None
-    image_dims = None
-    
+
     try:
-        image = image.convert("RGB")
-        try:
-            face_image, left_closed, right_closed, landmarks, image_dims = detect_and_crop_face(image)
-            
-            if not left_closed:
-                left_eye = crop_left_eye_from_landmarks(image, landmarks, image_dims)
-            if not right_closed:
-                right_eye = crop_right_eye_from_landmarks(image, landmarks, image_dims)
-                
-        except ValueError as e:
-            return {"error": str(e)}
-
-        # Skin type
-        input_type = transform_type(face_image).unsqueeze(0).to(device)
+        input_type = transform_type(face_image).to(device)
+        type_out = type_batcher.run(input_type)
         with torch.no_grad():
-            type_out = type_model(input_type)[1]
             type_probs = F.softmax(type_out, dim=1).cpu().numpy()[0]
-            type_pred = skin_type_labels[int(type_probs.argmax())]
-
-        # Eye color
-        if left_closed:
-            left_eye_color = "Eyes Closed"
-        else:
-            input_left_eye = transform_eye(left_eye).unsqueeze(0).to(device)
-            with torch.no_grad():
-                left_eye_out = torch.sigmoid(eye_model(input_left_eye)).cpu().numpy()[0]
-            left_eye_dict = dict(zip(eye_color_labels, [float(p) for p in left_eye_out]))
-            left_eye_color = max(left_eye_dict, key=left_eye_dict.get)
-            left_eye.close()
-
-        if right_closed:
-            right_eye_color = "Eyes Closed"
-        else:
-            input_right_eye = transform_eye(right_eye).unsqueeze(0).to(device)
-            with torch.no_grad():
-                right_eye_out = torch.sigmoid(eye_model(input_right_eye)).cpu().numpy()[0]
-            right_eye_dict = dict(zip(eye_color_labels, [float(p) for p in right_eye_out]))
-            right_eye_color = max(right_eye_dict, key=right_eye_dict.get)
-            right_eye.close()
-
-        acne_result = predict_acne(face_image)
 
         return {
-            "type_pred": type_pred,
+            "type_pred": skin_type_labels[int(type_probs.argmax())],
             "type_probs": type_probs.tolist(),
-            "left_eye_color": left_eye_color,
-            "right_eye_color": right_eye_color,
-            "cropped_face": face_image,  # Note: caller should close this
-            **acne_result,
         }
-        
+
     finally:
-        # Clean up all tensors and intermediate objects
         if input_type is not None:
             del input_type
-        if input_left_eye is not None:
-            del input_left_eye
-        if input_right_eye is not None:
-            del input_right_eye
         if type_out is not None:
             del type_out
-        if left_eye_out is not None:
-            del left_eye_out
-        if right_eye_out is not None:
-            del right_eye_out
-        if left_eye is not None:
-            del left_eye
-        if right_eye is not None:
-            del right_eye
-        if landmarks is not None:
-            del landmarks
-        if image_dims is not None:
-            del image_dims
-            
-        # Clear CUDA cache if using GPU
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            
-        # Force garbage collection
-        gc.collect()
+
+
+def predict_eye_colors(left_eye, right_eye) -> dict:
+    """Top color per open eye crop; a closed eye (None) is "Eyes Closed"."""
+    input_eyes = None
+    eyes_out = None
+
+    try:
+        # Both open eyes go through the model as one batch
+        open_eyes = [eye for eye in (left_eye, right_eye) if eye is not None]
+        eye_colors = []
+        if open_eyes:
+            input_eyes = torch.cat([transform_eye(eye) for eye in open_eyes]).to(device)
+            with torch.no_grad():
+                eyes_out = torch.sigmoid(eye_batcher.run(input_eyes)).cpu().numpy()
+            for eye_out in eyes_out:
+                eye_dict = dict(zip(eye_color_labels, [float(p) for p in eye_out]))
+                eye_colors.append(max(eye_dict, key=eye_dict.get))
+
+        return {
+            "left_eye_color": "Eyes Closed" if left_eye is None else eye_colors.pop(0),
+            "right_eye_color": "Eyes Closed" if right_eye is None else eye_colors.pop(0),
+        }
+
+    finally:
+        if input_eyes is not None:
+            del input_eyes
+        if eyes_out is not None:
+            del eyes_out
+
+
+def predict(image) -> dict:
+    """
+    Run skin type, eye color and acne classification on an RGB frame
+    (ndarray) or PIL image. "cropped_face" is returned as an RGB ndarray.
+    """
+    located = locate_face(image)
+    if "error" in located:
+        return located
+
+    face_image = located["face"]
+    try:
+        return {
+            **predict_skin_type(face_image),
+            **predict_eye_colors(located["left_eye"], located["right_eye"]),
+            # Own copy of the crop so the full decoded frame can be released
+            "cropped_face": face_image.copy(),
+            **predict_acne(face_image),
+        }
+    finally:
+        del located, face_image
@@ -0,0 +1,102 @@
+# recommender/AImodels/offload.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+# ----------------------
+# 🧵 Blocking work from async views
+# ----------------------
+class BlockingOffloader:
+    """
+    Runs blocking calls (image decoding, the analysis pipeline, GC) for the
+    async views on a bounded thread pool of `max_workers` threads, so the
+    event loop keeps accepting and reading other uploads meanwhile. Calls
+    beyond `max_workers` queue in the executor; the time they spend there
+    is recorded in `stats()`.
+
+    Calls may use the ORM: like the request cycle, each one closes the
+    thread's expired or broken database connections before and after it.
+
+    Unlike asgiref's sync_to_async(thread_sensitive=True), calls don't
+    serialize on one shared thread, and unlike the loop's default executor
+    the pool isn't shared with (or sized for) unrelated blocking calls.
+    """
+
+    _start_lock = threading.Lock()
+
+    def __init__(self, name, max_workers=1):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    async def run(self, fn, *args, **kwargs):
+        """`fn(*args, **kwargs)` on the pool, awaited without blocking the event loop."""
+        submitted = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._ensure_pool(), partial(self._call, submitted, fn, *args, **kwargs)
+            )
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self) -> dict:
+        started = self.calls - self.in_flight
+        return {
+            "max_workers": self.max_workers,
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            # time a call waited for a free thread
+            "mean_queue_ms": round(self.queue_seconds / started * 1000.0, 2) if started else 0.0,
+            "max_queue_ms": round(self.max_queue_seconds * 1000.0, 2),
+        }
+
+    # ----------------------
+    # Internals
+    # ----------------------
+    def _call(self, submitted, fn, *args, **kwargs):
+        queued = time.monotonic() - submitted
+        with self._lock:
+            self.queue_seconds += queued
+            self.max_queue_seconds = max(self.max_queue_seconds, queued)
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    def _ensure_pool(self):
+        # Threads don't survive fork: (re)create the pool in each process
+        pid = os.getpid()
+        if self._pool is not None and self._pid == pid:
+            return self._pool
+        with self._start_lock:
+            if self._pool is None or self._pid != pid:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"offload-{self.name}")
+                self._pid = pid
+        return self._pool
+
+
+inference_offloader = BlockingOffloader("inference", max_workers=settings.ASYNC_INFERENCE_WORKERS)
@@ -0,0 +1,100 @@
+# recommender/AImodels/onnx_backend.py
+import os
+
+import cpuinfo
+import numpy as np
+import psutil
+import torch
+from django.conf import settings
+
+# ----------------------
+# ⚡ ONNX Runtime backend
+# ----------------------
+# Used by ml_model when INFERENCE_BACKEND = "onnx". The .onnx files are
+# produced next to the .pth files by `python manage.py export_onnx`.
+
+# Preferred accelerated CPU execution providers, used only when the installed
+# onnxruntime build ships them and the CPU has the features they need.
+_ACCELERATED_PROVIDERS = [
+    ("OpenVINOExecutionProvider", "GenuineIntel", {"avx2"}),
+    ("DnnlExecutionProvider", None, {"avx512f"}),
+]
+
+
+def onnx_path(model_path: str) -> str:
+    """skin_model.pth -> skin_model.onnx"""
+    return os.path.splitext(model_path)[0] + ".onnx"
+
+
+def _cpu_features():
+    info = cpuinfo.get_cpu_info()
+    return info.get("vendor_id_raw", ""), set(info.get("flags", []))
+
+
+def select_providers(available, vendor, flags):
+    providers = []
+    for name, required_vendor, required_flags in _ACCELERATED_PROVIDERS:
+        if name not in available:
+            continue
+        if required_vendor and vendor != required_vendor:
+            continue
+        if required_flags <= flags:
+            providers.append(name)
+    providers.append("CPUExecutionProvider")
+    return providers
+
+
+def build_session_options():
+    """
+    Session options and execution providers chosen from the host CPU once at
+    startup.
+    """
+    import onnxruntime as ort
+
+    vendor, flags = _cpu_features()
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = settings.INFERENCE_NUM_THREADS or psutil.cpu_count(logical=False) or 1
+    options.inter_op_num_threads = 1
+    # Several gunicorn workers share the cores: don't busy-wait between ops.
+    options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    if not flags & {"avx2", "avx512f"}:
+        # Older CPUs: the extended graph fusions mostly add start-up time.
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+
+    providers = select_providers(ort.get_available_providers(), vendor, flags)
+    simd = ", ".join(sorted(flags & {"avx2", "avx512f", "avx512_vnni", "avx512_bf16", "amx_bf16"})) or "none"
+    print(
+        f"[ONNX] CPU {vendor or 'unknown'} (SIMD: {simd}), "
+        f"{options.intra_op_num_threads} threads, providers {providers}"
+    )
+    return options, providers
+
+
+class OnnxModel:
+    """
+    Callable with the same contract as the torch models in ml_model:
+    takes a [N, C, H, W] float tensor and returns the logits as a tensor.
+    InferenceSession.run() is thread-safe, so one instance serves all threads.
+    """
+
+    def __init__(self, path, options, providers):
+        import onnxruntime as ort
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, run `python manage.py export_onnx` first")
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        inputs = {self.input_name: np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)}
+        return torch.from_numpy(self.session.run(None, inputs)[0])
+
+
+def load_onnx_models(model_paths: dict) -> dict:
+    """{name: model .pth path} -> {name: OnnxModel} sharing one set of options."""
+    options, providers = build_session_options()
+    return {name: OnnxModel(onnx_path(path), options, providers) for name, path in model_paths.items()}
@@ -0,0 +1,100 @@
+# recommender/AImodels/pipeline.py
+from functools import partial
+
+from django.conf import settings
+
+from recommender.AImodels.ml_model import locate_face, predict_skin_type, predict_eye_colors, predict_acne
+from recommender.AImodels.segment_skin_conditions_yolo import (
+    check_detection_labels, seg_model, segment_skin_conditions, segment_and_detect,
+)
+from recommender.AImodels.stages import StageExecutor
+
+# "both": defect boxes from best.pt plus segmentation (two YOLO passes)
+# "seg_only": boxes derived from the segmentation model (one pass, best.pt not loaded)
+YOLO_MODES = ("both", "seg_only")
+YOLO_MODE = settings.INFERENCE_YOLO_MODE
+
+if YOLO_MODE not in YOLO_MODES:
+    raise ValueError(f"Unknown INFERENCE_YOLO_MODE {YOLO_MODE!r}, expected one of {YOLO_MODES}")
+if YOLO_MODE == "both":
+    from recommender.AImodels.yolo_model import detect_skin_defects_yolo
+else:
+    # Boxes from the seg model must use best.pt's labels
+    check_detection_labels(seg_model.names.values())
+
+# Everything after face detection only needs the face crop and runs concurrently
+analysis_stages = StageExecutor(
+    "analysis",
+    max_workers=settings.INFERENCE_STAGE_WORKERS,
+    thread_budget=settings.INFERENCE_THREAD_BUDGET,
+)
+
+
+def _stage_fields(name, result) -> dict:
+    """A stage's result as the run_analysis() fields it provides."""
+    if name == "detection":
+        yolo_boxes, yolo_annotated = result
+        return {"yolo_boxes": yolo_boxes, "yolo_annotated": yolo_annotated}
+    if name == "segmentation":
+        if YOLO_MODE == "seg_only":
+            segmentation_overlay, segmentation_results, yolo_boxes, yolo_annotated = result
+            return {
+                "yolo_boxes": yolo_boxes,
+                "yolo_annotated": yolo_annotated,
+                "segmentation_overlay": segmentation_overlay,
+                "segmentation_results": segmentation_results,
+            }
+        segmentation_overlay, segmentation_results = result
+        return {"segmentation_overlay": segmentation_overlay, "segmentation_results": segmentation_results}
+    return result
+
+
+# ----------------------
+# 🔬 Full analysis of one decoded frame
+# ----------------------
+def run_analysis(frame, overlay="image", on_stage=None) -> dict:
+    """
+    Run every model on an RGB frame: face detection, then skin type, eye
+    colors, acne, defect detection and segmentation concurrently on the face
+    crop (see INFERENCE_STAGE_WORKERS and INFERENCE_YOLO_MODE).
+
+    Returns the predict() fields plus "yolo_boxes", "yolo_annotated" (PIL),
+    "segmentation_overlay" (PIL), "segmentation_results" and
+    "stage_timings" (ms per stage and in total), or {"error": message} when
+    the photo is unusable. With overlay="vector" nothing is rendered: both
+    images are None and the segmentation results carry mask polygons.
+
+    `on_stage(fields)`, if given, receives each stage's part of that dict
+    as soon as the stage finishes (from the stage's thread), e.g. the skin
+    type while segmentation is still running.
+    """
+    located = locate_face(frame)
+    if "error" in located:
+        return located
+
+    face = located["face"]
+    stages = {
+        "skin_type": partial(predict_skin_type, face),
+        "eye_color": partial(predict_eye_colors, located["left_eye"], located["right_eye"]),
+        "acne": partial(predict_acne, face),
+    }
+    if YOLO_MODE == "seg_only":
+        stages["segmentation"] = partial(segment_and_detect, face, overlay=overlay)
+    else:
+        stages["detection"] = partial(detect_skin_defects_yolo, face, overlay=overlay)
+        stages["segmentation"] = partial(segment_skin_conditions, face, overlay=overlay)
+
+    on_done = None if on_stage is None else (lambda name, result: on_stage(_stage_fields(name, result)))
+    try:
+        results, timings = analysis_stages.run(stages, on_done=on_done)
+    finally:
+        del located, stages
+
+    preds = {
+        # Own copy of the crop so the full decoded frame can be released
+        "cropped_face": face.copy(),
+        "stage_timings": timings,
+    }
+    for name, result in results.items():
+        preds.update(_stage_fields(name, result))
+    return preds
@@ -0,0 +1,115 @@
+# recommender/AImodels/precision.py
+import os
+
+import cpuinfo
+import torch
+import torch.nn as nn
+from torch.ao import quantization as tq
+from torchvision.models.quantization import resnet18 as quantizable_resnet18
+
+from recommender.AImodels.classifiers import MODEL_PATHS, SkinTypeLogits
+
+# ----------------------
+# 🎚️ Reduced-precision inference modes (torch backend, CPU)
+# ----------------------
+#   fp32          the trained weights as-is
+#   int8_dynamic  Linear layers quantized on the fly; no calibration needed,
+#                 but the convolutions (most of the FLOPs) stay FP32
+#   int8_static   convolutions and Linear layers quantized with activation
+#                 ranges from `manage.py calibrate_int8`
+#   bf16          bfloat16 autocast; only on CPUs with native bf16 support
+PRECISION_MODES = ("fp32", "int8_dynamic", "int8_static", "bf16")
+
+BF16_CPU_FLAGS = {"avx512_bf16", "amx_bf16"}
+
+
+def int8_path(model_path: str) -> str:
+    """acne.pth -> acne_int8.pth (calibrated static INT8 state dict)"""
+    base, ext = os.path.splitext(model_path)
+    return f"{base}_int8{ext}"
+
+
+def cpu_supports_bf16() -> bool:
+    return bool(BF16_CPU_FLAGS & set(cpuinfo.get_cpu_info().get("flags", [])))
+
+
+class Bf16Autocast(nn.Module):
+    """Runs the wrapped model under CPU bfloat16 autocast, returns FP32 logits."""
+    def __init__(self, model):
+        super(Bf16Autocast, self).__init__()
+        self.model = model
+    def forward(self, x):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return self.model(x).float()
+
+
+# ----------------------
+# Static INT8 (eager-mode post-training quantization)
+# ----------------------
+def _quantizable_copy(name: str, model: nn.Module) -> nn.Module:
+    """
+    FP32 copy of `model` with quant/dequant stubs and fused Conv/BN/ReLU,
+    ready for tq.prepare().
+    """
+    if name == "skin_type":
+        skin = SkinTypeLogits(type(model.model)())
+        skin.load_state_dict(model.state_dict())
+        skin.eval()
+        tq.fuse_modules(skin.model, [["conv.0", "conv.1"], ["conv.3", "conv.4"], ["fc.1", "fc.2"]], inplace=True)
+        quantizable = tq.QuantWrapper(skin)
+    else:
+        # EyeColorResNet.base_model / AcneResNet.backbone are plain resnet18s
+        resnet = model.base_model if name == "eye_color" else model.backbone
+        quantizable = quantizable_resnet18(weights=None, quantize=False)
+        quantizable.fc = nn.Linear(quantizable.fc.in_features, resnet.fc.out_features)
+        quantizable.load_state_dict(resnet.state_dict())
+        quantizable.eval()
+        quantizable.fuse_model()
+
+    quantizable.qconfig = tq.get_default_qconfig(torch.backends.quantized.engine)
+    return quantizable
+
+
+def quantize_static(name: str, model: nn.Module, calibration_batches) -> nn.Module:
+    """Calibrate activation ranges on `calibration_batches` and convert to INT8."""
+    prepared = tq.prepare(_quantizable_copy(name, model))
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+    return tq.convert(prepared)
+
+
+def load_static_int8(name: str, model: nn.Module) -> nn.Module:
+    """Rebuild the INT8 module structure and load the calibrated weights."""
+    path = int8_path(MODEL_PATHS[name])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, run `python manage.py calibrate_int8 <image folder>` first")
+    quantized = tq.convert(tq.prepare(_quantizable_copy(name, model)))
+    quantized.load_state_dict(torch.load(path, map_location="cpu"))
+    return quantized.eval()
+
+
+# ----------------------
+# Mode selection
+# ----------------------
+def apply_precision(name: str, model: nn.Module, mode: str) -> nn.Module:
+    """Return `model` (an FP32 logits model from classifiers.py) in `mode`."""
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"Unknown precision mode {mode!r}, expected one of {PRECISION_MODES}")
+
+    if mode == "fp32":
+        return model
+    if mode == "int8_dynamic":
+        return tq.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if mode == "int8_static":
+        return load_static_int8(name, model)
+
+    # bf16
+    if not cpu_supports_bf16():
+        print(f"[WARN] {name}: CPU has no native bfloat16 support, keeping FP32")
+        return model
+    return Bf16Autocast(model).eval()
+
+
+def apply_precision_modes(models: dict, mode: str) -> dict:
+    return {name: apply_precision(name, model, mode) for name, model in models.items()}
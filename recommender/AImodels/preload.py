@@ -0,0 +1,90 @@
+# recommender/AImodels/preload.py
+import gc
+import itertools
+import sys
+from importlib import import_module
+
+import psutil
+import torch
+from django.conf import settings
+
+from recommender.AImodels.memory import freeze_after_load
+
+# ----------------------
+# 🧊 Preload models in the gunicorn master
+# ----------------------
+# With `preload_app` (see gunicorn.conf.py) the models are loaded once in the
+# master and the forked workers share those pages copy-on-write. Two things
+# would quietly unshare them again:
+#   * weight pages being written: weights are made contiguous, grad-free and
+#     moved into shared memory, and the YOLO layers are fused up front (the
+#     ultralytics predictor otherwise fuses, i.e. rewrites, them per worker);
+#   * the cyclic GC touching object headers: everything loaded is frozen.
+# post_fork then gives each worker its own thread state (torch intra-op
+# threads, a fresh mediapipe graph).
+
+
+def share_module_weights(module: torch.nn.Module) -> torch.nn.Module:
+    """Make `module`'s tensors read-only, contiguous storage shared between processes."""
+    module.eval()
+    for tensor in itertools.chain(module.parameters(), module.buffers()):
+        tensor.requires_grad_(False)
+        if not tensor.is_contiguous():
+            tensor.data = tensor.data.contiguous()
+    # Memory-mapped weights (classifiers.load_weights) are already shared
+    # through the page cache; share_memory() would copy them into shm.
+    if not any(getattr(m, "weights_mmapped", False) for m in module.modules()):
+        module.share_memory()
+    return module
+
+
+def preload_models():
+    """Load every model in this (master) process, ready to be shared by forks."""
+    if settings.INFERENCE_POOL_ENABLED:
+        # Models live in the inference pool; only the Django code is shared
+        import_module(settings.ROOT_URLCONF)
+        gc.disable()
+        freeze_after_load()
+        print("[PRELOAD] inference pool enabled, no models loaded in the web master")
+        return
+
+    if settings.INFERENCE_BACKEND != "torch":
+        # ONNX Runtime sessions are not fork-safe: each worker loads its own
+        # (importing the URLconf here would create them in the master)
+        print(
+            f"[PRELOAD] WARNING: INFERENCE_BACKEND={settings.INFERENCE_BACKEND} can't be preloaded, "
+            "models load in each worker (set GUNICORN_PRELOAD=False to silence this)"
+        )
+        return
+
+    from recommender.AImodels import ml_model, pipeline, segment_skin_conditions_yolo
+
+    yolos = [segment_skin_conditions_yolo.seg_model]
+    if pipeline.YOLO_MODE == "both":
+        from recommender.AImodels import yolo_model
+        yolos.append(yolo_model.yolo_model)
+    for yolo in yolos:
+        yolo.fuse()
+
+    modules = [ml_model.type_model, ml_model.eye_model, ml_model.acne_model, *yolos]
+    for module in modules:
+        share_module_weights(module)
+
+    # Views, URLconf and the rest of the request path
+    import_module(settings.ROOT_URLCONF)
+
+    # No collections in the master between here and fork (workers re-enable)
+    gc.disable()
+    freeze_after_load()
+    print(f"[PRELOAD] {len(modules)} models shared, master RSS {psutil.Process().memory_info().rss // (1024 * 1024)} MB")
+
+
+def reset_after_fork(workers=1):
+    """Per-worker state that must not be inherited from the master."""
+    gc.enable()
+
+    threads = settings.INFERENCE_NUM_THREADS or max(1, (psutil.cpu_count(logical=False) or 1) // max(1, workers))
+    torch.set_num_threads(threads)
+
+    if "recommender.AImodels.facemesh_model" in sys.modules:
+        sys.modules["recommender.AImodels.facemesh_model"].reset_face_mesh()
@@ -0,0 +1,182 @@
+# recommender/AImodels/preprocess.py
+import io
+import math
+from collections import namedtuple
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+
+# ----------------------
+# 🖼️ Single-decode image helpers
+# ----------------------
+# An upload is decoded once into a contiguous RGB uint8 ndarray (the "frame").
+# Every later stage works on slices of that frame; only model inputs and
+# images that are drawn on get their own (crop-sized) buffers.
+
+IMAGENET_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+IMAGENET_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+
+
+ImageHeader = namedtuple("ImageHeader", "format width height orientation")
+
+# EXIF orientation tag (0x0112) -> transpose that makes the pixels upright
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def probe_image(pil_image: Image.Image) -> ImageHeader:
+    """
+    Format, stored size and EXIF orientation of an opened image, read from
+    the header only (no pixel data is decoded).
+    """
+    orientation = 1
+    exif_bytes = pil_image.info.get("exif")
+    if exif_bytes:
+        exif = Image.Exif()
+        exif.load(exif_bytes)
+        orientation = exif.get(EXIF_ORIENTATION_TAG, 1)
+    return ImageHeader(pil_image.format, pil_image.width, pil_image.height, orientation)
+
+
+def decode_image(source, allowed_formats=None, max_pixels=0, max_side=0) -> np.ndarray:
+    """
+    Decode an uploaded file, raw bytes or PIL image into an upright RGB frame.
+
+    The header is checked before any pixels are decoded: ValueError if the
+    format is not in `allowed_formats` or the image would decode to more than
+    `max_pixels` pixels. JPEGs larger than `max_side` on their longer side
+    are decoded directly at a reduced scale (libjpeg DCT scaling, 1/2 to 1/8,
+    never below `max_side`). 0 disables either limit.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    try:
+        opened = source if isinstance(source, Image.Image) else Image.open(source)
+    except Image.DecompressionBombError:
+        raise ValueError("Image dimensions too large.")
+    except UnidentifiedImageError:
+        raise ValueError("Unsupported image format.")
+
+    pil_image = opened
+    try:
+        header = probe_image(opened)
+        if allowed_formats and header.format not in allowed_formats:
+            raise ValueError("Unsupported image format.")
+
+        longer_side = max(header.width, header.height)
+        if max_side and header.format == "JPEG" and longer_side > max_side:
+            scale = max_side / longer_side
+            opened.draft("RGB", (math.ceil(header.width * scale), math.ceil(header.height * scale)))
+
+        # After draft() the size is the one that will actually be decoded
+        if max_pixels and opened.width * opened.height > max_pixels:
+            raise ValueError(
+                f"Image too large ({header.width}x{header.height}, max {max_pixels / 1e6:g} megapixels)."
+            )
+
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        if header.orientation in EXIF_TRANSPOSE:
+            pil_image = pil_image.transpose(EXIF_TRANSPOSE[header.orientation])
+        return np.asarray(pil_image)
+    finally:
+        if pil_image is not opened:
+            pil_image.close()
+        opened.close()
+
+
+def decode_upload(source, allowed_formats=None) -> np.ndarray:
+    """decode_image() with the upload limits from settings (UPLOAD_MAX_PIXELS, UPLOAD_DECODE_MAX_SIDE)."""
+    return decode_image(
+        source,
+        allowed_formats=allowed_formats,
+        max_pixels=settings.UPLOAD_MAX_PIXELS,
+        max_side=settings.UPLOAD_DECODE_MAX_SIDE,
+    )
+
+
+def to_rgb_array(image) -> np.ndarray:
+    """
+    Return `image` as an RGB uint8 ndarray. Frames are returned as-is, so
+    callers may pass either a frame or a PIL image.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return np.asarray(image)
+
+
+def crop_region(frame: np.ndarray, xs, ys, margin: int) -> np.ndarray:
+    """
+    Bounding box of the given pixel coordinates plus `margin`, clipped to the
+    frame. Returns a view, not a copy.
+    """
+    h, w = frame.shape[:2]
+    x_min, x_max = max(int(min(xs)) - margin, 0), min(int(max(xs)) + margin, w)
+    y_min, y_max = max(int(min(ys)) - margin, 0), min(int(max(ys)) + margin, h)
+    return frame[y_min:y_max, x_min:x_max]
+
+
+def downscale(frame: np.ndarray, max_side: int) -> np.ndarray:
+    """
+    Proxy of `frame` whose longer side is at most `max_side` (area-averaged).
+    Returns `frame` itself if it is already small enough or max_side is 0.
+    """
+    h, w = frame.shape[:2]
+    scale = max_side / max(h, w) if max_side else 1.0
+    if scale >= 1.0:
+        return frame
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def center_brightness(frame: np.ndarray, sample_size: int = 100) -> float:
+    """
+    Mean luma of the centre `sample_size` square, computed on that patch only
+    instead of converting the whole frame to grayscale.
+    """
+    h, w = frame.shape[:2]
+    center_x, center_y = w // 2, h // 2
+    x1 = max(center_x - sample_size // 2, 0)
+    y1 = max(center_y - sample_size // 2, 0)
+    x2 = min(center_x + sample_size // 2, w)
+    y2 = min(center_y + sample_size // 2, h)
+    patch = frame[y1:y2, x1:x2].astype(np.float32)
+    # Same weights as cv2.COLOR_RGB2GRAY
+    return float(np.mean(patch @ np.array([0.299, 0.587, 0.114], dtype=np.float32)))
+
+
+def rgb_to_bgr(rgb: np.ndarray) -> np.ndarray:
+    """Contiguous BGR copy of an RGB frame or crop (the YOLO input layout)."""
+    return np.ascontiguousarray(rgb[..., ::-1])
+
+
+# ----------------------
+# 🔁 Vectorized model inputs
+# ----------------------
+def to_input_tensor(rgb: np.ndarray, size: int, normalize: bool = True) -> torch.Tensor:
+    """
+    Resize an RGB crop to `size`×`size` and scale to [0, 1] (optionally with
+    ImageNet normalization) as one batched tensor of shape [1, 3, size, size].
+    Replaces the per-model torchvision Resize/ToTensor/Normalize chains.
+    """
+    x = torch.from_numpy(np.array(rgb)).permute(2, 0, 1).unsqueeze(0).float()
+    x = F.interpolate(x, size=(size, size), mode="bilinear", antialias=True, align_corners=False)
+    x = x.clamp_(0, 255).div_(255.0)
+    if normalize:
+        x = x.sub_(IMAGENET_MEAN).div_(IMAGENET_STD)
+    return x
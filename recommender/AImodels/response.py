@@ -0,0 +1,126 @@
+# recommender/AImodels/response.py
+import base64
+
+from recommender.AImodels.artifacts import IMAGE_FIELDS, artifact_store, artifact_url
+from recommender.AImodels.encoding import MIME_TYPES, SUFFIXES, encode_images, get_profile
+
+ACNE_MAPPING = {
+    "0": "Clear",
+    "1": "Mild",
+    "2": "Moderate",
+    "3": "Severe",
+    "clear": "Clear"
+}
+
+# ----------------------
+# 📨 Analysis response payload
+# ----------------------
+# Payload fields grouped into the events of a streamed analysis, in the
+# order they usually become available
+PAYLOAD_SECTIONS = {
+    "skin_type": ("skin_type", "type_probs"),
+    "eye_colors": ("left_eye_color", "right_eye_color"),
+    "acne": ("acne_pred", "acne_confidence"),
+    "yolo_boxes": ("yolo_boxes",),
+    "segmentation_results": ("segmentation_results",),
+    "images": IMAGE_FIELDS + ("cropped_face_size", "overlay"),
+}
+
+
+def _eye_color(color):
+    # Top prediction title-cased; "Eyes Closed" as is
+    if isinstance(color, str) and "closed" not in color.lower():
+        return color.title()
+    return color
+
+
+def format_predictions(preds, partial=False) -> dict:
+    """
+    Payload fields other than the images from run_analysis() output. With
+    partial=True `preds` may hold only some stages' fields (see
+    run_analysis's on_stage) and only the fields they determine are returned.
+    """
+    fields = {}
+    if not partial or "type_pred" in preds:
+        fields["skin_type"] = preds["type_pred"].title()
+        fields["type_probs"] = preds.get("type_probs", [])
+    if not partial or "left_eye_color" in preds:
+        # Eye colors (top predictions or "Eyes Closed")
+        fields["left_eye_color"] = _eye_color(preds.get("left_eye_color", "Unknown"))
+        fields["right_eye_color"] = _eye_color(preds.get("right_eye_color", "Unknown"))
+    if not partial or "acne_pred" in preds:
+        # Acne prediction and confidence
+        acne_pred = preds.get("acne_pred", "Unknown")
+        fields["acne_pred"] = ACNE_MAPPING.get(str(acne_pred).lower(), "Unknown")
+        fields["acne_confidence"] = round(preds.get("acne_confidence", 0), 4)
+    for name in ("yolo_boxes", "segmentation_results"):
+        if not partial or name in preds:
+            fields[name] = preds[name]
+    return fields
+
+
+def payload_sections(fields):
+    """(section, {field: value}) for each PAYLOAD_SECTIONS entry present in `fields`."""
+    for section, names in PAYLOAD_SECTIONS.items():
+        present = {name: fields[name] for name in names if name in fields}
+        if present:
+            yield section, present
+
+
+def _store_images(images: dict, profile) -> dict:
+    """{name: image} -> {name: signed artifact URL}, encoded concurrently."""
+    suffix = SUFFIXES[profile.format]
+    encoded = encode_images(images, profile)
+    return {name: artifact_url(artifact_store.put(data, suffix=suffix)) for name, data in encoded.items()}
+
+
+def _inline_images(images: dict, profile) -> dict:
+    """{name: image} -> {name: base64 data URL}, encoded concurrently."""
+    mime_type = MIME_TYPES[profile.format]
+    return {
+        name: f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+        for name, data in encode_images(images, profile).items()
+    }
+
+
+def build_analysis_payload(preds, images="inline", encoding="default") -> dict:
+    """
+    The analysis part of the upload responses, built from run_analysis()
+    output: labels, probabilities, boxes and the three images as base64 JPEG
+    data URLs. Closes the PIL images in `preds`. Errors pass through as
+    {"error": message}.
+
+    For a "vector" overlay analysis (no rendered overlays) only the face crop
+    is encoded; the client draws `yolo_boxes` and the polygons in
+    `segmentation_results` over it, and the payload says "overlay": "vector".
+
+    With images="url" the JPEGs go to the artifact store and the image fields
+    hold signed, site-relative URLs instead of data URLs. `encoding` names the
+    encoding profile (format, quality, preview size); boxes and polygons stay
+    in the coordinates of the full crop, whose size is "cropped_face_size".
+    """
+    if "error" in preds:
+        return {"error": preds["error"]}
+
+    overlays = {
+        name: preds[name]
+        for name in ("yolo_annotated", "segmentation_overlay")
+        if preds.get(name) is not None
+    }
+    try:
+        encode = _store_images if images == "url" else _inline_images
+        urls = encode({"cropped_face": preds["cropped_face"], **overlays}, get_profile(encoding))
+    finally:
+        for image in overlays.values():
+            image.close()
+
+    payload = {
+        **format_predictions(preds),
+        "cropped_face": urls["cropped_face"],
+        "yolo_annotated": urls.get("yolo_annotated"),
+        "segmentation_overlay": urls.get("segmentation_overlay"),
+        "cropped_face_size": [preds["cropped_face"].shape[1], preds["cropped_face"].shape[0]],
+    }
+    if not overlays:
+        payload["overlay"] = "vector"
+    return payload
@@ -0,0 +1,174 @@
+# recommender/AImodels/result_cache.py
+import glob
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from recommender.AImodels.artifacts import artifacts_available
+
+# ----------------------
+# 🗃️ Content-addressed analysis cache
+# ----------------------
+# Storefront widgets often resubmit the same photo (double clicks, retries,
+# "analyze again"). Responses are cached under a hash of the decoded pixels
+# plus everything that changes the models' output, so a resubmission skips
+# all five models. Concurrent identical uploads are coalesced: the first one
+# runs the analysis and the others wait for its result ("single-flight").
+# The cache lives in each worker process; usage is still counted by the
+# views for every request, hit or miss.
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE_PATTERNS = ("*.pth", "*.pt", "*.onnx", "*.safetensors")
+
+
+def model_fingerprint() -> str:
+    """Model files (name, size, mtime) and the settings that change results."""
+    parts = [
+        settings.INFERENCE_BACKEND,
+        settings.INFERENCE_PRECISION,
+        settings.ACNE_RESOLUTION_POLICY,
+        ",".join(str(r) for r in settings.ACNE_RESOLUTIONS),
+        settings.INFERENCE_YOLO_MODE,
+        str(settings.OVERLAY_POLYGON_TOLERANCE),
+    ]
+    for pattern in MODEL_FILE_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(MODEL_DIR, pattern))):
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value, expires_at):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class ResultCache:
+    """
+    LRU cache with a TTL and single-flight computation.
+
+    `get_or_compute(key, compute)` returns (value, outcome) where outcome is
+    "hit", "miss" (computed here) or "coalesced" (waited for a concurrent
+    identical computation). Values for which `cacheable(value)` is false are
+    handed to waiting requests but not stored; entries for which
+    `is_valid(value)` has become false are dropped on lookup.
+    """
+
+    def __init__(self, max_entries=128, ttl_seconds=600, enabled=True, cacheable=None, is_valid=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.enabled = enabled
+        self.cacheable = cacheable or (lambda value: True)
+        self.is_valid = is_valid or (lambda value: True)
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._fingerprint = None
+
+    def key(self, frame, *variant) -> str:
+        """Key for a decoded RGB frame (ndarray) and response variant (e.g. the overlay mode)."""
+        if self._fingerprint is None:
+            self._fingerprint = model_fingerprint()
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self._fingerprint.encode())
+        digest.update(f"{frame.shape}{frame.dtype}{variant}".encode())
+        digest.update(memoryview(frame).cast("B") if frame.flags.c_contiguous else frame.tobytes())
+        return digest.hexdigest()
+
+    def get_or_compute(self, key, compute):
+        if not self.enabled:
+            return compute(), "miss"
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at <= time.monotonic():
+                    del self._entries[key]
+                    self.expirations += 1
+                elif not self.is_valid(entry.value):
+                    del self._entries[key]
+                    self.invalidations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value, "hit"
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result(), "coalesced"
+
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        if self.cacheable(value):
+            self._store(key, value)
+        future.set_result(value)
+        return value, "miss"
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = _Entry(value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+# Error payloads (no face, poor lighting) are shared with coalesced requests
+# but not kept: the user is expected to retake the photo. Payloads whose
+# artifact images were evicted are recomputed.
+analysis_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    enabled=settings.RESULT_CACHE_ENABLED,
+    cacheable=lambda payload: "error" not in payload,
+    is_valid=artifacts_available,
+)
@@ -1,75 +1,185 @@
 # recommender/AImodels/segment_skin_conditions_yolo.py
 from ultralytics import YOLO
-import numpy as np
 import cv2
+from django.conf import settings
 from PIL import Image
-import gc
-import torch
+
+from recommender.AImodels.preprocess import to_rgb_array, rgb_to_bgr
+from recommender.AImodels.annotate import draw_detections, bgr_to_pil, simplify_polygon
+from recommender.AImodels.memory import freeze_after_load
 
 # ----------------------
 # Load segmentation YOLO model once
 # ----------------------
 SEG_MODEL_PATH = "recommender/AImodels/skin_condition_seg.pt"
 seg_model = YOLO(SEG_MODEL_PATH)
+freeze_after_load()
+
+def _instances(results):
+    """(label, confidence, xyxy box) for each predicted instance."""
+    if not hasattr(results, "boxes") or results.boxes is None:
+        return []
+    instances = []
+    for box in results.boxes:
+        cls_id = int(box.cls[0].item())
+        conf = float(box.conf[0].item())
+        label = results.names[cls_id] if results.names else str(cls_id)
+        instances.append((label, conf, box.xyxy[0].cpu().numpy().astype(int).tolist()))
+    return instances
+
+
+def _segmentation_results(results, overlay):
+    """
+    [{'label', 'confidence'}] per instance; in "vector" overlay mode each
+    entry also carries its mask outline as a simplified 'polygon'.
+    """
+    segmentation_results = [
+        {"label": label, "confidence": round(conf, 4)}
+        for label, conf, _ in _instances(results)
+    ]
+    if overlay == "vector":
+        outlines = results.masks.xy if results.masks is not None else []
+        for entry, outline in zip(segmentation_results, outlines):
+            entry["polygon"] = simplify_polygon(outline, settings.OVERLAY_POLYGON_TOLERANCE)
+    return segmentation_results
 
 # ----------------------
 # Segment skin conditions
 # ----------------------
-def segment_skin_conditions(image_pil: Image.Image, conf_threshold=0.3):
+def segment_skin_conditions(image_pil, conf_threshold=0.3, overlay="image"):
     """
-    Run YOLO segmentation on the input PIL image.
+    Run YOLO segmentation on the input RGB face crop (ndarray or PIL image).
     Returns:
-        - image_pil_result: PIL.Image with segmentation overlay
+        - image_pil_result: PIL.Image with segmentation overlay (None in "vector" overlay mode)
         - segmentation_results: list of dicts {'label': str, 'confidence': float}
+          (plus 'polygon' in "vector" overlay mode)
     """
-    image_np = None
     image_bgr = None
     results = None
     image_result = None
     image_pil_result = None
     
     try:
-        # Convert PIL to OpenCV
-        image_np = np.array(image_pil)
-        image_bgr = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+        # BGR copy of the crop for YOLO
+        image_bgr = rgb_to_bgr(to_rgb_array(image_pil))
 
         # Run inference (single image, no streaming for memory efficiency)
         results = seg_model.predict(source=image_bgr, conf=conf_threshold, stream=False)[0]
 
-        # Overlay masks and results
-        image_result = results.plot()
+        if overlay == "image":
+            # Overlay masks and results
+            image_result = results.plot()
 
-        # Convert back to PIL for Django
-        image_pil_result = Image.fromarray(cv2.cvtColor(image_result, cv2.COLOR_BGR2RGB))
+            # Convert back to PIL for Django
+            image_pil_result = Image.fromarray(cv2.cvtColor(image_result, cv2.COLOR_BGR2RGB))
 
-        # Extract detected classes + confidence scores
-        segmentation_results = []
-        if hasattr(results, "boxes") and results.boxes is not None:
-            for box in results.boxes:
-                cls_id = int(box.cls[0].item())
-                conf = float(box.conf[0].item())
-                label = results.names[cls_id] if results.names else str(cls_id)
-                segmentation_results.append({
-                    "label": label,
-                    "confidence": round(conf, 4)
-                })
+        # Extract detected classes + confidence scores (and mask outlines)
+        segmentation_results = _segmentation_results(results, overlay)
 
         return image_pil_result, segmentation_results
         
     finally:
         # Clean up all intermediate objects
-        if image_np is not None:
-            del image_np
         if image_bgr is not None:
             del image_bgr
         if image_result is not None:
             del image_result
         if results is not None:
             del results
-            
-        # Clear CUDA cache if using GPU
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            
-        # Force garbage collection
-        gc.collect()
+
+
+# ----------------------
+# Defect boxes from the segmentation model
+# ----------------------
+# best.pt's classes: the acne-type lesions merchants tag products with (see
+# the documentation page). `yolo_boxes` carries only these labels, whichever
+# INFERENCE_YOLO_MODE produced them.
+DETECTOR_LABELS = (
+    "blackhead", "cystic", "folliculitis", "keloid", "milium", "papular",
+    "purulent", "acne_scars", "acne", "pimple", "spot",
+)
+
+# Segmentation class name -> detector class name for the boxes derived in
+# "seg_only" mode; None for classes best.pt has no equivalent of (the skin
+# concerns), which are left out of the boxes and only reported in
+# `segmentation_results`. check_detection_labels() makes sure every class of
+# the loaded seg model is listed.
+DETECTION_LABELS = {
+    **{name: name for name in DETECTOR_LABELS},
+    "darkcircle": None,
+    "skinredness": None,
+    "melasma": None,
+    "vascular": None,
+    "wrinkle": None,
+}
+
+
+def check_detection_labels(class_names):
+    """Raise if a segmentation class has no DETECTION_LABELS entry (or maps to an unknown label)."""
+    unmapped = sorted(set(class_names) - set(DETECTION_LABELS))
+    if unmapped:
+        raise ValueError(
+            f"Segmentation classes {unmapped} have no DETECTION_LABELS entry: map each to one of "
+            f"{DETECTOR_LABELS} or to None before using INFERENCE_YOLO_MODE=seg_only"
+        )
+    unknown = sorted({label for label in DETECTION_LABELS.values() if label is not None} - set(DETECTOR_LABELS))
+    if unknown:
+        raise ValueError(f"DETECTION_LABELS maps to {unknown}, which are not detector classes")
+
+
+def detections_from_segmentation(results):
+    """detect_skin_defects_yolo()-style detections from segmentation results."""
+    detections = []
+    for name, conf, bbox in _instances(results):
+        label = DETECTION_LABELS.get(name)
+        if label is None:
+            continue
+        detections.append({
+            "bbox": bbox,
+            "label": label,
+            "confidence": round(conf, 4)
+        })
+    return detections
+
+
+def segment_and_detect(image, conf_threshold=0.3, overlay="image"):
+    """
+    One segmentation pass that also stands in for detect_skin_defects_yolo().
+    Each instance's box (fitted to its mask by the seg model) becomes a
+    detection.
+    Returns:
+        - image_pil_result: PIL.Image with segmentation overlay
+        - segmentation_results: list of dicts {'label': str, 'confidence': float}
+        - detections: list of dicts with 'bbox', 'label', 'confidence'
+        - annotated_image: PIL Image with the detection boxes drawn
+    In "vector" overlay mode both images are None and the segmentation
+    results carry mask polygons instead.
+    """
+    image_bgr = None
+    results = None
+    image_result = None
+    image_pil_result = None
+    annotated_image = None
+
+    try:
+        image_bgr = rgb_to_bgr(to_rgb_array(image))
+        results = seg_model.predict(source=image_bgr, conf=conf_threshold, stream=False)[0]
+
+        segmentation_results = _segmentation_results(results, overlay)
+        detections = detections_from_segmentation(results)
+
+        if overlay == "image":
+            # plot() draws on its own copy, image_bgr stays clean for the boxes
+            image_result = results.plot()
+            image_pil_result = Image.fromarray(cv2.cvtColor(image_result, cv2.COLOR_BGR2RGB))
+            annotated_image = bgr_to_pil(draw_detections(image_bgr, detections))
+
+        return image_pil_result, segmentation_results, detections, annotated_image
+
+    finally:
+        if image_bgr is not None:
+            del image_bgr
+        if image_result is not None:
+            del image_result
+        if results is not None:
+            del results
@@ -0,0 +1,127 @@
+# recommender/AImodels/stages.py
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+# ----------------------
+# 🧵 Intra-request stage executor
+# ----------------------
+class StageExecutor:
+    """
+    Runs the independent stages of one request (e.g. the classifiers, defect
+    detection and segmentation on the same face crop) concurrently on a
+    bounded thread pool and joins the results. PyTorch, OpenCV and PIL release
+    the GIL, so the request takes roughly as long as its slowest stage.
+
+    `thread_budget` is the number of torch intra-op threads this worker may
+    use in total (0 = torch's current setting). Concurrent stages share it,
+    so torch is set to budget // max_workers threads per op instead of every
+    stage spinning up a full team and oversubscribing the cores. Pass None
+    for stages that don't run torch ops.
+
+    With max_workers <= 1 stages run one after another on the caller's thread.
+    """
+
+    _start_lock = threading.Lock()
+
+    def __init__(self, name, max_workers=3, thread_budget=None):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.thread_budget = thread_budget
+
+        self.runs = 0
+        self.total_seconds = 0.0
+        self.stage_seconds = defaultdict(float)
+        self.torch_threads = None
+        self._pid = None
+        self._pool = None
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    def run(self, stages: dict, on_done=None):
+        """
+        Call every `stages` value (no arguments) and return
+        ({name: result}, {name: milliseconds, "total": milliseconds}).
+        If a stage raises, the others are still awaited and the first
+        exception (in `stages` order) is re-raised.
+        `on_done(name, result)`, if given, is called as soon as a stage
+        succeeds, on the thread that ran it; its exceptions are handled like
+        the stages'.
+        """
+        started = time.perf_counter()
+        if self.max_workers <= 1 or len(stages) <= 1:
+            outcomes = {name: self._timed(fn, name, on_done) for name, fn in stages.items()}
+        else:
+            pool = self._ensure_pool()
+            futures = {name: pool.submit(self._timed, fn, name, on_done) for name, fn in stages.items()}
+            outcomes = {name: future.result() for name, future in futures.items()}
+        total = time.perf_counter() - started
+
+        results, timings = {}, {}
+        error = None
+        for name, (result, exc, seconds) in outcomes.items():
+            results[name] = result
+            timings[name] = round(seconds * 1000.0, 1)
+            self.stage_seconds[name] += seconds
+            if exc is not None and error is None:
+                error = exc
+        timings["total"] = round(total * 1000.0, 1)
+        self.runs += 1
+        self.total_seconds += total
+
+        if error is not None:
+            raise error
+        return results, timings
+
+    def stats(self) -> dict:
+        runs = self.runs or 1
+        stage_ms = {name: round(s / runs * 1000.0, 1) for name, s in self.stage_seconds.items()}
+        total_ms = round(self.total_seconds / runs * 1000.0, 1)
+        return {
+            "max_workers": self.max_workers,
+            "torch_threads": self.torch_threads,
+            "runs": self.runs,
+            "mean_stage_ms": stage_ms,
+            "mean_total_ms": total_ms,
+            # > 1 when stages overlap: sum of stage times / wall time
+            "overlap": round(sum(stage_ms.values()) / total_ms, 2) if total_ms else 0.0,
+        }
+
+    # ----------------------
+    # Internals
+    # ----------------------
+    @staticmethod
+    def _timed(fn, name=None, on_done=None):
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            return None, e, time.perf_counter() - started
+        seconds = time.perf_counter() - started
+        if on_done is not None:
+            # Raised like the stage's own exception, once all stages are done
+            try:
+                on_done(name, result)
+            except Exception as e:
+                return result, e, seconds
+        return result, None, seconds
+
+    def _ensure_pool(self):
+        # Threads don't survive fork: (re)create the pool in each process
+        pid = os.getpid()
+        if self._pool is not None and self._pid == pid:
+            return self._pool
+        with self._start_lock:
+            if self._pool is None or self._pid != pid:
+                if self.thread_budget is not None:
+                    budget = self.thread_budget or torch.get_num_threads()
+                    self.torch_threads = max(1, budget // self.max_workers)
+                    torch.set_num_threads(self.torch_threads)
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"stage-{self.name}")
+                self._pid = pid
+        return self._pool
@@ -1,10 +1,9 @@
 import os
-import cv2
-import numpy as np
-from PIL import Image
 from ultralytics import YOLO
-import gc
-import torch
+
+from recommender.AImodels.preprocess import to_rgb_array, rgb_to_bgr
+from recommender.AImodels.annotate import draw_detections, bgr_to_pil
+from recommender.AImodels.memory import freeze_after_load
 
 # ----------------------
 # Load YOLOv8 Model Once
@@ -12,24 +11,25 @@ import torch
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 YOLO_MODEL_PATH = os.path.join(BASE_DIR, "best.pt")
 yolo_model = YOLO(YOLO_MODEL_PATH)
+freeze_after_load()
 
 # ----------------------
 # Detect skin defects
 # ----------------------
-def detect_skin_defects_yolo(image: Image.Image, conf_threshold=0.3):
+def detect_skin_defects_yolo(image, conf_threshold=0.3, overlay="image"):
     """
-    Detect skin defects using YOLOv8.
+    Detect skin defects using YOLOv8 on an RGB face crop (ndarray or PIL image).
     Returns:
       - detections: list of dicts with 'bbox', 'label', 'confidence'
-      - annotated_image: PIL Image with boxes drawn
+      - annotated_image: PIL Image with boxes drawn (None in "vector" overlay mode)
     """
     image_cv2 = None
     results = None
     annotated_image = None
     
     try:
-        # Convert PIL to OpenCV
-        image_cv2 = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        # BGR copy of the crop: YOLO input and drawing canvas
+        image_cv2 = rgb_to_bgr(to_rgb_array(image))
 
         # Predict using YOLOv8 (single image, no stream for memory efficiency)
         results = yolo_model.predict(source=image_cv2, conf=conf_threshold, stream=False)[0]
@@ -49,13 +49,9 @@ def detect_skin_defects_yolo(image: Image.Image, conf_threshold=0.3):
                     "confidence": round(conf, 4)
                 })
 
-                # Draw box and label on image
-                cv2.rectangle(image_cv2, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
-                cv2.putText(image_cv2, f"{label} {conf:.2f}", (bbox[0], bbox[1]-10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-        # Convert annotated image back to PIL
-        annotated_image = Image.fromarray(cv2.cvtColor(image_cv2, cv2.COLOR_BGR2RGB))
+        # Draw boxes and labels, then convert back to PIL (in-place channel swap)
+        if overlay == "image":
+            annotated_image = bgr_to_pil(draw_detections(image_cv2, detections))
 
         return detections, annotated_image
         
@@ -65,10 +61,3 @@ def detect_skin_defects_yolo(image: Image.Image, conf_threshold=0.3):
             del image_cv2
         if results is not None:
             del results
-            
-        # Clear CUDA cache if using GPU
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            
-        # Force garbage collection
-        gc.collect()
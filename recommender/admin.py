@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
-from .models import Visitor, FaceAnalysis , Feedback , AllowedOrigin ,Shop , PageContent ,Purchase
+from .models import Visitor, FaceAnalysis , Feedback , AllowedOrigin ,Shop , PageContent ,Purchase, AnalysisJob
 
 @admin.register(Visitor)
 class VisitorAdmin(admin.ModelAdmin):
@@ -23,6 +23,14 @@ class FeedbackAdmin(admin.ModelAdmin):
     search_fields = ('dislike_reason',)
     readonly_fields = ('created_at',)
 
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source', 'status', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'source')
+    exclude = ('image',)
+    readonly_fields = ('created_at',)
+
 # Change admin site headers and titles
 admin.site.site_header = "Beautyxia"
 admin.site.site_title = "Beautyxia"
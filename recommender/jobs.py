@@ -0,0 +1,325 @@
+# recommender/jobs.py
+import io
+import multiprocessing as mp
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .models import AnalysisJob
+
+# ----------------------
+# 📬 Analysis jobs
+# ----------------------
+# In job mode (ANALYSIS_JOBS_ENABLED and the client passes mode=job) the
+# views only decode the upload, store it in an AnalysisJob row and return the
+# job id; `manage.py run_analysis_workers` processes on any number of nodes
+# claim rows with SELECT ... FOR UPDATE SKIP LOCKED, so every job goes to
+# exactly one worker without a separate broker. Clients poll
+# /jobs/<id>/ for the result.
+#
+# A running job is heartbeated by its worker. If the worker dies, any worker's
+# reaper puts the job back in the queue after JOB_STALE_SECONDS (or fails it
+# after JOB_MAX_ATTEMPTS); finished and abandoned rows are deleted after
+# JOB_TTL_SECONDS.
+#
+# A WordPress shop's monthly quota is checked again before a claimed job is
+# analyzed and consumed when it succeeds, so jobs queued while the shop was
+# under its limit can't take it over the limit.
+
+
+class QuotaExceeded(ValueError):
+    """The job's WordPress shop has used up its monthly quota."""
+
+
+def job_requested(params) -> bool:
+    """True if a client asked for job mode and it is enabled."""
+    return settings.ANALYSIS_JOBS_ENABLED and params.get("mode") == "job"
+
+
+def encode_frame(frame: np.ndarray) -> bytes:
+    """Decoded RGB frame -> PNG bytes (lossless, fast compression)."""
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def decode_frame(data) -> np.ndarray:
+    with Image.open(io.BytesIO(bytes(data))) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def enqueue_analysis(frame, options, source, usage) -> AnalysisJob:
+    """
+    Store a decoded upload as a queued job. `usage` is what the worker
+    records once the analysis succeeds (see _record_usage).
+    """
+    return AnalysisJob.objects.create(
+        source=source,
+        image=encode_frame(frame),
+        options=options,
+        usage=usage,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        expires_at=timezone.now() + timedelta(seconds=settings.JOB_TTL_SECONDS),
+    )
+
+
+def job_accepted_body(job, request) -> dict:
+    """Response body for an enqueued job (sent with status 202)."""
+    return {
+        "status": job.status,
+        "job_id": str(job.pk),
+        "poll_url": request.build_absolute_uri(reverse("analysis_job", args=[job.pk])),
+    }
+
+
+# ----------------------
+# Worker side
+# ----------------------
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker):
+    """Take the oldest available queued job, or None; other workers skip the locked row."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            AnalysisJob.objects.select_for_update(skip_locked=True)
+            .filter(status=AnalysisJob.QUEUED, available_at__lte=now)
+            .order_by("available_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = AnalysisJob.RUNNING
+        job.attempts += 1
+        job.worker = worker
+        job.started_at = now
+        job.heartbeat_at = now
+        job.save(update_fields=["status", "attempts", "worker", "started_at", "heartbeat_at"])
+    return job
+
+
+def _finish(job, worker, **fields):
+    """Store the outcome, unless the job was meanwhile re-queued and claimed by someone else."""
+    now = timezone.now()
+    return AnalysisJob.objects.filter(pk=job.pk, worker=worker, status=AnalysisJob.RUNNING).update(
+        image=b"",
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_TTL_SECONDS),
+        **fields,
+    )
+
+
+def _quota_error(limit) -> str:
+    return f"Quota Ended: you have reached your limit of {limit} analyses. Please upgrade your plan."
+
+
+def _check_quota(job):
+    """Raise QuotaExceeded if the job's WordPress shop has no analyses left this month."""
+    if job.source != AnalysisJob.WORDPRESS:
+        return
+    from wordPress.models import WordpressShop
+
+    shop = WordpressShop.objects.select_related("plan").get(pk=job.usage["shop_id"])
+    if shop.analysis_this_month >= shop.current_limit:
+        raise QuotaExceeded(_quota_error(shop.current_limit))
+
+
+def _record_usage(job):
+    """
+    Count a successful analysis the way the synchronous views do; returns
+    extra result fields. Raises QuotaExceeded if a WordPress shop's quota was
+    used up meanwhile (the increment only applies below the limit).
+    """
+    if job.source == AnalysisJob.WORDPRESS:
+        from wordPress.models import WordpressShop
+
+        shop = WordpressShop.objects.select_related("plan").get(pk=job.usage["shop_id"])
+        limit = shop.current_limit
+        counted = WordpressShop.objects.filter(pk=shop.pk, analysis_this_month__lt=limit).update(
+            analysis_this_month=F("analysis_this_month") + 1,
+            analysis_all_time=F("analysis_all_time") + 1,
+        )
+        if not counted:
+            raise QuotaExceeded(_quota_error(limit))
+        shop.refresh_from_db(fields=["analysis_this_month"])
+        return {"status": "success", "usage": {"used": shop.analysis_this_month, "limit": limit}}
+
+    from .models import FaceAnalysis
+    from .views import shops_for_domain
+
+    usage = dict(job.usage)
+    FaceAnalysis.objects.create(**usage)
+    if usage.get("domain"):
+        shops_for_domain(usage["domain"]).update(analysis_count=F("analysis_count") + 1)
+    return {}
+
+
+def run_job(job, worker):
+    """Analyze a claimed job and store its result, or fail/retry it."""
+    from recommender.AImodels.inference import analyze_payload
+
+    try:
+        _check_quota(job)
+        frame = decode_frame(job.image)
+        payload, _ = analyze_payload(frame, **job.options)
+    except ValueError as e:
+        # Unusable photo or no quota left: retrying won't help
+        _finish(job, worker, status=AnalysisJob.FAILED, error=str(e))
+        return
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_DELAY_SECONDS * job.attempts
+            AnalysisJob.objects.filter(pk=job.pk, worker=worker, status=AnalysisJob.RUNNING).update(
+                status=AnalysisJob.QUEUED, worker="", error=error,
+                available_at=timezone.now() + timedelta(seconds=delay),
+            )
+            print(f"[JOBS] job {job.pk} attempt {job.attempts} failed ({error}), retrying in {delay}s")
+        else:
+            _finish(job, worker, status=AnalysisJob.FAILED, error=error)
+        return
+
+    if "error" in payload:
+        _finish(job, worker, status=AnalysisJob.FAILED, error=payload["error"])
+        return
+
+    with transaction.atomic():
+        if not _finish(job, worker, status=AnalysisJob.DONE, error="", result=payload):
+            return
+        try:
+            extra = _record_usage(job)
+        except QuotaExceeded as e:
+            AnalysisJob.objects.filter(pk=job.pk).update(status=AnalysisJob.FAILED, error=str(e), result=None)
+            return
+        if extra:
+            AnalysisJob.objects.filter(pk=job.pk).update(result={**extra, **payload})
+
+
+def reap_jobs():
+    """Re-queue (or fail) jobs whose worker stopped heartbeating; delete expired rows."""
+    now = timezone.now()
+    stale = AnalysisJob.objects.filter(
+        status=AnalysisJob.RUNNING,
+        heartbeat_at__lt=now - timedelta(seconds=settings.JOB_STALE_SECONDS),
+    )
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=AnalysisJob.FAILED, error="Worker lost", image=b"", finished_at=now,
+        expires_at=now + timedelta(seconds=settings.JOB_TTL_SECONDS),
+    )
+    requeued = stale.update(status=AnalysisJob.QUEUED, worker="", available_at=now)
+    deleted, _ = AnalysisJob.objects.filter(expires_at__lt=now).delete()
+    if failed or requeued or deleted:
+        print(f"[JOBS] reaper: {requeued} re-queued, {failed} failed, {deleted} expired")
+
+
+class _Heartbeat:
+    """Refreshes heartbeat_at of the running job from a background thread."""
+
+    def __init__(self, job, worker, interval):
+        self.job = job
+        self.worker = worker
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="job-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        try:
+            while not self._stop.wait(self.interval):
+                AnalysisJob.objects.filter(pk=self.job.pk, worker=self.worker).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+
+def _worker_main(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+    from recommender.AImodels.memory import memory_governor
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    # Finish the current job on SIGTERM instead of leaving it to the reaper
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    worker = worker_id()
+    print(f"[JOBS] worker {worker} ready ({threads} torch threads)")
+    next_reap = 0.0
+    while not stopping and not memory_governor.recycle_requested:
+        close_old_connections()
+        if time.monotonic() >= next_reap:
+            reap_jobs()
+            next_reap = time.monotonic() + settings.JOB_STALE_SECONDS / 2
+
+        job = claim_job(worker)
+        if job is None:
+            time.sleep(settings.JOB_POLL_SECONDS)
+            continue
+
+        with _Heartbeat(job, worker, settings.JOB_HEARTBEAT_SECONDS):
+            run_job(job, worker)
+        memory_governor.after_request()
+
+    print(f"[JOBS] worker {worker} exiting")
+
+
+def serve(workers=2, threads=1):
+    """Run `workers` job processes in the foreground until SIGTERM/SIGINT."""
+    # Children must open their own database connections
+    connections.close_all()
+    ctx = mp.get_context("fork")
+
+    def start():
+        process = ctx.Process(target=_worker_main, args=(threads,))
+        process.start()
+        return process
+
+    processes = [start() for _ in range(workers)]
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping:
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    print(f"[JOBS] worker {process.pid} exited ({process.exitcode}), starting a new one")
+                    processes[i] = start()
+            time.sleep(0.5)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=settings.JOB_STALE_SECONDS)
+            if process.is_alive():
+                process.kill()
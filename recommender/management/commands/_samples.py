@@ -0,0 +1,72 @@
+# Helpers shared by the benchmark/report commands (not a command itself).
+import os
+
+import numpy as np
+
+from recommender.AImodels.classifiers import TYPE_INPUT_SIZE, EYE_INPUT_SIZE, ACNE_INPUT_SIZE
+from recommender.AImodels.preprocess import decode_image, to_input_tensor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def iter_image_paths(folder, limit=None):
+    """Image files under `folder` (recursive, sorted for stable reports)."""
+    paths = []
+    for root, _, files in os.walk(folder):
+        paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def label_from_path(path):
+    """Images may be sorted into folders named after their label."""
+    return os.path.basename(os.path.dirname(path))
+
+
+class FaceSample:
+    __slots__ = ("path", "label", "face", "eyes")
+
+    def __init__(self, path, label, face, eyes):
+        self.path = path
+        self.label = label
+        self.face = face
+        self.eyes = eyes
+
+
+def iter_face_samples(folder, limit=None, stderr=None):
+    """
+    Run face detection on every image in `folder` and yield FaceSample
+    objects holding the face crop and open-eye crops (RGB ndarrays).
+    Images without a usable face are skipped.
+    """
+    from recommender.AImodels.facemesh_model import (
+        detect_and_crop_face, crop_left_eye_from_landmarks, crop_right_eye_from_landmarks,
+    )
+
+    for path in iter_image_paths(folder, limit):
+        frame = decode_image(path)
+        try:
+            face, left_closed, right_closed, landmarks, dims = detect_and_crop_face(frame)
+        except ValueError as e:
+            if stderr:
+                stderr.write(f"skipping {path}: {e}")
+            continue
+        eyes = []
+        if not left_closed:
+            eyes.append(crop_left_eye_from_landmarks(frame, landmarks, dims).copy())
+        if not right_closed:
+            eyes.append(crop_right_eye_from_landmarks(frame, landmarks, dims).copy())
+        yield FaceSample(path, label_from_path(path), face.copy(), eyes)
+
+
+def model_inputs(sample, acne_size=ACNE_INPUT_SIZE):
+    """{model name: [input tensors]} for one FaceSample, as predict() builds them."""
+    return {
+        "skin_type": [to_input_tensor(sample.face, TYPE_INPUT_SIZE, normalize=False)],
+        "eye_color": [to_input_tensor(eye, EYE_INPUT_SIZE) for eye in sample.eyes],
+        "acne": [to_input_tensor(sample.face, acne_size)],
+    }
+
+
+def percentile_ms(seconds, q):
+    return float(np.percentile(np.asarray(seconds) * 1000.0, q)) if seconds else 0.0
@@ -0,0 +1,71 @@
+import os
+import time
+
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommender.AImodels.classifiers import (
+    ACNE_INPUT_SIZE, acne_labels, load_acne_model, pick_acne_resolution,
+)
+from recommender.AImodels.precision import apply_precision
+from recommender.AImodels.preprocess import to_input_tensor
+from ._samples import iter_face_samples, percentile_ms
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the acne classifier at each rung of the resolution ladder: "
+        "latency and label agreement with the full 640 px input"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("folder", help="Folder of face photos (searched recursively)")
+        parser.add_argument(
+            "--resolutions", default=",".join(str(r) for r in settings.ACNE_RESOLUTIONS),
+            help="Comma-separated rungs to benchmark (default: ACNE_RESOLUTIONS)",
+        )
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--warmup", type=int, default=3)
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options["folder"]):
+            raise CommandError(f"{options['folder']} is not a directory")
+        rungs = sorted({int(r) for r in options["resolutions"].split(",")})
+
+        faces = [s.face for s in iter_face_samples(options["folder"], options["limit"], stderr=self.stderr)]
+        if not faces:
+            raise CommandError("No usable face photos found")
+
+        model = apply_precision("acne", load_acne_model().cpu().eval(), settings.INFERENCE_PRECISION)
+        self.stdout.write(
+            f"{len(faces)} faces, precision {settings.INFERENCE_PRECISION}, "
+            f"median crop {sorted(max(f.shape[:2]) for f in faces)[len(faces) // 2]} px\n"
+        )
+
+        reference, _ = self._run(model, faces, lambda face: ACNE_INPUT_SIZE, options["warmup"])
+        ladders = [(f"{size} px", lambda face, size=size: size) for size in rungs]
+        ladders.append((
+            "adaptive",
+            lambda face: pick_acne_resolution(face.shape[0], face.shape[1], rungs),
+        ))
+
+        for title, size_for in ladders:
+            preds, times = self._run(model, faces, size_for, options["warmup"])
+            agree = sum(p == r for p, r in zip(preds, reference)) / len(preds)
+            self.stdout.write(
+                f"{title:>9}  agreement with {ACNE_INPUT_SIZE} px {agree * 100:6.2f}%  "
+                f"p50 {percentile_ms(times, 50):7.2f} ms  p95 {percentile_ms(times, 95):7.2f} ms"
+            )
+
+    def _run(self, model, faces, size_for, warmup):
+        preds, times = [], []
+        with torch.no_grad():
+            for face in faces[:warmup]:
+                model(to_input_tensor(face, size_for(face)))
+            for face in faces:
+                started = time.perf_counter()
+                out = model(to_input_tensor(face, size_for(face)))
+                times.append(time.perf_counter() - started)
+                preds.append(acne_labels[int(out.argmax(dim=1))])
+        return preds, times
@@ -0,0 +1,101 @@
+import io
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from recommender.AImodels.encoding import ENCODING_PROFILES, encode_image, fit_to_edge
+from recommender.AImodels.stages import StageExecutor
+from ._samples import iter_face_samples, percentile_ms
+
+KB = 1024
+
+
+def psnr(reference, encoded_bytes, max_edge):
+    """PSNR (dB) of a decoded encode against the reference scaled to the same size."""
+    reference = np.asarray(fit_to_edge(Image.fromarray(reference), max_edge), dtype=np.float32)
+    with Image.open(io.BytesIO(encoded_bytes)) as decoded:
+        decoded = np.asarray(decoded.convert("RGB"), dtype=np.float32)
+    mse = float(np.mean((reference - decoded) ** 2))
+    return float("inf") if mse == 0 else 10.0 * np.log10(255.0 ** 2 / mse)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark response image encoding on face crops: time, bytes and PSNR per "
+        "encoding profile, and sequential vs concurrent encoding of a response's three images"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("folder", help="Folder of face photos (searched recursively)")
+        parser.add_argument(
+            "--profiles", default=",".join(ENCODING_PROFILES),
+            help="Comma-separated profile names (default: all)",
+        )
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per crop")
+        parser.add_argument("--workers", type=int, default=3, help="Threads for the concurrent run")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options["profiles"].split(",") if name.strip()]
+        unknown = [name for name in names if name not in ENCODING_PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(unknown)}")
+
+        crops = [sample.face for sample in iter_face_samples(options["folder"], options["limit"], self.stderr)]
+        if not crops:
+            raise CommandError(f"No usable face photos under {options['folder']}")
+        mean_mp = sum(crop.shape[0] * crop.shape[1] for crop in crops) / len(crops) / 1e6
+        self.stdout.write(f"{len(crops)} face crops (mean {mean_mp:.2f} MP), {options['repeat']} runs each\n")
+
+        self.stdout.write(
+            f"{'profile':<14}{'format':<7}{'q':>4}{'edge':>6}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'mean KB':>10}{'vs default':>12}{'PSNR dB':>9}"
+        )
+        baseline_kb = None
+        for name in names:
+            profile = ENCODING_PROFILES[name]
+            times, sizes, quality = [], [], []
+            for crop in crops:
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    data = encode_image(crop, profile)
+                    times.append(time.perf_counter() - started)
+                sizes.append(len(data))
+                quality.append(psnr(crop, data, profile.max_edge))
+
+            mean_kb = sum(sizes) / len(sizes) / KB
+            if name == "default":
+                baseline_kb = mean_kb
+            ratio = f"{mean_kb / baseline_kb:11.0%}" if baseline_kb else f"{'-':>11}"
+            self.stdout.write(
+                f"{name:<14}{profile.format:<7}{profile.quality:>4}{profile.max_edge or '-':>6}"
+                f"{percentile_ms(times, 50):>9.1f}{percentile_ms(times, 95):>9.1f}"
+                f"{mean_kb:>10.1f} {ratio}{sum(quality) / len(quality):>9.1f}"
+            )
+
+        # A response encodes the face crop and two overlays of the same size
+        self.stdout.write("\nThree images per response (face crop + two overlays):")
+        sequential = StageExecutor("bench-seq", max_workers=1)
+        concurrent = StageExecutor("bench-par", max_workers=options["workers"])
+        for name in names:
+            row = []
+            for executor in (sequential, concurrent):
+                times = []
+                for crop in crops:
+                    jobs = {key: (lambda c=crop, p=name: encode_image(c, p)) for key in ("face", "yolo", "seg")}
+                    for _ in range(options["repeat"]):
+                        started = time.perf_counter()
+                        executor.run(jobs)
+                        times.append(time.perf_counter() - started)
+                row.append(percentile_ms(times, 50))
+            self.stdout.write(
+                f"  {name:<14} sequential p50 {row[0]:7.1f} ms   "
+                f"concurrent ({options['workers']} threads) p50 {row[1]:7.1f} ms"
+            )
+
+        self.stdout.write(
+            "\nvs default: mean size relative to the default profile. PSNR is measured "
+            "against the crop scaled to the profile's max edge."
+        )
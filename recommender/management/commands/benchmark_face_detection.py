@@ -0,0 +1,137 @@
+import multiprocessing as mp
+import math
+import resource
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommender.AImodels.preprocess import decode_image, downscale
+from ._samples import iter_image_paths, percentile_ms
+
+MB = 1024 * 1024
+
+
+def resize_to_megapixels(frame, megapixels):
+    """`frame` rescaled (aspect ratio kept) to roughly `megapixels` million pixels."""
+    h, w = frame.shape[:2]
+    scale = math.sqrt(megapixels * 1e6 / (h * w))
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(frame, size, interpolation=interpolation)
+
+
+def _peak_rss():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _measure(paths, megapixels, proxy_max_side, repeat):
+    """Runs in a fresh process so each configuration starts from the same high-water mark."""
+    from recommender.AImodels.facemesh_model import detect_and_crop_face
+
+    frames = [resize_to_megapixels(decode_image(path), megapixels) for path in paths]
+    # Create the FaceMesh graph on a small image before taking the baseline
+    try:
+        detect_and_crop_face(downscale(frames[0], 256), proxy_max_side=0)
+    except ValueError:
+        pass
+
+    rss_before = _peak_rss()
+    times, landmarks = [], []
+    for frame in frames:
+        found = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            try:
+                _, _, _, found, _ = detect_and_crop_face(frame, proxy_max_side=proxy_max_side)
+            except ValueError:
+                found = None
+            times.append(time.perf_counter() - started)
+        landmarks.append(found)
+    rss_growth = _peak_rss() - rss_before
+
+    # Python/numpy allocations only (mediapipe's own buffers aren't traced);
+    # a separate pass so tracing doesn't skew the timings
+    tracemalloc.start()
+    traced_peak = 0
+    for frame in frames:
+        tracemalloc.reset_peak()
+        try:
+            detect_and_crop_face(frame, proxy_max_side=proxy_max_side)
+        except ValueError:
+            pass
+        traced_peak = max(traced_peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    dims = [frame.shape[1::-1] for frame in frames]
+    return times, rss_growth, traced_peak, landmarks, dims
+
+
+def landmark_shift(reference, candidate, dims):
+    """Mean distance in full-resolution pixels between two landmark arrays."""
+    scale = np.asarray(dims, dtype=np.float32)
+    return float(np.linalg.norm((reference[:, :2] - candidate[:, :2]) * scale, axis=1).mean())
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark face detection on full-resolution frames vs a downscaled proxy "
+        "(FACEMESH_PROXY_MAX_SIDE): latency, peak memory and landmark agreement at several image sizes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("folder", help="Folder of face photos (searched recursively)")
+        parser.add_argument("--megapixels", default="1,4,12", help="Comma-separated input sizes")
+        parser.add_argument(
+            "--proxy", type=int, default=settings.FACEMESH_PROXY_MAX_SIDE or 640,
+            help="Proxy longer side in pixels (default: FACEMESH_PROXY_MAX_SIDE)",
+        )
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per photo")
+
+    def handle(self, *args, **options):
+        paths = iter_image_paths(options["folder"], options["limit"])
+        if not paths:
+            raise CommandError(f"No images found under {options['folder']}")
+        sizes = [float(size) for size in options["megapixels"].split(",")]
+        modes = (("full", 0), (f"proxy {options['proxy']}", options["proxy"]))
+
+        self.stdout.write(f"{len(paths)} photos, {options['repeat']} runs each\n")
+        self.stdout.write(
+            f"{'MP':>5}  {'mode':<11}{'faces':>6}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'RSS peak +MB':>14}{'traced peak MB':>16}{'shift px':>10}"
+        )
+        ctx = mp.get_context("spawn")
+        for megapixels in sizes:
+            reference = None
+            for title, proxy_max_side in modes:
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                    times, rss_growth, traced_peak, landmarks, dims = executor.submit(
+                        _measure, paths, megapixels, proxy_max_side, options["repeat"]
+                    ).result()
+
+                found = sum(lm is not None for lm in landmarks)
+                shifts = [] if reference is None else [
+                    landmark_shift(ref, lm, dim)
+                    for ref, lm, dim in zip(reference, landmarks, dims)
+                    if ref is not None and lm is not None
+                ]
+                shift = f"{sum(shifts) / len(shifts):10.2f}" if shifts else f"{'-':>10}"
+                self.stdout.write(
+                    f"{megapixels:>5g}  {title:<11}{found:>6}"
+                    f"{percentile_ms(times, 50):>9.1f}{percentile_ms(times, 95):>9.1f}"
+                    f"{rss_growth / MB:>14.1f}{traced_peak / MB:>16.1f}{shift}"
+                )
+                if reference is None:
+                    reference = landmarks
+
+        self.stdout.write(
+            "\nRSS peak: growth of the process high-water mark while detecting (input frames "
+            "already decoded). shift: mean landmark distance from the full-resolution run, "
+            "in full-resolution pixels."
+        )
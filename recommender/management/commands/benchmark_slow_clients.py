@@ -0,0 +1,134 @@
+import asyncio
+import mimetypes
+import os
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ._samples import percentile_ms
+
+
+def multipart_body(path, fields):
+    """(content type, body) of a multipart/form-data upload of `path` as `photo`."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    with open(path, "rb") as f:
+        data = f.read()
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="photo"; '
+        f'filename="{os.path.basename(path)}"\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+        + data + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return f"multipart/form-data; boundary={boundary}", b"".join(parts)
+
+
+async def post(url, content_type, body, rate_bps=0, chunk_size=4096):
+    """
+    POST `body` over a fresh HTTP/1.1 connection, trickled at `rate_bps`
+    bytes per second (0 = as fast as possible). Returns (status, seconds).
+    """
+    parts = urlsplit(url)
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        )
+        for offset in range(0, len(body), chunk_size):
+            writer.write(body[offset:offset + chunk_size])
+            await writer.drain()
+            if rate_bps:
+                await asyncio.sleep(chunk_size / rate_bps)
+        status_line = await reader.readline()
+        await reader.read()  # rest of the response, until the server closes
+        status = int(status_line.split()[1]) if status_line else 0
+    except (ConnectionError, IndexError, ValueError):
+        status = 0
+    finally:
+        writer.close()
+    return status, time.perf_counter() - started
+
+
+async def run_scenario(url, content_type, body, slow_clients, rate_bps, fast_requests, head_start):
+    """Slow uploads in the background while fast clients post one after another."""
+    slow = [asyncio.create_task(post(url, content_type, body, rate_bps)) for _ in range(slow_clients)]
+    await asyncio.sleep(head_start)
+    fast = [await post(url, content_type, body) for _ in range(fast_requests)]
+    return await asyncio.gather(*slow), fast
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the WSGI and ASGI analysis endpoints under slow clients: N uploads trickled "
+        "at a mobile-like rate occupy the server while fast clients measure their latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("photo", help="Face photo to upload")
+        parser.add_argument(
+            "--target", action="append", required=True, metavar="NAME=URL",
+            help="Upload endpoint to test, e.g. wsgi=http://127.0.0.1:8000/upload/ "
+                 "and asgi=http://127.0.0.1:8001/upload/async/ (repeatable)",
+        )
+        parser.add_argument("--slow-clients", type=int, default=8)
+        parser.add_argument("--rate-kbps", type=float, default=64.0, help="Upload rate of each slow client")
+        parser.add_argument("--fast-requests", type=int, default=5)
+        parser.add_argument(
+            "--head-start", type=float, default=1.0,
+            help="Seconds the slow uploads run before the first fast request",
+        )
+        parser.add_argument("--shop", default="", help="`shop` form field (Shopify usage counting)")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options["target"]:
+            name, sep, url = target.partition("=")
+            if not sep or not url.startswith("http://"):
+                raise CommandError(f"Expected NAME=http://host:port/path, got {target!r}")
+            targets.append((name, url))
+
+        fields = {"images": "url", "shop": options["shop"]}
+        content_type, body = multipart_body(options["photo"], fields)
+        rate_bps = options["rate_kbps"] * 1024
+        self.stdout.write(
+            f"{len(body) / 1024:.0f} KB upload; {options['slow_clients']} slow clients at "
+            f"{options['rate_kbps']:g} KB/s (~{len(body) / rate_bps:.1f} s each), "
+            f"{options['fast_requests']} fast requests\n"
+        )
+        self.stdout.write(
+            f"{'target':<10}{'fast p50 ms':>12}{'fast p95 ms':>12}{'slow p50 s':>11}"
+            f"{'slow max s':>11}{'ok':>5}  other statuses"
+        )
+        for name, url in targets:
+            slow, fast = asyncio.run(run_scenario(
+                url, content_type, body, options["slow_clients"], rate_bps,
+                options["fast_requests"], options["head_start"],
+            ))
+            results = slow + fast
+            statuses = Counter(status for status, _ in results)
+            ok = statuses.pop(200, 0)
+            other = ", ".join(f"{status or 'conn'}x{count}" for status, count in sorted(statuses.items()))
+            slow_times = sorted(seconds for _, seconds in slow)
+            fast_times = [seconds for _, seconds in fast]
+            self.stdout.write(
+                f"{name:<10}{percentile_ms(fast_times, 50):>12.0f}{percentile_ms(fast_times, 95):>12.0f}"
+                f"{percentile_ms(slow_times, 50) / 1000:>11.1f}{(slow_times[-1] if slow_times else 0):>11.1f}"
+                f"{ok:>5}  {other or '-'}"
+            )
+
+        self.stdout.write(
+            "\nfast: latency of a full-speed upload while the slow uploads are in progress. "
+            "With sync workers each slow upload holds a worker thread until its body has arrived; "
+            "the ASGI endpoints only take an inference thread once it has."
+        )
@@ -0,0 +1,44 @@
+import os
+
+import torch
+from django.core.management.base import BaseCommand, CommandError
+
+from recommender.AImodels.classifiers import MODEL_PATHS, load_torch_models
+from recommender.AImodels.precision import int8_path, quantize_static
+from ._samples import iter_face_samples, model_inputs
+
+
+class Command(BaseCommand):
+    help = (
+        "Calibrate static INT8 versions of the classifiers on a folder of face photos "
+        "and save them next to the FP32 weights (used by INFERENCE_PRECISION=int8_static)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("folder", help="Folder of representative photos (searched recursively)")
+        parser.add_argument("--limit", type=int, default=200, help="Maximum number of images to use")
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options["folder"]):
+            raise CommandError(f"{options['folder']} is not a directory")
+
+        calibration = {name: [] for name in MODEL_PATHS}
+        for sample in iter_face_samples(options["folder"], options["limit"], stderr=self.stderr):
+            for name, tensors in model_inputs(sample).items():
+                calibration[name].extend(tensors)
+
+        if not calibration["skin_type"]:
+            raise CommandError("No usable face photos found")
+        self.stdout.write(f"Calibrating on {len(calibration['skin_type'])} faces")
+
+        for name, model in load_torch_models().items():
+            model = model.cpu().eval()
+            quantized = quantize_static(name, model, calibration[name])
+            path = int8_path(MODEL_PATHS[name])
+            torch.save(quantized.state_dict(), path)
+            fp32_mb = os.path.getsize(MODEL_PATHS[name]) / 1024 / 1024
+            int8_mb = os.path.getsize(path) / 1024 / 1024
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: wrote {path} ({fp32_mb:.1f} MB -> {int8_mb:.1f} MB, "
+                f"{len(calibration[name])} calibration inputs)"
+            ))
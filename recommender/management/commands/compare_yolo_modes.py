@@ -0,0 +1,119 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ._samples import iter_face_samples, percentile_ms
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_detections(reference, candidate, iou_threshold):
+    """Greedy one-to-one matching of same-label boxes; returns the matched IoUs."""
+    pairs = sorted(
+        (
+            (box_iou(r["bbox"], c["bbox"]), i, j)
+            for i, r in enumerate(reference)
+            for j, c in enumerate(candidate)
+            if r["label"] == c["label"]
+        ),
+        reverse=True,
+    )
+    used_r, used_c, ious = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i in used_r or j in used_c:
+            continue
+        used_r.add(i)
+        used_c.add(j)
+        ious.append(iou)
+    return ious
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare defect boxes from best.pt (INFERENCE_YOLO_MODE=both) with boxes derived "
+        "from the segmentation model (seg_only) on a folder of face photos"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("folder", help="Folder of face photos (searched recursively)")
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--iou", type=float, default=0.5, help="IoU needed for two boxes to agree")
+
+    def handle(self, *args, **options):
+        from recommender.AImodels.yolo_model import detect_skin_defects_yolo, yolo_model
+        from recommender.AImodels.segment_skin_conditions_yolo import (
+            DETECTION_LABELS, segment_skin_conditions, segment_and_detect,
+        )
+
+        images = detector_boxes = derived_boxes = 0
+        ious = []
+        detector_labels, derived_labels = Counter(), Counter()
+        both_seconds, seg_only_seconds = [], []
+
+        for sample in iter_face_samples(options["folder"], options["limit"], stderr=self.stderr):
+            started = time.perf_counter()
+            reference, annotated = detect_skin_defects_yolo(sample.face)
+            overlay, _ = segment_skin_conditions(sample.face)
+            both_seconds.append(time.perf_counter() - started)
+            annotated.close()
+            overlay.close()
+
+            started = time.perf_counter()
+            overlay, _, candidate, annotated = segment_and_detect(sample.face)
+            seg_only_seconds.append(time.perf_counter() - started)
+            annotated.close()
+            overlay.close()
+
+            images += 1
+            detector_boxes += len(reference)
+            derived_boxes += len(candidate)
+            detector_labels.update(d["label"] for d in reference)
+            derived_labels.update(d["label"] for d in candidate)
+            ious.extend(match_detections(reference, candidate, options["iou"]))
+
+        if not images:
+            raise CommandError("No usable face photos found")
+
+        matched = len(ious)
+        self.stdout.write(f"images:                     {images}")
+        self.stdout.write(f"best.pt boxes:              {detector_boxes}")
+        self.stdout.write(f"seg-derived boxes:          {derived_boxes}")
+        self.stdout.write(f"agreeing (IoU >= {options['iou']}):     {matched}")
+        if detector_boxes:
+            self.stdout.write(f"recall vs best.pt:          {matched / detector_boxes:.1%}")
+        if derived_boxes:
+            self.stdout.write(f"precision vs best.pt:       {matched / derived_boxes:.1%}")
+        if ious:
+            self.stdout.write(f"mean IoU of agreeing boxes: {sum(ious) / len(ious):.3f}")
+
+        self.stdout.write("")
+        self.stdout.write(f"{'label':<24}{'best.pt':>10}{'seg-derived':>13}")
+        for label in sorted(set(detector_labels) | set(derived_labels)):
+            self.stdout.write(f"{label:<24}{detector_labels[label]:>10}{derived_labels[label]:>13}")
+
+        detector_names = set(yolo_model.names.values())
+        unmapped = sorted(set(derived_labels) - detector_names)
+        if unmapped:
+            self.stdout.write(
+                f"seg labels with no best.pt class (add them to DETECTION_LABELS, "
+                f"currently {len(DETECTION_LABELS)} entries): {', '.join(unmapped)}"
+            )
+
+        self.stdout.write("")
+        self.stdout.write(
+            f"YOLO time per face, both: p50 {percentile_ms(both_seconds, 50):.1f} ms, "
+            f"p95 {percentile_ms(both_seconds, 95):.1f} ms"
+        )
+        self.stdout.write(
+            f"YOLO time per face, seg_only: p50 {percentile_ms(seg_only_seconds, 50):.1f} ms, "
+            f"p95 {percentile_ms(seg_only_seconds, 95):.1f} ms"
+        )
@@ -0,0 +1,76 @@
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
+import torch
+from django.core.management.base import BaseCommand
+
+from recommender.AImodels.classifiers import INPUT_SIZES, MODEL_PATHS, load_torch_models, safetensors_path
+
+MB = 1024 * 1024
+
+
+def _memory():
+    info = psutil.Process().memory_info()
+    # RSS minus file-backed/shared pages: what this process holds privately
+    return info.rss, info.rss - info.shared
+
+
+def _measure_load(mmap):
+    """Runs in a fresh process so each format starts from the same baseline."""
+    torch.set_num_threads(1)
+    rss_before, private_before = _memory()
+
+    started = time.perf_counter()
+    models = load_torch_models(mmap=mmap)
+    seconds = time.perf_counter() - started
+    rss_loaded, private_loaded = _memory()
+
+    with torch.no_grad():
+        for name, model in models.items():
+            model(torch.rand(1, 3, INPUT_SIZES[name], INPUT_SIZES[name]))
+    rss_used, private_used = _memory()
+
+    return seconds, rss_before, rss_loaded, rss_used, private_before, private_loaded, private_used
+
+
+class Command(BaseCommand):
+    help = "Convert the classifier .pth weights to memory-mappable .safetensors and compare load cost"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-convert", action="store_true", help="Only run the load comparison")
+
+    def handle(self, *args, **options):
+        from safetensors.torch import save_file
+
+        if not options["skip_convert"]:
+            for name, path in MODEL_PATHS.items():
+                state = torch.load(path, map_location="cpu")
+                # safetensors stores each tensor on its own, contiguously
+                state = {key: tensor.detach().contiguous().clone() for key, tensor in state.items()}
+                target = safetensors_path(path)
+                save_file(state, target, metadata={"source": os.path.basename(path)})
+                self.stdout.write(self.style.SUCCESS(
+                    f"{name}: wrote {target} ({os.path.getsize(target) / MB:.1f} MB)"
+                ))
+
+        ctx = mp.get_context("spawn")
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'format':<13}{'load s':>8}{'RSS before':>12}{'RSS loaded':>12}{'RSS used':>10}"
+            f"{'private loaded':>16}{'private used':>14}"
+        )
+        for label, mmap in (("pth", False), ("safetensors", True)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                result = executor.submit(_measure_load, mmap).result()
+            seconds, rss_before, rss_loaded, rss_used, private_before, private_loaded, private_used = result
+            self.stdout.write(
+                f"{label:<13}{seconds:>8.3f}{rss_before / MB:>12.1f}{rss_loaded / MB:>12.1f}{rss_used / MB:>10.1f}"
+                f"{(private_loaded - private_before) / MB:>+16.1f}{(private_used - private_before) / MB:>+14.1f}"
+            )
+        self.stdout.write(
+            "RSS in MB; 'private' is anonymous memory added by the models. Mapped weights "
+            "count as file-backed pages, shared by every process through the page cache."
+        )
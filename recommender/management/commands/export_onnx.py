@@ -0,0 +1,54 @@
+import torch
+from django.core.management.base import BaseCommand
+
+from recommender.AImodels.classifiers import INPUT_SIZES, MODEL_PATHS, load_torch_models
+from recommender.AImodels.onnx_backend import onnx_path
+
+
+class Command(BaseCommand):
+    help = "Export the skin-type, eye-color and acne classifiers to ONNX (next to their .pth files)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--opset", type=int, default=17)
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Run each exported model in ONNX Runtime and compare with PyTorch",
+        )
+
+    def handle(self, *args, **options):
+        models = load_torch_models()
+
+        for name, model in models.items():
+            model = model.cpu().eval()
+            size = INPUT_SIZES[name]
+            dummy = torch.rand(1, 3, size, size)
+            path = onnx_path(MODEL_PATHS[name])
+
+            input_axes = {0: "batch"}
+            if name == "acne":
+                # Adaptive acne resolution (ACNE_RESOLUTIONS) needs free spatial dims
+                input_axes.update({2: "height", 3: "width"})
+
+            torch.onnx.export(
+                model, dummy, path,
+                input_names=["input"],
+                output_names=["logits"],
+                dynamic_axes={"input": input_axes, "logits": {0: "batch"}},
+                opset_version=options["opset"],
+                do_constant_folding=True,
+            )
+            self.stdout.write(self.style.SUCCESS(f"{name}: wrote {path}"))
+
+            if options["check"]:
+                self._check(name, model, path, size)
+
+    def _check(self, name, model, path, size):
+        import onnxruntime as ort
+
+        session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        x = torch.rand(2, 3, size, size)
+        with torch.no_grad():
+            expected = model(x).numpy()
+        actual = session.run(None, {"input": x.numpy()})[0]
+        diff = abs(expected - actual).max()
+        self.stdout.write(f"{name}: max |torch - onnx| logit difference {diff:.2e}")
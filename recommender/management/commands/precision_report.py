@@ -0,0 +1,92 @@
+import os
+import time
+
+import torch
+from django.core.management.base import BaseCommand, CommandError
+
+from recommender.AImodels.classifiers import CLASS_LABELS, MODEL_PATHS, load_torch_models
+from recommender.AImodels.precision import PRECISION_MODES, apply_precision, int8_path
+from ._samples import iter_face_samples, model_inputs, percentile_ms
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a folder of labeled face photos through each precision mode and report "
+        "label agreement with FP32 and p50/p95 latency per model"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "folder",
+            help="Folder of photos; images in sub-folders named after a class label "
+                 "(e.g. oily/, Clear/) are also scored against that label",
+        )
+        parser.add_argument("--modes", default=",".join(PRECISION_MODES))
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed runs per model and mode")
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options["folder"]):
+            raise CommandError(f"{options['folder']} is not a directory")
+        modes = [m.strip() for m in options["modes"].split(",") if m.strip()]
+        unknown = set(modes) - set(PRECISION_MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes {sorted(unknown)}, expected {PRECISION_MODES}")
+        if "fp32" not in modes:
+            modes.insert(0, "fp32")
+
+        samples = list(iter_face_samples(options["folder"], options["limit"], stderr=self.stderr))
+        if not samples:
+            raise CommandError("No usable face photos found")
+        inputs = [model_inputs(sample) for sample in samples]
+        truth = [sample.label for sample in samples]
+        self.stdout.write(f"{len(samples)} faces, modes: {', '.join(modes)}\n")
+
+        base_models = {name: model.cpu().eval() for name, model in load_torch_models().items()}
+        reference = None
+        for mode in modes:
+            if mode == "int8_static" and not all(os.path.exists(int8_path(p)) for p in MODEL_PATHS.values()):
+                self.stdout.write(self.style.WARNING("int8_static: skipped, run `manage.py calibrate_int8` first\n"))
+                continue
+
+            predictions, latencies = self._run_mode(mode, base_models, inputs, options["warmup"])
+            if reference is None:
+                reference = predictions
+            self._report(mode, predictions, reference, latencies, truth)
+
+    def _run_mode(self, mode, base_models, inputs, warmup):
+        predictions, latencies = {}, {}
+        for name, base_model in base_models.items():
+            model = apply_precision(name, base_model, mode)
+            tensors = [t for sample_inputs in inputs for t in sample_inputs[name]]
+            with torch.no_grad():
+                for t in tensors[:warmup]:
+                    model(t)
+                preds, times = [], []
+                for t in tensors:
+                    started = time.perf_counter()
+                    out = model(t)
+                    times.append(time.perf_counter() - started)
+                    preds.append(CLASS_LABELS[name][int(out.argmax(dim=1))])
+            predictions[name], latencies[name] = preds, times
+        return predictions, latencies
+
+    def _report(self, mode, predictions, reference, latencies, truth):
+        self.stdout.write(self.style.MIGRATE_HEADING(mode))
+        for name, preds in predictions.items():
+            agree = sum(p == r for p, r in zip(preds, reference[name])) / len(preds) if preds else 0.0
+            line = (
+                f"  {name:<10} agreement with fp32 {agree * 100:6.2f}%  "
+                f"p50 {percentile_ms(latencies[name], 50):7.2f} ms  "
+                f"p95 {percentile_ms(latencies[name], 95):7.2f} ms"
+            )
+            # Eye colors have one prediction per open eye, so only score
+            # models with exactly one prediction per image.
+            labels = {label.lower() for label in CLASS_LABELS[name]}
+            if len(preds) == len(truth):
+                scored = [(p, t) for p, t in zip(preds, truth) if t.lower() in labels]
+                if scored:
+                    accuracy = sum(p.lower() == t.lower() for p, t in scored) / len(scored)
+                    line += f"  accuracy {accuracy * 100:6.2f}% (n={len(scored)})"
+            self.stdout.write(line)
+        self.stdout.write("")
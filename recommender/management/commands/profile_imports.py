@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter under `-X importtime`. With --deny-network every
+# non-Unix socket connection (and DNS lookup) fails and is recorded, so a cold
+# start that still reaches for the network shows up in the report.
+CHILD = """
+import json, socket, sys
+attempts = []
+if {deny_network}:
+    def _deny(what):
+        attempts.append(what)
+        raise OSError("network access disabled by profile_imports")
+    _connect = socket.socket.connect
+    def connect(self, address):
+        if self.family == socket.AF_UNIX:
+            return _connect(self, address)
+        _deny(f"connect {{address!r}}")
+    socket.socket.connect = connect
+    socket.getaddrinfo = lambda host, *a, **k: _deny(f"resolve {{host!r}}")
+import django
+django.setup()
+error = None
+try:
+    __import__({module!r})  # importlib.import_module() bypasses -X importtime
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+print(json.dumps({{"network": attempts, "error": error}}))
+"""
+
+
+def parse_importtime(stderr):
+    """[(name, self_us, cumulative_us)] from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Profile worker boot: per-module import time of recommender.AImodels (models load at import)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--module", default="recommender.AImodels.pipeline", help="Module to import")
+        parser.add_argument("--top", type=int, default=15, help="How many third-party packages to list")
+        parser.add_argument(
+            "--deny-network", action="store_true",
+            help="Fail and report any network access during the import",
+        )
+
+    def handle(self, *args, **options):
+        code = CHILD.format(module=options["module"], deny_network=options["deny_network"])
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "makeupAI_hosted.settings")}
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, env=env, cwd=os.getcwd(),
+        )
+        try:
+            outcome = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            raise CommandError(f"Import profiling failed:\n{proc.stderr[-2000:]}")
+
+        rows = parse_importtime(proc.stderr)
+        total = max((c for name, _, c in rows if name == options["module"]), default=0)
+
+        self.stdout.write(f"{'recommender.AImodels module':<50}{'self ms':>10}{'cumul. ms':>11}")
+        for name, self_us, cumulative_us in rows:
+            if name.startswith("recommender.AImodels"):
+                self.stdout.write(f"{name:<50}{self_us / 1000:>10.1f}{cumulative_us / 1000:>11.1f}")
+
+        # Third-party top-level packages, by their own cumulative import time
+        packages = {}
+        for name, _, cumulative_us in rows:
+            if "." not in name and not name.startswith(("recommender", "_")):
+                packages[name] = max(packages.get(name, 0), cumulative_us)
+        self.stdout.write("")
+        self.stdout.write(f"{'slowest packages':<50}{'':>10}{'cumul. ms':>11}")
+        for name, cumulative_us in sorted(packages.items(), key=lambda kv: -kv[1])[:options["top"]]:
+            self.stdout.write(f"{name:<50}{'':>10}{cumulative_us / 1000:>11.1f}")
+
+        self.stdout.write("")
+        self.stdout.write(f"import {options['module']}: {total / 1e6:.2f} s")
+        if outcome["error"]:
+            self.stderr.write(f"import failed: {outcome['error']}")
+        if options["deny_network"]:
+            if outcome["network"]:
+                self.stderr.write("network access attempted:")
+                for attempt in outcome["network"]:
+                    self.stderr.write(f"  {attempt}")
+            else:
+                self.stdout.write(self.style.SUCCESS("no network access"))
@@ -0,0 +1,25 @@
+import psutil
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recommender.jobs import serve
+
+
+class Command(BaseCommand):
+    help = "Run job-mode analysis workers that claim queued AnalysisJob rows (ANALYSIS_JOBS_ENABLED)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.JOB_WORKERS)
+        parser.add_argument(
+            "--threads", type=int, default=settings.INFERENCE_NUM_THREADS,
+            help="Torch threads per worker process (0 = physical cores / workers)",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        threads = options["threads"]
+        if threads <= 0:
+            threads = max(1, (psutil.cpu_count(logical=False) or 1) // workers)
+
+        self.stdout.write(f"Starting {workers} analysis job workers ({threads} torch threads each)")
+        serve(workers=workers, threads=threads)
@@ -0,0 +1,26 @@
+import psutil
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recommender.AImodels.inference_pool import serve
+
+
+class Command(BaseCommand):
+    help = "Run the dedicated inference processes that serve the web workers (INFERENCE_POOL_ENABLED)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.INFERENCE_POOL_SIZE)
+        parser.add_argument(
+            "--threads", type=int, default=settings.INFERENCE_POOL_TORCH_THREADS,
+            help="Torch threads per inference process (0 = physical cores / workers)",
+        )
+        parser.add_argument("--socket", default=settings.INFERENCE_POOL_SOCKET)
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        threads = options["threads"]
+        if threads <= 0:
+            threads = max(1, (psutil.cpu_count(logical=False) or 1) // workers)
+
+        self.stdout.write(f"Starting {workers} inference processes ({threads} torch threads each) on {options['socket']}")
+        serve(options["socket"], settings.SECRET_KEY.encode(), workers=workers, threads=threads)
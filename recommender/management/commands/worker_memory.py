@@ -0,0 +1,68 @@
+import os
+
+import psutil
+from django.core.management.base import BaseCommand, CommandError
+
+MB = 1024 * 1024
+
+
+def find_master(match):
+    """Oldest process whose command line contains `match` and whose parent doesn't."""
+    candidates = []
+    for proc in psutil.process_iter(["pid", "ppid", "cmdline", "create_time"]):
+        cmdline = " ".join(proc.info["cmdline"] or [])
+        if match not in cmdline or "worker_memory" in cmdline:
+            continue
+        try:
+            parent_cmdline = " ".join(psutil.Process(proc.info["ppid"]).cmdline())
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            parent_cmdline = ""
+        if match not in parent_cmdline:
+            candidates.append(proc)
+    if not candidates:
+        raise CommandError(f"No process matching {match!r} found; pass --pid")
+    return min(candidates, key=lambda p: p.info["create_time"])
+
+
+class Command(BaseCommand):
+    help = (
+        "Report RSS/PSS/USS of a gunicorn (or inference pool) master and its workers. "
+        "Run with different WEB_CONCURRENCY values: with working preload, the total "
+        "PSS grows by roughly the per-worker USS, not by the full model footprint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pid", type=int, help="Master process id (default: autodetect)")
+        parser.add_argument("--match", default="gunicorn", help="Command-line substring used to find the master")
+
+    def handle(self, *args, **options):
+        master = psutil.Process(options["pid"]) if options["pid"] else find_master(options["match"])
+        processes = [("master", master)] + [
+            ("worker", child) for child in master.children() if child.pid != os.getpid()
+        ]
+
+        self.stdout.write(f"{'role':<8}{'pid':>8}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}")
+        total_pss = total_uss = 0
+        worker_pss = []
+        for role, proc in processes:
+            try:
+                info = proc.memory_full_info()
+            except psutil.AccessDenied:
+                raise CommandError(f"Access denied reading /proc/{proc.pid}/smaps; run as the same user or root")
+            except psutil.NoSuchProcess:
+                continue
+            total_pss += info.pss
+            total_uss += info.uss
+            if role == "worker":
+                worker_pss.append(info.pss)
+            self.stdout.write(
+                f"{role:<8}{proc.pid:>8}{info.rss / MB:>10.1f}{info.pss / MB:>10.1f}{info.uss / MB:>10.1f}"
+            )
+
+        self.stdout.write("")
+        self.stdout.write(f"workers:              {len(worker_pss)}")
+        self.stdout.write(f"total PSS (footprint): {total_pss / MB:.1f} MB")
+        self.stdout.write(f"total USS (private):   {total_uss / MB:.1f} MB")
+        self.stdout.write(f"shared (PSS - USS):    {(total_pss - total_uss) / MB:.1f} MB")
+        if worker_pss:
+            self.stdout.write(f"mean PSS per worker:   {sum(worker_pss) / len(worker_pss) / MB:.1f} MB")
@@ -4,11 +4,13 @@ from django.utils.deprecation import MiddlewareMixin
 from django.utils.timezone import now
 from django.conf import settings
 from django.core.cache import cache
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
 
 class VisitorTrackingMiddleware(MiddlewareMixin):
     def process_request(self, request):
-        # 1. Skip middleware for webhooks and OAuth callback
-        if request.path.startswith("/webhooks/") or request.path.startswith("/auth/callback"):
+        # 1. Skip middleware for webhooks, OAuth callback, result images and job polls
+        if request.path.startswith(("/webhooks/", "/auth/callback", "/artifacts/", "/jobs/")):
             return 
 
         # 2. Cache CORS_ALLOWED_ORIGINS for 5 min instead of every request
@@ -92,4 +94,35 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
             return "Mobile"
         elif "tablet" in user_agent:
             return "Tablet"
-        return "Desktop"
\ No newline at end of file
+        return "Desktop"
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that also runs natively under ASGI. The stock middleware is
+    sync-only, which makes Django call everything below it (including the
+    async analysis views) through async_to_sync on a single thread, so
+    requests would be handled one at a time. Static files are still served
+    by WhiteNoise, off the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -109,6 +109,66 @@ class Purchase(models.Model):
     def expiry_date(self):
         return self.purchase_date + timezone.timedelta(days=self.usage_duration_days)
 
+#### analysis jobs ####
+import uuid
+
+class AnalysisJob(models.Model):
+    """
+    An upload accepted in job mode, analyzed by `manage.py run_analysis_workers`
+    on any node (see recommender/jobs.py). Rows are deleted once expired.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    SHOPIFY = 'shopify'
+    WORDPRESS = 'wordpress'
+
+    SOURCE_CHOICES = [
+        (SHOPIFY, 'Shopify'),
+        (WORDPRESS, 'WordPress'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+
+    # Decoded photo as PNG (lossless), emptied once the job has finished
+    image = models.BinaryField(blank=True)
+    # analyze_payload() options, and what to count once the analysis succeeds
+    options = models.JSONField(default=dict)
+    usage = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    worker = models.CharField(max_length=100, blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.source} job {self.pk} ({self.status})"
+
 #========================
 #this code will reset the allowed origins cache everytime new shop is added or edited
 
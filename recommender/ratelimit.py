@@ -0,0 +1,254 @@
+# recommender/ratelimit.py
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+# ----------------------
+# 🪣 Per-shop and per-IP rate limits
+# ----------------------
+# Token buckets in the Django cache, checked before the upload is decoded (and
+# before admission control), so one storefront hammering the analysis
+# endpoints can't take the inference capacity of every other tenant. Buckets
+# refill at `per_minute` tokens per minute up to `burst`.
+#
+# A request takes a token from its client IP's bucket (get_client_ip, which
+# only believes the X-Forwarded-For entries added by TRUSTED_PROXY_COUNT
+# proxies) and from the bucket of the shop it is for. The first request for an
+# alias resolves it (resolve_shop, one indexed lookup) and the result is kept
+# in the cache, so a storefront's first burst is already limited per shop:
+#
+# - WordPress requests name their shop by api_key and shop_url. When those
+#   authenticate, the shop's bucket uses its Plan's rates and replaces the IP
+#   bucket: a plugin's requests may all come from the WordPress server's
+#   address.
+# - Shopify requests are not authenticated: they are charged to the shop their
+#   `shop` field or Origin names (get_domain), the same shop their usage is
+#   counted against. Browsers set Origin themselves, but any other client can
+#   send either one, so the IP bucket stays in front of the shop bucket and
+#   bounds what one client can charge to someone else's shop.
+#
+# Aliases that don't resolve to a shop only have the IP bucket.
+#
+# Buckets only use cache.add() and cache.incr()/decr(), which are atomic in
+# the shared backends (Redis, Memcached), so the limits hold across workers and
+# nodes. With a per-process LocMemCache each worker would have its own buckets
+# and clients would get up to (workers x nodes) times the limits, so
+# RATE_LIMIT_ENABLED is off by default unless CACHE_BACKEND is a shared one
+# (enabling it anyway prints a warning).
+
+# Shop resolutions and plan rates are refreshed this often
+SHOP_CACHE_SECONDS = 300
+# Bucket counters are restarted (full) at the start of every epoch
+EPOCH_SECONDS = 3600
+
+
+def _cache_key(*parts) -> str:
+    # Domains and api keys come from the client: hash them into safe keys
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f"ratelimit:{parts[0]}:{digest}"
+
+
+def take_token(key, per_minute, burst, now=None) -> float:
+    """
+    Take a token from the bucket `key`. Returns 0 if one was available,
+    otherwise the seconds until one will be.
+
+    The bucket is a counter of tokens used since the start of the epoch;
+    the tokens available are `burst` plus the refill since then, minus that
+    count. Credit beyond `burst` (after an idle spell) is dropped by counting
+    it as used.
+    """
+    now = time.time() if now is None else now
+    rate = max(per_minute, 1e-6) / 60.0
+    burst = max(1, int(burst))
+    epoch = int(now // EPOCH_SECONDS)
+    counter = f"{key}:{epoch}"
+
+    cache.add(counter, 0, EPOCH_SECONDS * 2)
+    try:
+        used = cache.incr(counter)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.add(counter, 1, EPOCH_SECONDS * 2)
+        used = 1
+
+    allowance = burst + rate * (now - epoch * EPOCH_SECONDS)
+    if used > allowance:
+        # Rejected requests don't use up tokens
+        cache.decr(counter)
+        return (used - allowance) / rate
+
+    unused = math.floor(allowance - used) - (burst - 1)
+    if unused > 0:
+        cache.incr(counter, unused)
+    return 0.0
+
+
+class RateLimiter:
+    def __init__(self, enabled=True, shop_rate=(60, 10), ip_rate=(20, 5)):
+        self.enabled = enabled
+        self.shop_rate = shop_rate
+        self.ip_rate = ip_rate
+
+        self.checked = 0
+        self.rejected = Counter()
+        # Rejections per shop (alias until the shop has been resolved)
+        self.rejected_by_shop = Counter()
+        self._lock = threading.Lock()
+
+    # ----------------------
+    # Public API
+    # ----------------------
+    def check(self, ip, alias, resolve_shop=None):
+        """
+        (scope, retry_after) of the first bucket without a token for a
+        request from `ip` for the shop known as `alias`, or None if allowed.
+
+        An alias that isn't in the cache yet is resolved with
+        `resolve_shop()`, which returns remember_shop's (shop, plan,
+        authenticated) or None when no shop has that alias.
+        """
+        with self._lock:
+            self.checked += 1
+
+        resolved = self._resolve(alias, resolve_shop)
+
+        if ip and not (resolved and resolved[3]):
+            retry_after = take_token(_cache_key("ip", ip), *self.ip_rate)
+            if retry_after:
+                self._count("ip", alias)
+                return "ip", retry_after
+
+        if resolved:
+            shop, per_minute, burst, _ = resolved
+            retry_after = take_token(_cache_key("bucket", shop), per_minute, burst)
+            if retry_after:
+                self._count("shop", shop)
+                return "shop", retry_after
+        return None
+
+    def remember_shop(self, alias, shop, plan=None, authenticated=False):
+        """
+        Map `alias` to the bucket of `shop` (so a Shopify shop's domains share
+        one), with its plan's rates if it has a plan. Requests with an
+        `authenticated` alias (a valid api_key) skip the IP bucket.
+        """
+        if not alias:
+            return None
+        per_minute, burst = self.shop_rate
+        if plan is not None:
+            per_minute, burst = plan.rate_limit_per_minute, plan.rate_limit_burst
+        resolved = (shop, per_minute, burst, authenticated)
+        cache.set(_cache_key("alias", alias), resolved, SHOP_CACHE_SECONDS)
+        return resolved
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "checked": self.checked,
+            "rejected": dict(self.rejected),
+            "rejected_by_shop": dict(self.rejected_by_shop.most_common(20)),
+        }
+
+    # ----------------------
+    # Internals
+    # ----------------------
+    def _resolve(self, alias, resolve_shop):
+        if not alias:
+            return None
+        key = _cache_key("alias", alias)
+        resolved = cache.get(key)
+        if resolved is None and resolve_shop is not None:
+            found = resolve_shop()
+            if found:
+                resolved = self.remember_shop(alias, *found)
+            else:
+                # Remember misses too, or every request for an unknown
+                # alias would be a lookup
+                resolved = False
+                cache.set(key, resolved, SHOP_CACHE_SECONDS)
+        return resolved or None
+
+    def _count(self, scope, shop):
+        # No logging here: rejections are what a flood turns into
+        with self._lock:
+            self.rejected[scope] += 1
+            if shop:
+                self.rejected_by_shop[shop] += 1
+
+
+def _check_cache_backend(limiter):
+    if not limiter.enabled:
+        return
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend.endswith(".DummyCache"):
+        print("[RATELIMIT] WARNING: DummyCache keeps no counters, rate limiting is disabled")
+        limiter.enabled = False
+    elif backend.endswith(".LocMemCache"):
+        print(
+            "[RATELIMIT] WARNING: CACHE_BACKEND is per process (LocMemCache): every worker keeps its own "
+            "buckets, so clients get up to (workers x nodes) times RATE_LIMIT_*. Use Redis or Memcached."
+        )
+
+
+analysis_rate_limiter = RateLimiter(
+    enabled=settings.RATE_LIMIT_ENABLED,
+    shop_rate=(settings.RATE_LIMIT_SHOP_PER_MINUTE, settings.RATE_LIMIT_SHOP_BURST),
+    ip_rate=(settings.RATE_LIMIT_IP_PER_MINUTE, settings.RATE_LIMIT_IP_BURST),
+)
+_check_cache_backend(analysis_rate_limiter)
+
+
+def rate_limited(shop_alias, resolve_shop=None):
+    """
+    Decorator for the analysis views (sync or async): checks the client's IP
+    and the shop `shop_alias(request)` names before the view runs and
+    answers 429 with Retry-After when either is over its limit.
+    `resolve_shop(request)` looks the alias up (see RateLimiter.check).
+    """
+    def check(request):
+        from recommender.views import get_client_ip
+
+        if not analysis_rate_limiter.enabled or request.method != "POST":
+            return None
+        rejected = analysis_rate_limiter.check(
+            get_client_ip(request),
+            shop_alias(request),
+            (lambda: resolve_shop(request)) if resolve_shop else None,
+        )
+        if rejected is None:
+            return None
+        scope, retry_after = rejected
+        response = JsonResponse(
+            {"status": "rate_limited", "error": "Too many requests, please retry shortly.", "scope": scope},
+            status=429,
+        )
+        response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                response = await sync_to_async(check, thread_sensitive=False)(request)
+                if response is not None:
+                    return response
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = check(request)
+            if response is not None:
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
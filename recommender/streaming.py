@@ -0,0 +1,87 @@
+# recommender/streaming.py
+import json
+import queue
+import threading
+
+from django.db import connection
+from django.http import StreamingHttpResponse
+
+from recommender.AImodels.admission import analysis_admission
+from recommender.AImodels.artifacts import absolute_image_urls
+from recommender.AImodels.inference import InferenceUnavailable, analyze_payload_streaming
+from recommender.AImodels.memory import memory_governor
+
+# ----------------------
+# 📡 Streamed analyses (server-sent events)
+# ----------------------
+# The /stream/ endpoints answer with text/event-stream right after the upload
+# is decoded and send one event per payload section (response.PAYLOAD_SECTIONS)
+# as soon as its stage has finished, so the widget can show the skin type
+# while segmentation is still running:
+#
+#   event: skin_type / eye_colors / acne / yolo_boxes / segmentation_results / images
+#   data: {<the section's payload fields>}
+#
+# and finally "done" ({"status": "success", ...usage}) or "error"
+# ({"error": message, "status": <the status the JSON endpoint would use>}).
+
+
+def sse_event(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_analysis(request, frame, options, finish, slot=None):
+    """
+    Start analyzing a decoded frame and return a generator of its SSE
+    messages. The models run on a background thread, which also calls
+    `finish(payload)` once the analysis succeeded: it does the usage
+    bookkeeping and returns the body of the "done" event, so usage is
+    counted even if the client disconnects before the last event. The
+    admission `slot` the view acquired is released when the thread ends.
+    """
+    events = queue.Queue()
+
+    def on_section(name, fields):
+        events.put((name, fields))
+
+    def run():
+        try:
+            payload, _ = analyze_payload_streaming(frame, on_section, **options)
+            if "error" in payload:
+                events.put(("error", {"error": payload["error"], "status": 400}))
+            else:
+                events.put(("done", finish(payload)))
+        except InferenceUnavailable as e:
+            events.put(("error", {"error": str(e), "status": 503}))
+        except Exception as e:
+            events.put(("error", {"error": str(e), "status": 500}))
+        finally:
+            events.put(None)
+            analysis_admission.release(slot)
+            memory_governor.after_request()
+            # finish() may have used this thread's own database connection
+            connection.close()
+
+    thread = threading.Thread(target=run, name="analysis-stream", daemon=True)
+    thread.start()
+    return _relay_events(request, events, thread)
+
+
+def _relay_events(request, events, thread):
+    # Sent right away so proxies and the client see the stream has started
+    yield ": analysis started\n\n"
+    while True:
+        item = events.get()
+        if item is None:
+            break
+        event, data = item
+        yield sse_event(event, absolute_image_urls(data, request) if event == "images" else data)
+    thread.join()
+
+
+def event_stream_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Don't let nginx buffer the events
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -1,3 +1,1332 @@
-from django.test import TestCase
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import torch
+from PIL import Image
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from recommender.AImodels.admission import AdmissionController, Overloaded
+from recommender.AImodels.annotate import simplify_polygon
+from recommender.AImodels.artifacts import LocalArtifactStore, artifact_key, artifact_url, artifacts_available
+from recommender.AImodels.batching import MicroBatcher
+from recommender.AImodels.classifiers import (
+    MODEL_PATHS, TYPE_INPUT_SIZE, EYE_INPUT_SIZE, ACNE_INPUT_SIZE, AcneResNet, EyeColorResNet, SkinCNN, SkinTypeLogits,
+    load_torch_models, load_weights, pick_acne_resolution, safetensors_path,
+)
+from recommender.AImodels.encoding import encode_image, encode_images
+from recommender.AImodels.inference_pool import InferencePoolClient, InferenceUnavailable, _worker_main
+from recommender.AImodels.instance_pool import InstancePool
+from recommender.AImodels.memory import MB, MemoryGovernor
+from recommender.AImodels.onnx_backend import onnx_path
+from recommender.AImodels.precision import Bf16Autocast, apply_precision
+from recommender.AImodels.preprocess import (
+    decode_image, crop_region, to_input_tensor,
+)
+from recommender.AImodels.response import build_analysis_payload
+from recommender.AImodels.result_cache import ResultCache
+from recommender.AImodels.stages import StageExecutor
+from recommender.models import AnalysisJob, FaceAnalysis
+from recommender.ratelimit import EPOCH_SECONDS, RateLimiter, take_token
+from wordPress.models import Plan, WordpressShop
+
+
+def _peak_allocation(fn):
+    """Peak traced allocation (bytes) while running fn()."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 4, 3), torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten(), torch.nn.Linear(4, 2),
+        ).eval()
+
+    def test_batched_outputs_match_unbatched(self):
+        batcher = MicroBatcher("test", self.model, enabled=True, max_batch_size=4, max_wait_ms=500)
+        inputs = [torch.randn(1, 3, 16, 16) for _ in range(3)] + [torch.randn(2, 3, 16, 16)]
+        futures = [batcher.submit(x) for x in inputs]
+
+        for x, future in zip(inputs, futures):
+            with torch.no_grad():
+                expected = self.model(x)
+            torch.testing.assert_close(future.result(timeout=5), expected, atol=1e-5, rtol=1e-5)
+        # The pair doesn't fit next to the three single images: batches of 3 and 2
+        self.assertEqual(dict(batcher.batch_sizes), {3: 1, 2: 1})
+
+    def test_inputs_of_different_sizes_are_run_separately(self):
+        batcher = MicroBatcher("test", self.model, enabled=True, max_batch_size=2, max_wait_ms=500)
+        small, large = torch.randn(1, 3, 16, 16), torch.randn(1, 3, 24, 24)
+        futures = [batcher.submit(small), batcher.submit(large)]
+        self.assertEqual([tuple(f.result(timeout=5).shape) for f in futures], [(1, 2), (1, 2)])
+        self.assertEqual(dict(batcher.batch_sizes), {1: 2})
+
+    def test_model_errors_reach_every_caller(self):
+        def broken(inputs):
+            raise RuntimeError("model failed")
+
+        batcher = MicroBatcher("test", broken, enabled=True, max_batch_size=2, max_wait_ms=500)
+        futures = [batcher.submit(torch.randn(1, 3, 8, 8)) for _ in range(2)]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, "model failed"):
+                future.result(timeout=5)
+
+    def test_disabled_runs_on_the_callers_thread(self):
+        batcher = MicroBatcher("test", self.model, enabled=False)
+        x = torch.randn(1, 3, 16, 16)
+        with torch.no_grad():
+            torch.testing.assert_close(batcher.run(x), self.model(x))
+        self.assertIsNone(batcher._thread)
+
+
+class MemoryGovernorTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("recommender.AImodels.memory.current_rss", return_value=1000 * MB)
+        self.rss = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_n_collects_after_n_requests(self):
+        governor = MemoryGovernor(policy="every_n", every_n=3)
+        for _ in range(7):
+            governor.after_request()
+        self.assertEqual((governor.requests, governor.collections), (7, 2))
+
+    def test_rss_policy_collects_above_threshold_once_per_regrowth(self):
+        governor = MemoryGovernor(policy="rss", rss_threshold_mb=500)
+        governor.after_request()
+        governor.after_request()
+        # The heap stays large after the collection: not collected again until it grows
+        self.assertEqual(governor.collections, 1)
+        self.rss.return_value = 1100 * MB
+        governor.after_request()
+        self.assertEqual(governor.collections, 2)
+
+    def test_off_never_collects(self):
+        governor = MemoryGovernor(policy="off")
+        for _ in range(50):
+            governor.after_request()
+        self.assertEqual(governor.collections, 0)
+
+    def test_unknown_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MemoryGovernor(policy="always")
+
+    def test_recycle_signals_a_gunicorn_worker_once(self):
+        governor = MemoryGovernor(policy="off", recycle_rss_mb=800)
+        with mock.patch.dict("sys.modules", {"gunicorn": mock.Mock()}), \
+                mock.patch("recommender.AImodels.memory.os.kill") as kill:
+            governor.after_request()
+            governor.after_request()
+        self.assertTrue(governor.recycle_requested)
+        kill.assert_called_once()
+
+
+class PrecisionModeTests(SimpleTestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = SkinTypeLogits(SkinCNN()).eval()
+        self.inputs = torch.randn(4, 3, TYPE_INPUT_SIZE, TYPE_INPUT_SIZE)
+        with torch.no_grad():
+            self.expected = self.model(self.inputs).softmax(dim=1)
+
+    def _probabilities(self, model):
+        with torch.no_grad():
+            return model(self.inputs).float().softmax(dim=1)
+
+    def test_int8_dynamic_keeps_the_predictions(self):
+        quantized = apply_precision("skin_type", self.model, "int8_dynamic")
+        self.assertIsNot(quantized, self.model)
+        probabilities = self._probabilities(quantized)
+        torch.testing.assert_close(probabilities, self.expected, atol=0.02, rtol=0)
+        self.assertTrue(torch.equal(probabilities.argmax(dim=1), self.expected.argmax(dim=1)))
+
+    def test_bf16_falls_back_to_fp32_without_cpu_support(self):
+        with mock.patch("recommender.AImodels.precision.cpu_supports_bf16", return_value=False):
+            self.assertIs(apply_precision("skin_type", self.model, "bf16"), self.model)
+        with mock.patch("recommender.AImodels.precision.cpu_supports_bf16", return_value=True):
+            autocast = apply_precision("skin_type", self.model, "bf16")
+        self.assertIsInstance(autocast, Bf16Autocast)
+        self.assertEqual(self._probabilities(autocast).dtype, torch.float32)
+
+    def test_static_int8_needs_calibrated_weights(self):
+        with mock.patch.dict("recommender.AImodels.precision.MODEL_PATHS", {"skin_type": "/nonexistent/skin_model.pth"}):
+            with self.assertRaisesRegex(FileNotFoundError, "calibrate_int8"):
+                apply_precision("skin_type", self.model, "int8_static")
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            apply_precision("skin_type", self.model, "fp8")
+
+
+class AcneResolutionTests(SimpleTestCase):
+    RUNGS = (640, 320, 448)
+
+    def test_smallest_rung_covering_the_crop(self):
+        self.assertEqual(pick_acne_resolution(200, 150, self.RUNGS), 320)
+        self.assertEqual(pick_acne_resolution(300, 320, self.RUNGS), 320)
+        self.assertEqual(pick_acne_resolution(321, 100, self.RUNGS), 448)
+        self.assertEqual(pick_acne_resolution(500, 600, self.RUNGS), 640)
+
+    def test_large_crops_are_capped_at_the_largest_rung(self):
+        self.assertEqual(pick_acne_resolution(2000, 1500, self.RUNGS), 640)
+        self.assertEqual(pick_acne_resolution(900, 900, [512]), 512)
+
+    def test_acne_model_accepts_every_rung(self):
+        model = AcneResNet(num_classes=5).eval()
+        for size in sorted(self.RUNGS):
+            with torch.no_grad():
+                logits = model(torch.zeros(1, 3, size, size))
+            self.assertEqual(tuple(logits.shape), (1, 5))
+
+
+class InferencePoolTests(SimpleTestCase):
+    def _serve(self, run_analysis, requests):
+        """Run one pool worker on a thread for `requests` requests; returns a client for it."""
+        from multiprocessing.connection import Listener
+
+        address = os.path.join(tempfile.mkdtemp(), "pool.sock")
+        listener = Listener(address, family="AF_UNIX", authkey=b"test")
+        pipeline = mock.Mock(run_analysis=run_analysis)
+        served = []
+        governor = mock.Mock(recycle_requested=False)
+
+        def after_request():
+            # Leave the accept loop once the expected requests were served
+            served.append(1)
+            governor.recycle_requested = len(served) >= requests
+
+        governor.after_request.side_effect = after_request
+        patches = (
+            mock.patch.dict(sys.modules, {"recommender.AImodels.pipeline": pipeline}),
+            mock.patch("recommender.AImodels.memory.memory_governor", governor),
+            # signal.signal() only works on the main thread
+            mock.patch("recommender.AImodels.inference_pool.signal.signal"),
+            # Client and worker share this process' resource tracker
+            mock.patch("recommender.AImodels.inference_pool.resource_tracker"),
+        )
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        worker = threading.Thread(target=_worker_main, args=(listener, torch.get_num_threads()), daemon=True)
+        worker.start()
+        self.addCleanup(listener.close)
+        self.addCleanup(worker.join, 5)
+        return InferencePoolClient(address, b"test", timeout=5)
+
+    def test_frame_is_handed_over_through_shared_memory(self):
+        def run_analysis(frame, overlay):
+            return {"sum": int(frame.sum()), "shape": frame.shape, "writeable": frame.flags.writeable, "overlay": overlay}
+
+        client = self._serve(run_analysis, requests=1)
+        frame = np.random.default_rng(0).integers(0, 255, (48, 32, 3), dtype=np.uint8)
+        result = client.analyze(frame, overlay="vector")
+        self.assertEqual(result, {"sum": int(frame.sum()), "shape": (48, 32, 3), "writeable": False, "overlay": "vector"})
+        self.assertEqual(client.stats()["requests"], 1)
+
+    def test_worker_errors_are_raised_in_the_client(self):
+        def run_analysis(frame, overlay):
+            raise KeyError("left_eye")
+
+        client = self._serve(run_analysis, requests=1)
+        with self.assertRaisesRegex(RuntimeError, "KeyError"):
+            client.analyze(np.zeros((4, 4, 3), np.uint8))
+        self.assertEqual(client.stats()["failures"], 1)
+
+    def test_missing_pool_is_unavailable(self):
+        client = InferencePoolClient(os.path.join(tempfile.mkdtemp(), "none.sock"), b"test")
+        with self.assertRaises(InferenceUnavailable):
+            client.analyze(np.zeros((4, 4, 3), np.uint8))
+
+
+@skipUnless(importlib.util.find_spec("safetensors"), "safetensors is not installed")
+class WeightLoadingTests(SimpleTestCase):
+    def setUp(self):
+        from safetensors.torch import save_file
+
+        torch.manual_seed(0)
+        state = AcneResNet(num_classes=5).state_dict()
+        self.path = os.path.join(tempfile.mkdtemp(), "acne.pth")
+        torch.save(state, self.path)
+        self.build = lambda: AcneResNet(num_classes=5)
+        save_file({key: tensor.contiguous() for key, tensor in state.items()}, safetensors_path(self.path))
+
+    def _logits(self, model):
+        torch.manual_seed(1)
+        with torch.no_grad():
+            return model.eval()(torch.rand(2, 3, 96, 96))
+
+    def test_safetensors_and_pth_load_the_same_model(self):
+        mapped = load_weights(self.build, self.path, mmap=True)
+        loaded = load_weights(self.build, self.path, mmap=False)
+        self.assertTrue(getattr(mapped, "weights_mmapped", False))
+        self.assertFalse(getattr(loaded, "weights_mmapped", False))
+        self.assertFalse(any(p.is_meta for p in mapped.parameters()))
+        self.assertEqual(mapped.state_dict().keys(), loaded.state_dict().keys())
+        torch.testing.assert_close(self._logits(mapped), self._logits(loaded), atol=0, rtol=0)
+
+    def test_falls_back_to_pth_without_a_converted_file(self):
+        os.remove(safetensors_path(self.path))
+        model = load_weights(self.build, self.path, mmap=True)
+        self.assertFalse(getattr(model, "weights_mmapped", False))
+
+
+class OfflineColdStartTests(SimpleTestCase):
+    def test_inference_models_are_built_without_pretrained_weights(self):
+        with mock.patch("torchvision.models._api.load_state_dict_from_url", side_effect=AssertionError("download")), \
+                mock.patch("torch.hub.load_state_dict_from_url", side_effect=AssertionError("download")):
+            EyeColorResNet(num_classes=6)
+            AcneResNet(num_classes=5)
+            # Training still starts from the ImageNet weights
+            with self.assertRaisesRegex(AssertionError, "download"):
+                EyeColorResNet(num_classes=6, pretrained=True)
+
+    def test_ultralytics_runs_offline(self):
+        if settings.INFERENCE_OFFLINE:
+            self.assertEqual(os.environ.get("YOLO_OFFLINE"), "True")
+
+
+class StageExecutorTests(SimpleTestCase):
+    def test_stages_run_concurrently(self):
+        executor = StageExecutor("test", max_workers=3)
+        # Only passes if all three stages are running at the same time
+        barrier = threading.Barrier(3, timeout=5)
+
+        def stage(value):
+            return lambda: (barrier.wait(), value)[1]
+
+        results, timings = executor.run({"type": stage(1), "yolo": stage(2), "seg": stage(3)})
+        self.assertEqual(results, {"type": 1, "yolo": 2, "seg": 3})
+        self.assertEqual(set(timings), {"type", "yolo", "seg", "total"})
+
+    def test_first_error_is_raised_after_every_stage_finished(self):
+        executor = StageExecutor("test", max_workers=3)
+        finished = []
+
+        def fails(message):
+            def stage():
+                raise RuntimeError(message)
+            return stage
+
+        def slow():
+            time.sleep(0.05)
+            finished.append("slow")
+
+        with self.assertRaisesRegex(RuntimeError, "first"):
+            executor.run({"slow": slow, "a": fails("first"), "b": fails("second")})
+        self.assertEqual(finished, ["slow"])
+
+    def test_on_done_reports_each_successful_stage(self):
+        done = []
+        executor = StageExecutor("test", max_workers=2)
+        executor.run({"a": lambda: 1, "b": lambda: 2}, on_done=lambda name, result: done.append((name, result)))
+        self.assertEqual(sorted(done), [("a", 1), ("b", 2)])
+
+    def test_on_done_error_is_raised_after_every_stage_finished(self):
+        executor = StageExecutor("test", max_workers=2)
+        finished = []
+
+        def slow():
+            time.sleep(0.05)
+            finished.append("slow")
+
+        def on_done(name, result):
+            if name == "fast":
+                raise RuntimeError("on_done")
+
+        with self.assertRaisesRegex(RuntimeError, "on_done"):
+            executor.run({"fast": lambda: 1, "slow": slow}, on_done=on_done)
+        self.assertEqual(finished, ["slow"])
+        self.assertEqual(executor.runs, 1)
+
+    def test_single_worker_runs_on_the_callers_thread(self):
+        executor = StageExecutor("test", max_workers=1)
+        results, _ = executor.run({"a": lambda: threading.current_thread().name, "b": lambda: 2})
+        self.assertEqual(results["a"], threading.current_thread().name)
+        self.assertIsNone(executor._pool)
+
+
+class SingleDecodePipelineTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        pil_image = Image.fromarray(rng.integers(0, 256, (1200, 1600, 3), dtype=np.uint8))
+        buffered = io.BytesIO()
+        pil_image.save(buffered, format="JPEG")
+        self.upload = buffered.getvalue()
+        self.frame = decode_image(self.upload)
+
+        # Synthetic face box in the middle of the frame and two eye boxes inside it
+        self.face_xy = ([500, 1100], [300, 900])
+        self.eyes_xy = [([620, 740], [500, 560]), ([860, 980], [500, 560])]
+
+    def test_decode_returns_contiguous_rgb_frame(self):
+        self.assertEqual(self.frame.shape, (1200, 1600, 3))
+        self.assertEqual(self.frame.dtype, np.uint8)
+        self.assertTrue(self.frame.flags["C_CONTIGUOUS"])
+
+    def test_decode_rejects_disallowed_format(self):
+        buffered = io.BytesIO()
+        Image.fromarray(self.frame[:10, :10]).save(buffered, format="BMP")
+        with self.assertRaises(ValueError):
+            decode_image(buffered.getvalue(), allowed_formats=("JPEG", "PNG"))
+
+    def test_crops_are_views_of_the_frame(self):
+        face = crop_region(self.frame, *self.face_xy, margin=20)
+        eye = crop_region(self.frame, *self.eyes_xy[0], margin=10)
+        self.assertTrue(np.shares_memory(face, self.frame))
+        self.assertTrue(np.shares_memory(eye, self.frame))
+
+    def test_input_tensor_shapes(self):
+        face = crop_region(self.frame, *self.face_xy, margin=20)
+        self.assertEqual(tuple(to_input_tensor(face, 128, normalize=False).shape), (1, 3, 128, 128))
+        self.assertEqual(tuple(to_input_tensor(face, 640).shape), (1, 3, 640, 640))
+
+    def test_decode_allocates_a_single_frame(self):
+        # Pillow's tobytes() briefly holds the pixels twice while joining its
+        # chunks; any extra conversion or copy would add another frame
+        peak = _peak_allocation(lambda: decode_image(self.upload))
+        self.assertLess(peak, self.frame.nbytes * 2.2)
+
+
+@skipUnless(importlib.util.find_spec("mediapipe"), "mediapipe is not installed")
+class PredictAllocationTests(SimpleTestCase):
+    """The production classifier path works on views of the decoded frame."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        buffered = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (1200, 1600, 3), dtype=np.uint8)).save(buffered, format="JPEG")
+        self.frame = decode_image(buffered.getvalue())
+
+    def test_predict_stays_within_budget(self):
+        from recommender.AImodels import ml_model
+
+        frame = self.frame
+        located = {
+            # What detect_and_crop_face hands over: crops as views of the frame
+            "face": crop_region(frame, [500, 1100], [300, 900], margin=20),
+            "left_eye": crop_region(frame, [620, 740], [500, 560], margin=10),
+            "right_eye": crop_region(frame, [860, 980], [500, 560], margin=10),
+        }
+        with mock.patch.object(ml_model, "locate_face", return_value=located):
+            ml_model.predict(frame)  # warm-up (lazy allocations in the models)
+            peak = _peak_allocation(lambda: ml_model.predict(frame))
+
+        # The face crop copy returned in "cropped_face" is the only large
+        # allocation; converting the frame again per stage would cost a frame each
+        self.assertLess(peak, frame.nbytes // 2)
+
+
+@skipUnless(importlib.util.find_spec("mediapipe"), "mediapipe is not installed")
+class LandmarkArrayTests(SimpleTestCase):
+    """The vectorized landmark helpers against the per-point loops they replaced."""
+
+    def setUp(self):
+        from types import SimpleNamespace
+
+        rng = np.random.default_rng(0)
+        self.points = [SimpleNamespace(x=x, y=y, z=z) for x, y, z in rng.uniform(0.05, 0.95, (478, 3))]
+        self.dims = (640, 480)
+
+    def _pixels(self, indices):
+        w, h = self.dims
+        return np.array([(self.points[i].x * w, self.points[i].y * h) for i in indices])
+
+    def test_array_matches_the_landmark_list(self):
+        from recommender.AImodels.facemesh_model import landmarks_to_array
+
+        landmarks = landmarks_to_array(self.points)
+        self.assertEqual((landmarks.shape, landmarks.dtype), ((478, 3), np.float32))
+        self.assertAlmostEqual(float(landmarks[100, 2]), self.points[100].z, places=6)
+
+    def test_eye_aspect_ratio_and_tilt(self):
+        from recommender.AImodels.facemesh_model import (
+            EAR_INDICES, eye_aspect_ratios, landmarks_to_array, tilt_degrees,
+        )
+
+        landmarks = landmarks_to_array(self.points)
+        expected = []
+        for indices in EAR_INDICES:
+            pts = self._pixels(indices)
+            vertical = np.linalg.norm(pts[1] - pts[5]) + np.linalg.norm(pts[2] - pts[4])
+            expected.append(vertical / (2.0 * np.linalg.norm(pts[0] - pts[3])))
+        np.testing.assert_allclose(eye_aspect_ratios(landmarks, self.dims), expected, rtol=1e-4)
+
+        (dx, dy) = self._pixels(EAR_INDICES[1]).mean(axis=0) - self._pixels(EAR_INDICES[0]).mean(axis=0)
+        self.assertAlmostEqual(tilt_degrees(landmarks, self.dims), np.degrees(np.arctan2(dy, dx)), places=3)
+
+    def test_eye_crop_matches_the_point_loop(self):
+        from recommender.AImodels.facemesh_model import (
+            LEFT_EYE_CROP_INDICES, crop_left_eye_from_landmarks, landmarks_to_array,
+        )
+
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        pts = self._pixels(LEFT_EYE_CROP_INDICES).astype(int)
+        expected = crop_region(frame, pts[:, 0], pts[:, 1], margin=10)
+        crop = crop_left_eye_from_landmarks(frame, landmarks_to_array(self.points), self.dims)
+        self.assertEqual(crop.shape, expected.shape)
+        self.assertTrue(np.shares_memory(crop, frame))
+
+
+class InstancePoolTests(SimpleTestCase):
+    def test_instances_are_created_lazily_and_reused(self):
+        pool = InstancePool("test", object, size=2)
+        with pool.checkout() as first:
+            pass
+        with pool.checkout() as again:
+            self.assertIs(again, first)
+        self.assertEqual(pool.stats()["created"], 1)
+
+    def test_a_checked_out_instance_is_not_shared(self):
+        pool = InstancePool("test", object, size=2)
+        with pool.checkout() as first, pool.checkout() as second:
+            self.assertIsNot(first, second)
+            self.assertEqual(pool.stats()["in_use"], 2)
+        self.assertEqual(pool.stats()["in_use"], 0)
+
+    def test_callers_wait_when_every_instance_is_in_use(self):
+        pool = InstancePool("test", object, size=1)
+        holding, release = threading.Event(), threading.Event()
+        got = []
+
+        def hold():
+            with pool.checkout() as instance:
+                got.append(instance)
+                holding.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        holding.wait(5)
+        def wait():
+            with pool.checkout() as instance:
+                got.append(instance)
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        waiter.join(0.1)
+        self.assertTrue(waiter.is_alive())
+        release.set()
+        holder.join(5)
+        waiter.join(5)
+        self.assertIs(got[0], got[1])
+        self.assertEqual((pool.stats()["waits"], pool.stats()["created"]), (1, 1))
+
+    def test_failed_creation_frees_the_slot(self):
+        factory = mock.Mock(side_effect=[RuntimeError("no graph"), "instance"])
+        pool = InstancePool("test", factory, size=1)
+        with self.assertRaises(RuntimeError):
+            with pool.checkout():
+                pass
+        with pool.checkout() as instance:
+            self.assertEqual(instance, "instance")
+
+    def test_reset_forgets_instances(self):
+        pool = InstancePool("test", object, size=1)
+        with pool.checkout() as first:
+            pass
+        pool.reset()
+        with pool.checkout() as second:
+            self.assertIsNot(second, first)
+
+
+@skipUnless(importlib.util.find_spec("mediapipe"), "mediapipe is not installed")
+class ProxyDetectionTests(SimpleTestCase):
+    def test_brightness_gate_samples_the_full_resolution_centre(self):
+        from recommender.AImodels.facemesh_model import detect_and_crop_face
+
+        # Dark centre 100 px patch in a bright 2000 px frame: on a 640 px proxy
+        # the 100 px sample would mostly see the bright surroundings
+        frame = np.full((2000, 2000, 3), 200, dtype=np.uint8)
+        frame[950:1050, 950:1050] = 10
+        with self.assertRaisesRegex(ValueError, "Poor lighting"):
+            detect_and_crop_face(frame, proxy_max_side=640)
+
+
+class BoundedDecodeTests(SimpleTestCase):
+    def _jpeg(self, w, h, orientation=None):
+        buffered = io.BytesIO()
+        pil_image = Image.new("RGB", (w, h), (200, 120, 80))
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        pil_image.save(buffered, format="JPEG", exif=exif.tobytes())
+        return buffered.getvalue()
+
+    def test_large_jpeg_decodes_at_reduced_scale(self):
+        frame = decode_image(self._jpeg(4032, 3024), max_side=2000)
+        self.assertEqual(frame.shape, (1512, 2016, 3))
+
+    def test_rejects_images_over_pixel_budget_before_decoding(self):
+        buffered = io.BytesIO()
+        Image.new("L", (6000, 6000)).save(buffered, format="PNG")
+        with self.assertRaisesMessage(ValueError, "Image too large"):
+            decode_image(buffered.getvalue(), max_pixels=25_000_000)
+
+    def test_budget_applies_to_the_draft_size(self):
+        frame = decode_image(self._jpeg(6000, 6000), max_pixels=25_000_000, max_side=2000)
+        self.assertEqual(frame.shape, (3000, 3000, 3))
+
+    def test_exif_orientation_is_applied(self):
+        frame = decode_image(self._jpeg(400, 300, orientation=6))
+        self.assertEqual(frame.shape, (400, 300, 3))
+
+
+@skipUnless(importlib.util.find_spec("ultralytics"), "ultralytics is not installed")
+class SegmentationDetectionLabelTests(SimpleTestCase):
+    def _results(self, instances):
+        names = {0: "pimple", 1: "wrinkle", 2: "blackhead"}
+        ids = {name: cls_id for cls_id, name in names.items()}
+        boxes = [
+            mock.Mock(
+                cls=torch.tensor([float(ids[name])]),
+                conf=torch.tensor([conf]),
+                xyxy=torch.tensor([[10.0, 20.0, 30.0, 40.0]]),
+            )
+            for name, conf in instances
+        ]
+        return mock.Mock(boxes=boxes, names=names)
+
+    def test_boxes_use_detector_labels_and_drop_unmapped_classes(self):
+        from recommender.AImodels.segment_skin_conditions_yolo import detections_from_segmentation
+
+        results = self._results([("pimple", 0.91234), ("wrinkle", 0.8), ("blackhead", 0.5)])
+        self.assertEqual(detections_from_segmentation(results), [
+            {"bbox": [10, 20, 30, 40], "label": "pimple", "confidence": 0.9123},
+            {"bbox": [10, 20, 30, 40], "label": "blackhead", "confidence": 0.5},
+        ])
+
+    def test_every_class_must_be_mapped(self):
+        from recommender.AImodels.segment_skin_conditions_yolo import check_detection_labels
+
+        check_detection_labels(["pimple", "wrinkle"])
+        with self.assertRaisesRegex(ValueError, "freckle"):
+            check_detection_labels(["pimple", "freckle"])
+
+
+class VectorOverlayTests(SimpleTestCase):
+    def _preds(self, **overlays):
+        return {
+            "type_pred": "oily", "type_probs": [0.1, 0.2, 0.7],
+            "left_eye_color": "brown", "right_eye_color": "brown",
+            "acne_pred": "1", "acne_confidence": 0.8,
+            "yolo_boxes": [{"label": "acne", "box": [1, 2, 10, 12]}],
+            "segmentation_results": [{"label": "melasma", "polygon": [[0, 0], [9, 0], [9, 9]]}],
+            "cropped_face": np.zeros((40, 30, 3), dtype=np.uint8),
+            **overlays,
+        }
+
+    def test_polygon_is_decimated_to_its_corners(self):
+        side = np.linspace(0, 100, 51)
+        zeros, hundreds = np.zeros_like(side), np.full_like(side, 100)
+        square = np.concatenate([
+            np.stack([side, zeros], 1), np.stack([hundreds, side], 1),
+            np.stack([side[::-1], hundreds], 1), np.stack([zeros, side[::-1]], 1),
+        ])
+        self.assertEqual(sorted(map(tuple, simplify_polygon(square, tolerance=1.5))),
+                         [(0, 0), (0, 100), (100, 0), (100, 100)])
+        self.assertEqual(simplify_polygon([[0, 0], [1, 1]]), [])
+
+    def test_vector_payload_has_no_rendered_overlays(self):
+        payload = build_analysis_payload(self._preds(yolo_annotated=None, segmentation_overlay=None))
+        self.assertEqual(payload["overlay"], "vector")
+        self.assertIsNone(payload["yolo_annotated"])
+        self.assertIsNone(payload["segmentation_overlay"])
+        self.assertTrue(payload["cropped_face"].startswith("data:"))
+        self.assertEqual(payload["cropped_face_size"], [30, 40])
+        self.assertEqual(payload["segmentation_results"][0]["polygon"], [[0, 0], [9, 0], [9, 9]])
+
+    def test_image_payload_encodes_the_overlays(self):
+        overlays = {name: Image.new("RGB", (30, 40)) for name in ("yolo_annotated", "segmentation_overlay")}
+        payload = build_analysis_payload(self._preds(**overlays))
+        self.assertNotIn("overlay", payload)
+        self.assertTrue(payload["yolo_annotated"].startswith("data:"))
+        self.assertTrue(payload["segmentation_overlay"].startswith("data:"))
+
+
+class ArtifactStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.store = LocalArtifactStore(root=self.root.name, ttl_seconds=60, max_bytes=1024)
+        # No janitor thread: the tests run cleanup() themselves
+        self.store._ensure_janitor = lambda: None
+
+    def _token(self, key):
+        return artifact_url(key).rstrip("/").rsplit("/", 1)[-1]
+
+    def _serve(self, token, **headers):
+        from recommender import views
+
+        request = RequestFactory().get(f"/artifacts/{token}/", headers=headers)
+        with mock.patch.object(views, "artifact_store", self.store):
+            return views.serve_artifact(request, token)
+
+    def test_signed_url_round_trip(self):
+        key = self.store.put(b"jpeg bytes")
+        self.assertEqual(artifact_key(self._token(key), max_age=60), key)
+
+    def test_expired_signature_is_rejected(self):
+        key = self.store.put(b"jpeg bytes")
+        with mock.patch("django.core.signing.time.time", return_value=time.time() - 120):
+            token = self._token(key)
+        with self.assertRaises(signing.SignatureExpired):
+            artifact_key(token, max_age=60)
+
+    def test_tampered_token_is_not_served(self):
+        from django.http import Http404
+
+        token = self._token(self.store.put(b"jpeg bytes"))
+        other = self.store.put(b"other bytes")
+        tampered = other + token[token.index(":"):]
+        with self.assertRaises(signing.BadSignature):
+            artifact_key(tampered)
+        with self.assertRaises(Http404):
+            self._serve(tampered)
+
+    def test_etag_and_not_modified(self):
+        key = self.store.put(b"jpeg bytes")
+        token = self._token(key)
+
+        response = self._serve(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"jpeg bytes")
+        self.assertEqual(response["ETag"], f'"{key}"')
+
+        response = self._serve(token, **{"If-None-Match": f'"{key}"'})
+        self.assertEqual(response.status_code, 304)
+
+    def test_janitor_evicts_expired_then_oldest(self):
+        expired = self.store.put(b"a" * 100)
+        path = self.store._path(expired)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        oldest = self.store.put(b"b" * 600)
+        os.utime(self.store._path(oldest), (time.time() - 30, time.time() - 30))
+        newest = self.store.put(b"c" * 600)
+
+        self.store.cleanup()
+        self.assertFalse(self.store.exists(expired))
+        self.assertFalse(self.store.exists(oldest))
+        self.assertTrue(self.store.exists(newest))
+        self.assertEqual((self.store.evicted_expired, self.store.evicted_size), (1, 1))
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_concurrent_identical_keys_compute_once(self):
+        cache = ResultCache()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {"skin_type": "Oily"}
+
+        outcomes = []
+        threads = [
+            threading.Thread(target=lambda: outcomes.append(cache.get_or_compute("k", compute)[1]))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        # Let the followers reach the in-flight computation before it finishes
+        while cache.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcomes), ["coalesced"] * 3 + ["miss"])
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResultCache(ttl_seconds=60)
+        with mock.patch("recommender.AImodels.result_cache.time.monotonic", return_value=1000.0):
+            cache.get_or_compute("k", lambda: "first")
+            self.assertEqual(cache.get_or_compute("k", lambda: "second"), ("first", "hit"))
+        with mock.patch("recommender.AImodels.result_cache.time.monotonic", return_value=1061.0):
+            self.assertEqual(cache.get_or_compute("k", lambda: "second"), ("second", "miss"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResultCache(max_entries=2)
+        cache.get_or_compute("a", lambda: "a")
+        cache.get_or_compute("b", lambda: "b")
+        cache.get_or_compute("a", lambda: "unused")  # "a" is now the most recent
+        cache.get_or_compute("c", lambda: "c")
+
+        self.assertEqual(cache.get_or_compute("a", lambda: "recomputed")[1], "hit")
+        self.assertEqual(cache.get_or_compute("b", lambda: "recomputed"), ("recomputed", "miss"))
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_uncacheable_values_are_not_stored(self):
+        cache = ResultCache(cacheable=lambda payload: "error" not in payload)
+        cache.get_or_compute("k", lambda: {"error": "No face"})
+        self.assertEqual(cache.get_or_compute("k", lambda: {"skin_type": "Dry"})[1], "miss")
+
+    def test_entries_with_evicted_artifacts_are_recomputed(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = LocalArtifactStore(root=root)
+            store._ensure_janitor = lambda: None
+            with mock.patch("recommender.AImodels.artifacts.artifact_store", store):
+                key = store.put(b"jpeg bytes")
+                cache = ResultCache(is_valid=artifacts_available)
+                cache.get_or_compute("k", lambda: {"cropped_face": artifact_url(key)})
+                self.assertEqual(cache.get_or_compute("k", lambda: {})[1], "hit")
+
+                os.unlink(store._path(key))
+                payload, outcome = cache.get_or_compute("k", lambda: {"cropped_face": "new"})
+                self.assertEqual((payload, outcome), ({"cropped_face": "new"}, "miss"))
+                self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_response_options_are_part_of_the_key(self):
+        cache = ResultCache()
+        cache._fingerprint = "models"
+        frame = np.zeros((8, 8, 3), dtype=np.uint8)
+        variants = [
+            ("image", "inline", "default"), ("vector", "inline", "default"),
+            ("image", "url", "default"), ("image", "inline", "preview"),
+        ]
+        for variant in variants:
+            cache.get_or_compute(cache.key(frame, *variant), lambda: {"variant": variant})
+        for variant in variants:
+            payload, outcome = cache.get_or_compute(cache.key(frame, *variant), lambda: None)
+            self.assertEqual((payload["variant"], outcome), (variant, "hit"))
+
+
+class EncodingProfileTests(SimpleTestCase):
+    def setUp(self):
+        coarse = np.random.default_rng(0).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+        self.crop = np.asarray(Image.fromarray(coarse).resize((900, 1200), Image.BILINEAR))
+
+    def test_preview_profiles_bound_the_longer_edge(self):
+        for profile, fmt in (("preview", "JPEG"), ("webp_preview", "WEBP")):
+            with Image.open(io.BytesIO(encode_image(self.crop, profile))) as decoded:
+                self.assertEqual(decoded.format, fmt)
+                self.assertEqual(decoded.size, (384, 512))
+
+    def test_buffer_reuse_does_not_leak_between_encodes(self):
+        large = encode_image(self.crop, "hq")
+        small = encode_image(self.crop, "preview")
+        self.assertLess(len(small), len(large))
+        with Image.open(io.BytesIO(small)) as decoded:
+            decoded.load()
+        self.assertEqual(encode_images({"a": self.crop, "b": self.crop}, "preview"), {"a": small, "b": small})
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def _occupy(self, controller, count):
+        """Hold `count` admissions on background threads until the returned event is set."""
+        release, admitted = threading.Event(), threading.Semaphore(0)
+
+        def hold():
+            with controller.admit():
+                admitted.release()
+                release.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for _ in threads:
+            admitted.acquire()
+        return release, threads
+
+    def test_rejects_when_queue_is_full(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=0)
+        release, threads = self._occupy(controller, 1)
+        try:
+            with self.assertRaises(Overloaded) as cm:
+                with controller.admit():
+                    pass
+            self.assertGreaterEqual(cm.exception.retry_after, 1)
+            self.assertEqual(controller.stats()["rejected"]["queue_full"], 1)
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+    def test_rejects_when_expected_wait_exceeds_deadline(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=4, max_wait_seconds=1.0)
+        controller.service_seconds = 5.0
+        release, threads = self._occupy(controller, 1)
+        try:
+            with self.assertRaises(Overloaded) as cm:
+                with controller.admit():
+                    pass
+            self.assertEqual(cm.exception.retry_after, 5)
+            self.assertEqual(controller.stats()["rejected"]["expected_wait"], 1)
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+
+    def test_queued_request_runs_when_a_slot_frees(self):
+        controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait_seconds=5.0)
+        release, threads = self._occupy(controller, 1)
+        threading.Timer(0.1, release.set).start()
+        with controller.admit():
+            self.assertEqual(controller.stats()["in_flight"], 1)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(controller.stats()["admitted"], 2)
+
+    def test_node_slots_limit_across_controllers(self):
+        with tempfile.TemporaryDirectory() as slot_dir:
+            # Two controllers stand in for two workers of one node
+            first = AdmissionController(max_concurrent=2, node_slots=1, slot_dir=slot_dir)
+            second = AdmissionController(max_concurrent=2, node_slots=1, slot_dir=slot_dir, max_wait_seconds=0.1)
+            release, threads = self._occupy(first, 1)
+            try:
+                with self.assertRaises(Overloaded):
+                    with second.admit():
+                        pass
+            finally:
+                release.set()
+                for thread in threads:
+                    thread.join()
+            with second.admit():
+                pass
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_burst_then_refill(self):
+        start = EPOCH_SECONDS * 1000.0
+        for _ in range(3):
+            self.assertEqual(take_token("bucket", 60, 3, now=start), 0)
+        # 60/min: the next token comes one second later
+        self.assertAlmostEqual(take_token("bucket", 60, 3, now=start), 1.0)
+        self.assertAlmostEqual(take_token("bucket", 60, 3, now=start + 0.5), 0.5)
+        self.assertEqual(take_token("bucket", 60, 3, now=start + 1.0), 0)
+
+    def test_idle_credit_is_capped_at_burst(self):
+        start = EPOCH_SECONDS * 1000.0
+        self.assertEqual(take_token("idle", 60, 2, now=start), 0)
+        # A minute idle refills 60 tokens but the bucket only holds 2
+        later = start + 60
+        self.assertEqual(take_token("idle", 60, 2, now=later), 0)
+        self.assertEqual(take_token("idle", 60, 2, now=later), 0)
+        self.assertGreater(take_token("idle", 60, 2, now=later), 0)
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.limiter = RateLimiter(shop_rate=(60, 3), ip_rate=(60, 1))
+
+    def test_client_ip_ignores_client_supplied_forwarded_entries(self):
+        from recommender.views import get_client_ip
+
+        request = RequestFactory().post("/", HTTP_X_FORWARDED_FOR="6.6.6.6, 1.2.3.4", REMOTE_ADDR="10.0.0.1")
+        with override_settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(get_client_ip(request), "1.2.3.4")
+        with override_settings(TRUSTED_PROXY_COUNT=0):
+            self.assertEqual(get_client_ip(request), "10.0.0.1")
+        with override_settings(TRUSTED_PROXY_COUNT=3):
+            self.assertEqual(get_client_ip(request), "10.0.0.1")
+
+    def test_unresolved_alias_has_no_shop_bucket(self):
+        # Clients naming a shop can't drain its bucket before it's resolved
+        for number in range(5):
+            self.assertIsNone(self.limiter.check(f"10.0.0.{number}", "shopify:victim.myshopify.com"))
+        self.assertEqual(self.limiter.check("10.0.0.0", "shopify:victim.myshopify.com")[0], "ip")
+
+    def test_resolved_alias_shares_the_shop_bucket(self):
+        self.limiter.remember_shop("shopify:shop.com", "shopify:1")
+        self.limiter.remember_shop("shopify:shop.myshopify.com", "shopify:1")
+        for number, alias in enumerate(("shopify:shop.com", "shopify:shop.myshopify.com", "shopify:shop.com")):
+            self.assertIsNone(self.limiter.check(f"10.0.0.{number}", alias))
+        self.assertEqual(self.limiter.check("10.0.0.9", "shopify:shop.myshopify.com")[0], "shop")
+
+    def test_authenticated_alias_skips_the_ip_bucket(self):
+        # A WordPress plugin's requests may all come from the WordPress server
+        self.limiter.remember_shop("wp:key", "wp:1", authenticated=True)
+        for _ in range(3):
+            self.assertIsNone(self.limiter.check("10.0.0.1", "wp:key"))
+        self.assertEqual(self.limiter.check("10.0.0.1", "wp:key")[0], "shop")
+        self.assertEqual(self.limiter.check("10.0.0.1", "wp:unknown"), None)
+        self.assertEqual(self.limiter.check("10.0.0.1", "wp:unknown")[0], "ip")
+
+    def test_first_burst_is_limited_by_the_resolved_shop(self):
+        resolve = mock.Mock(return_value=("shopify:1", None, False))
+        rejections = [self.limiter.check(f"10.0.0.{number}", "shopify:shop.com", resolve) for number in range(4)]
+        self.assertEqual(rejections[:3], [None, None, None])
+        self.assertEqual(rejections[3][0], "shop")
+        # Resolved once, then from the cache
+        resolve.assert_called_once_with()
+
+    def test_unknown_alias_is_looked_up_once(self):
+        resolve = mock.Mock(return_value=None)
+        for number in range(5):
+            self.assertIsNone(self.limiter.check(f"10.0.0.{number}", "shopify:nowhere.com", resolve))
+        resolve.assert_called_once_with()
+
+    def test_shopify_alias_is_the_shop_usage_is_counted_against(self):
+        from recommender import views
+
+        request = RequestFactory().post("/", {"shop": "shop.myshopify.com"}, HTTP_ORIGIN="https://elsewhere.com")
+        self.assertEqual(views.shop_rate_alias(request), "shopify:shop.myshopify.com")
+        shops = mock.Mock()
+        shops.return_value.first.return_value = mock.Mock(pk=7)
+        with mock.patch.object(views, "shops_for_domain", shops):
+            self.assertEqual(views.rate_limit_shop(request), ("shopify:7", None, False))
+        shops.assert_called_once_with("shop.myshopify.com")
+
+
+class AnalysisViewLimitTests(SimpleTestCase):
+    """The sync, async and stream analysis views are all admission controlled and rate limited."""
+
+    def setUp(self):
+        from recommender import ratelimit, streaming, views
+        from recommender.AImodels import admission
+
+        self.views = views
+        self.controller = AdmissionController(max_concurrent=1, max_queue=0)
+        self.limiter = ratelimit.RateLimiter(ip_rate=(60, 1))
+        for target in (admission, views, streaming):
+            patcher = mock.patch.object(target, "analysis_admission", self.controller)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ratelimit, "analysis_rate_limiter", self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, view, ip):
+        from asgiref.sync import async_to_sync
+
+        request = RequestFactory().post("/upload/", REMOTE_ADDR=ip)
+        if view is self.views.upload_photo_async:
+            return async_to_sync(view)(request)
+        return view(request)
+
+    def test_saturated_views_answer_503_then_429(self):
+        slot = self.controller.acquire()
+        views = (self.views.upload_photo, self.views.upload_photo_async, self.views.upload_photo_stream)
+        for number, view in enumerate(views):
+            ip = f"10.0.0.{number}"
+            response = self._post(view, ip)
+            self.assertEqual(response.status_code, 503, view.__name__)
+            self.assertIn("Retry-After", response)
+            # The rejected request still took the IP's only token
+            response = self._post(view, ip)
+            self.assertEqual(response.status_code, 429, view.__name__)
+        self.controller.release(slot)
+        self.assertEqual(self.controller.in_flight, 0)
+
+    def test_stream_holds_its_slot_until_the_analysis_ends(self):
+        from recommender import streaming
+
+        started, proceed = threading.Event(), threading.Event()
+
+        def analyze(frame, on_section, **options):
+            started.set()
+            proceed.wait(5)
+            return {"error": "No face detected"}, None
+
+        photo = io.BytesIO()
+        Image.new("RGB", (32, 32)).save(photo, format="PNG")
+        photo.name = "face.png"
+        photo.seek(0)
+        request = RequestFactory().post("/stream/", {"photo": photo}, REMOTE_ADDR="10.0.1.1")
+        request.session = mock.Mock(session_key="abc")
+        with mock.patch.object(streaming, "analyze_payload_streaming", analyze):
+            response = self.views.upload_photo_stream(request)
+            started.wait(5)
+            self.assertEqual(self.controller.in_flight, 1)
+            proceed.set()
+            b"".join(response.streaming_content)
+        self.assertEqual(self.controller.in_flight, 0)
+
+
+def _onnx_models_exported():
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+    return all(os.path.exists(onnx_path(path)) for path in MODEL_PATHS.values())
+
+
+@skipUnless(_onnx_models_exported(), "run `manage.py export_onnx` to enable the ONNX parity test")
+class OnnxBackendParityTests(SimpleTestCase):
+    INPUTS = {
+        "skin_type": (TYPE_INPUT_SIZE, False),
+        "eye_color": (EYE_INPUT_SIZE, True),
+        "acne": (ACNE_INPUT_SIZE, True),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from recommender.AImodels.onnx_backend import load_onnx_models
+
+        cls.torch_models = load_torch_models()
+        cls.onnx_models = load_onnx_models(MODEL_PATHS)
+
+    def _sample_images(self):
+        # Smooth synthetic "photos" of different sizes, as real crops would be
+        rng = np.random.default_rng(42)
+        for h, w in [(180, 140), (420, 360), (900, 700)]:
+            coarse = rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)
+            yield np.asarray(Image.fromarray(coarse).resize((w, h), Image.BILINEAR))
+
+    def test_probabilities_match_torch_backend(self):
+        for rgb in self._sample_images():
+            for name, (size, normalize) in self.INPUTS.items():
+                x = to_input_tensor(rgb, size, normalize=normalize)
+                with torch.no_grad():
+                    expected = self.torch_models[name](x)
+                actual = self.onnx_models[name](x)
+
+                np.testing.assert_allclose(
+                    torch.softmax(actual, dim=1).numpy(),
+                    torch.softmax(expected, dim=1).numpy(),
+                    atol=1e-4, err_msg=name,
+                )
+                np.testing.assert_allclose(
+                    torch.sigmoid(actual).numpy(),
+                    torch.sigmoid(expected).numpy(),
+                    atol=1e-4, err_msg=name,
+                )
+
+    def test_batched_inputs(self):
+        rgb = next(self._sample_images())
+        size, normalize = self.INPUTS["eye_color"]
+        x = torch.cat([to_input_tensor(rgb, size, normalize=normalize)] * 2)
+        self.assertEqual(tuple(self.onnx_models["eye_color"](x).shape), (2, 6))
+
+
+class AnalysisJobTests(TestCase):
+    def setUp(self):
+        from recommender import jobs
+        self.jobs = jobs
+        self.frame = np.full((8, 8, 3), 128, dtype=np.uint8)
+        self.shop = WordpressShop.objects.create(
+            domain="https://shop.example", admin_email="a@shop.example", api_key="key",
+            plan=Plan.objects.create(name="pro", monthly_limit=1),
+        )
+
+    def _enqueue(self, source=AnalysisJob.WORDPRESS):
+        usage = {"shop_id": self.shop.pk} if source == AnalysisJob.WORDPRESS else {}
+        return self.jobs.enqueue_analysis(self.frame, {}, source, usage)
+
+    def _run(self, job, payload=None):
+        analyze = mock.Mock(return_value=(payload or {"skin_type": "oily"}, None))
+        with mock.patch("recommender.AImodels.inference.analyze_payload", analyze):
+            self.jobs.run_job(job, "w1")
+        job.refresh_from_db()
+        return analyze
+
+    def test_a_job_is_claimed_by_one_worker(self):
+        queued = self._enqueue()
+        job = self.jobs.claim_job("w1")
+        self.assertEqual((job.pk, job.status, job.attempts), (queued.pk, AnalysisJob.RUNNING, 1))
+        self.assertIsNone(self.jobs.claim_job("w2"))
+        # A worker that lost the job can't store an outcome for it
+        self.assertEqual(self.jobs._finish(job, "w2", status=AnalysisJob.DONE), 0)
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        self._enqueue()
+        job = self.jobs.claim_job("w1")
+        stale = timezone.now() - timedelta(seconds=settings.JOB_STALE_SECONDS + 1)
+        AnalysisJob.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+        self.jobs.reap_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (AnalysisJob.QUEUED, ""))
+
+        AnalysisJob.objects.filter(pk=job.pk).update(
+            status=AnalysisJob.RUNNING, attempts=job.max_attempts, heartbeat_at=stale,
+        )
+        self.jobs.reap_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (AnalysisJob.FAILED, "Worker lost"))
+
+    def test_wordpress_quota_is_consumed_by_the_worker(self):
+        first, second = self._enqueue(), self._enqueue()
+        self._run(self.jobs.claim_job("w1"))
+        first.refresh_from_db()
+        self.assertEqual(first.status, AnalysisJob.DONE)
+        self.assertEqual(first.result["usage"], {"used": 1, "limit": 1})
+
+        # Queued while the shop was under its limit: not analyzed once it is used up
+        analyze = self._run(self.jobs.claim_job("w1"))
+        second.refresh_from_db()
+        self.assertEqual(second.status, AnalysisJob.FAILED)
+        self.assertIn("Quota Ended", second.error)
+        analyze.assert_not_called()
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.analysis_this_month, 1)
+
+    def test_quota_used_up_during_the_analysis_fails_the_job(self):
+        job = self._enqueue()
+        claimed = self.jobs.claim_job("w1")
+        WordpressShop.objects.filter(pk=self.shop.pk).update(analysis_this_month=1)
+        with mock.patch.object(self.jobs, "_check_quota"):
+            self._run(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (AnalysisJob.FAILED, None))
+        self.assertIn("Quota Ended", job.error)
+
+    def test_poll_responses(self):
+        from recommender import views
+
+        job = self._enqueue()
+
+        def poll(job_id=None):
+            request = RequestFactory().get("/jobs/")
+            return views.analysis_job(request, job_id or job.pk)
+
+        response = poll()
+        self.assertEqual((response.status_code, response["Retry-After"]), (202, "1"))
+
+        AnalysisJob.objects.filter(pk=job.pk).update(status=AnalysisJob.DONE, result={"skin_type": "oily"})
+        response = poll()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["result"], {"skin_type": "oily"})
+
+        AnalysisJob.objects.filter(pk=job.pk).update(status=AnalysisJob.FAILED, error="No face detected")
+        self.assertEqual(json.loads(poll().content)["error"], "No face detected")
+
+        AnalysisJob.objects.filter(pk=job.pk).update(expires_at=timezone.now())
+        self.assertEqual(poll().status_code, 404)
+
+
+class StreamingTests(SimpleTestCase):
+    def _events(self, analyze, finish=None):
+        from recommender import streaming
+
+        request = RequestFactory().post("/stream/")
+        finish = finish or mock.Mock(return_value={"status": "success"})
+        with mock.patch.object(streaming, "analyze_payload_streaming", analyze):
+            messages = list(streaming.stream_analysis(request, np.zeros((8, 8, 3), np.uint8), {}, finish))
+        events = [m.split("\n")[:2] for m in messages if m.startswith("event:")]
+        return [(event[len("event: "):], json.loads(data[len("data: "):])) for event, data in events]
+
+    def test_sections_then_done(self):
+        def analyze(frame, on_section, **options):
+            on_section("skin_type", {"skin_type": "oily"})
+            on_section("images", {"cropped_face": "/artifacts/abc/"})
+            return {"skin_type": "oily"}, None
+
+        finished_in = []
+
+        def finish(payload):
+            finished_in.append(threading.current_thread().name)
+            return {"status": "success", "usage": {"used": 1, "limit": 5}}
+
+        events = self._events(analyze, finish)
+        self.assertEqual([event for event, _ in events], ["skin_type", "images", "done"])
+        self.assertEqual(events[1][1]["cropped_face"], "http://testserver/artifacts/abc/")
+        self.assertEqual(events[2][1]["usage"], {"used": 1, "limit": 5})
+        # Usage is counted by the analysis thread, not by the response generator
+        self.assertEqual(finished_in, ["analysis-stream"])
+
+    def test_failures_end_with_an_error_event(self):
+        def no_face(frame, on_section, **options):
+            return {"error": "No face detected"}, None
+
+        def crash(frame, on_section, **options):
+            on_section("skin_type", {"skin_type": "dry"})
+            raise RuntimeError("boom")
+
+        finish = mock.Mock()
+        self.assertEqual(self._events(no_face, finish), [("error", {"error": "No face detected", "status": 400})])
+        self.assertEqual(
+            self._events(crash, finish),
+            [("skin_type", {"skin_type": "dry"}), ("error", {"error": "boom", "status": 500})],
+        )
+        finish.assert_not_called()
+
+    def test_missing_photo_is_a_bad_request(self):
+        from recommender import views
+
+        request = RequestFactory().post("/stream/", {"overlay": "vector"})
+        response = views.upload_photo_stream(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {"error": "No image data provided"})
+
+
+class BlockingOffloaderTests(SimpleTestCase):
+    def test_calls_close_old_connections_around_each_call(self):
+        from asgiref.sync import async_to_sync
+        from recommender.AImodels import offload
+
+        offloader = offload.BlockingOffloader("test")
+        calls = []
+        with mock.patch.object(offload, "close_old_connections", lambda: calls.append("close")):
+            result = async_to_sync(offloader.run)(lambda: calls.append("call") or 42)
+            with self.assertRaises(ValueError):
+                async_to_sync(offloader.run)(int, "x")
+        self.assertEqual(result, 42)
+        self.assertEqual(calls, ["close", "call", "close", "close", "close"])
+        self.assertEqual(offloader.stats()["in_flight"], 0)
+
+
+class AsyncUploadViewTests(TestCase):
+    PAYLOAD = {"skin_type": "Oily", "acne_pred": "Mild", "cropped_face": "/artifacts/abc/"}
+
+    def setUp(self):
+        cache.clear()
+
+    def _request(self):
+        from importlib import import_module
+
+        photo = io.BytesIO()
+        Image.new("RGB", (32, 32)).save(photo, format="PNG")
+        photo.name = "face.png"
+        photo.seek(0)
+        request = RequestFactory().post("/upload/", {"photo": photo, "shop": "shop.myshopify.com"})
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        return request
+
+    async def test_async_view_answers_like_the_sync_view(self):
+        from asgiref.sync import sync_to_async
+        from recommender import views
+
+        async def analyze_async(frame, **options):
+            self.assertEqual(frame.shape, (32, 32, 3))
+            return self.PAYLOAD, "miss"
+
+        with mock.patch.object(views, "analyze_payload_async", analyze_async), \
+                mock.patch.object(views, "analyze_payload", return_value=(self.PAYLOAD, "miss")):
+            async_response = await views.upload_photo_async(self._request())
+            sync_response = await sync_to_async(views.upload_photo)(self._request())
+
+        self.assertEqual((async_response.status_code, sync_response.status_code), (200, 200))
+        body = json.loads(async_response.content)
+        self.assertEqual(body, json.loads(sync_response.content))
+        self.assertEqual(body["cropped_face"], "http://testserver/artifacts/abc/")
+        # Both logged the analysis
+        self.assertEqual(await FaceAnalysis.objects.filter(domain="shop.myshopify.com").acount(), 2)
+
+    async def test_async_view_rejects_a_missing_photo(self):
+        from recommender import views
+
+        request = RequestFactory().post("/upload/", {"shop": "shop.myshopify.com"})
+        with mock.patch.object(views.memory_governor, "after_request") as after_request:
+            response = await views.upload_photo_async(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {"error": "No image data provided"})
+        # The early 400 still ends the request for the memory governor
+        after_request.assert_called_once_with()
@@ -4,6 +4,10 @@ from . import views , webhooks
 urlpatterns = [
     path('', views.home, name='home'),
     path('upload/', views.upload_photo, name='upload_photo'),  
+    path('upload/async/', views.upload_photo_async, name='upload_photo_async'),
+    path('upload/stream/', views.upload_photo_stream, name='upload_photo_stream'),
+    path('artifacts/<str:token>/', views.serve_artifact, name='serve_artifact'),
+    path('jobs/<uuid:job_id>/', views.analysis_job, name='analysis_job'),
     path('submit-feedback/', views.submit_feedback, name='submit_feedback'),
 
     path('app_entry/', views.app_entry, name='app_entry'),
@@ -21,6 +25,7 @@ urlpatterns = [
     path("logout/", views.staff_logout, name="staff_logout"),
     path("dashboard/search-domains/", views.search_domains, name="search_domains"),
     path("dashboard/filter-logs/", views.filter_logs, name="filter_logs"),
+    path("dashboard/inference-stats/", views.inference_stats, name="inference_stats"),
     #mandatory GDPR webhooks 
     path('webhooks/customers_data_request/', webhooks.customers_data_request, name='customers_data_request'),
     path('webhooks/customers_redact/', webhooks.customers_redact, name='customers_redact'),
@@ -2,21 +2,31 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, Http404, HttpResponseNotModified
 from django.db.models import F, Q, Count
-from PIL import Image
+from django.core import signing
+from django.views.decorators.http import require_GET
+from asgiref.sync import sync_to_async
 import base64
-import io
 import json
-import gc  # garbage collection import
+import mimetypes
 from datetime import datetime, timedelta
 from django.utils import timezone
 
-from recommender.AImodels.ml_model import predict
-from recommender.AImodels.yolo_model import detect_skin_defects_yolo
-from recommender.AImodels.segment_skin_conditions_yolo import segment_skin_conditions  
-
-from .models import FaceAnalysis, Feedback , Visitor
+from recommender.AImodels.inference import (
+    analyze_payload, analyze_payload_async, response_options, inference_stats as pipeline_stats,
+    InferenceUnavailable,
+)
+from recommender.AImodels.admission import Overloaded, admission_controlled, analysis_admission, overloaded_response
+from recommender.AImodels.artifacts import artifact_store, artifact_key, absolute_image_urls
+from recommender.AImodels.preprocess import decode_upload
+from recommender.AImodels.memory import memory_governor
+from recommender.AImodels.offload import inference_offloader
+
+from .models import AnalysisJob, FaceAnalysis, Feedback , Visitor
+from .jobs import enqueue_analysis, job_accepted_body, job_requested
+from .ratelimit import analysis_rate_limiter, rate_limited
+from .streaming import event_stream_response, stream_analysis
 
 def home(request):
     """
@@ -26,6 +36,8 @@ def home(request):
 
 
 @csrf_exempt
+@rate_limited(lambda request: shop_rate_alias(request), lambda request: rate_limit_shop(request))
+@admission_controlled
 def upload_photo(request):
     """
     Handle POST requests with an uploaded photo or base64 image string.
@@ -36,102 +48,29 @@ def upload_photo(request):
     """
     if request.method == "POST":
         image = None
-        cropped_face = None
-        yolo_annotated_image = None
-        segmented_img = None
-        buffered = None
-        buffered_annot = None
-        buffered_seg = None
         
         try:
-            # Load image from uploaded file or base64 string
-            if 'photo' in request.FILES:
-                photo_file = request.FILES['photo']
-
-                # ✅ Validate file size (max 10 MB)
-                max_size = 10 * 1024 * 1024  # 10 MB
-                if photo_file.size > max_size:
-                    return JsonResponse({"error": "File too large (max 10 MB allowed)."}, status=400)
-
-                # ✅ Validate file extension
-                valid_extensions = ['jpg', 'jpeg', 'png']
-                extension = photo_file.name.split('.')[-1].lower()
-                if extension not in valid_extensions:
-                    return JsonResponse({"error": "Invalid file type. Only PNG, JPG, and JPEG are allowed."}, status=400)
-
-                image = Image.open(photo_file).convert('RGB')
-            else:
-                data_url = request.POST.get('photo')
-                header, encoded = data_url.split(",", 1)
-                decoded = base64.b64decode(encoded)
-
-                # ✅ Validate base64 image size (max 10 MB)
-                if len(decoded) > 10 * 1024 * 1024:
-                    return JsonResponse({"error": "Image too large (max 10 MB allowed)."}, status=400)
-
-                image = Image.open(io.BytesIO(decoded)).convert('RGB')
-
-                # ✅ Validate image format
-                if image.format not in ["JPEG", "JPG", "PNG"]:
-                    return JsonResponse({"error": "Unsupported image format."}, status=400)
-
-            # Run main classifier (skin type + eyes + acne)
-            preds = predict(image)
-            if "error" in preds:
-                return JsonResponse({"error": preds["error"]}, status=400)
-
-            skin_type = preds['type_pred'].lower()
-            cropped_face = preds.get("cropped_face")
-
-            buffered = io.BytesIO()
-            cropped_face.save(buffered, format="JPEG")
-            cropped_face_base64 = base64.b64encode(buffered.getvalue()).decode()
-            buffered.close()
-            buffered = None
-
-            # Eye colors (top predictions or "Eyes Closed")
-            left_eye_color = preds.get("left_eye_color", "Unknown")
-            right_eye_color = preds.get("right_eye_color", "Unknown")
-
-            if isinstance(left_eye_color, str) and "closed" not in left_eye_color.lower():
-                left_eye_color = left_eye_color.title()
-            if isinstance(right_eye_color, str) and "closed" not in right_eye_color.lower():
-                right_eye_color = right_eye_color.title()
-
-            # Acne prediction and confidence
-            acne_pred = preds.get("acne_pred", "Unknown")
-            acne_confidence = preds.get("acne_confidence", 0)
-
-            acne_mapping = {
-                "0": "Clear",
-                "1": "Mild",
-                "2": "Moderate",
-                "3": "Severe",
-                "clear": "Clear"
-            }
-            acne_pred_label = acne_mapping.get(str(acne_pred).lower(), "Unknown")
-
-            # Run YOLOv8 on cropped face
-            yolo_boxes, yolo_annotated_image = detect_skin_defects_yolo(cropped_face)
-
-            buffered_annot = io.BytesIO()
-            yolo_annotated_image.save(buffered_annot, format="JPEG")
-            yolo_annotated_base64 = base64.b64encode(buffered_annot.getvalue()).decode()
-            buffered_annot.close()
-            buffered_annot = None
-            yolo_annotated_image.close()
-            yolo_annotated_image = None
-
-            # Run YOLOv8 segmentation
-            segmented_img, segmentation_results = segment_skin_conditions(cropped_face)
-            
-            buffered_seg = io.BytesIO()
-            segmented_img.save(buffered_seg, format="JPEG")
-            segmented_base64 = base64.b64encode(buffered_seg.getvalue()).decode()
-            buffered_seg.close()
-            buffered_seg = None
-            segmented_img.close()
-            segmented_img = None
+            # Overlays rendered or as vectors, images as signed URLs or inline
+            # base64 (older widget versions), encoding profile
+            try:
+                options = response_options(request.POST)
+                image = decode_request_photo(request)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+
+            # Job mode: queue the photo for the job workers and answer right away
+            if job_requested(request.POST):
+                if not request.session.session_key:
+                    request.session.create()
+                usage = {"session_key": request.session.session_key, **analysis_log_fields(request, get_domain(request))}
+                job = enqueue_analysis(image, options, AnalysisJob.SHOPIFY, usage)
+                return JsonResponse(job_accepted_body(job, request), status=202)
+
+            # Run all models (skin type + eyes + acne, defects, segmentation),
+            # or reuse the result for a photo analyzed moments ago
+            payload, _ = analyze_payload(image, **options)
+            if "error" in payload:
+                return JsonResponse({"error": payload["error"]}, status=400)
 
             # ----- Log FaceAnalysis event -----
             session_key = request.session.session_key
@@ -139,90 +78,220 @@ def upload_photo(request):
                 request.session.create()
                 session_key = request.session.session_key
 
-            ip = get_client_ip(request)
-            device_type = get_device_type(request)
-            domain = get_domain(request)
-
-            FaceAnalysis.objects.create(
-                session_key=session_key,
-                ip_address=ip,
-                device_type=device_type,
-                domain=domain
-            )
-
-            # ----- Face analysis Increment Shop Counter -----
-            if domain:
-                # 1. Clean the domain string
-                clean_domain = domain.replace("https://", "").replace("http://", "").strip("/")
-                
-                # 2. Find the shop (Optimized query using Q for "either/or")
-                shop_obj = Shop.objects.filter(Q(domain=clean_domain) | Q(custom_domain=clean_domain)).first()
-
-                # 3. Atomic Increment
-                if shop_obj:
-                    try:
-                        shop_obj.analysis_count = F("analysis_count") + 1
-                        shop_obj.save(update_fields=["analysis_count"])
-                    except Exception as db_err:
-                        print(f"Non-critical error incrementing counter: {db_err}")
-            # ---------------------------------------------
+            log_face_analysis(request, session_key)
 
             # Response data (NO backend tips anymore)
-            response_data = {
-                "skin_type": skin_type.title(),
-                "acne_pred": acne_pred_label,
-                "acne_confidence": round(acne_confidence, 4),
-                "cropped_face": f"data:image/jpeg;base64,{cropped_face_base64}",
-                "type_probs": preds.get("type_probs", []),
-                "yolo_boxes": yolo_boxes,
-                "yolo_annotated": f"data:image/jpeg;base64,{yolo_annotated_base64}",
-                "left_eye_color": left_eye_color,
-                "right_eye_color": right_eye_color,
-                "segmentation_overlay": f"data:image/jpeg;base64,{segmented_base64}",
-                "segmentation_results": segmentation_results
-            }
-
-            if image:
-                image.close()
-            if cropped_face:
-                cropped_face.close()
-            
-            del image, cropped_face
-            if yolo_annotated_image:
-                del yolo_annotated_image
-            if segmented_img:
-                del segmented_img
-            gc.collect()
+            response_data = absolute_image_urls(payload, request)
 
             return JsonResponse(response_data)
 
+        except InferenceUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=503)
         except Exception as e:
-            if image:
-                image.close()
-            if cropped_face:
-                cropped_face.close()
-            if yolo_annotated_image:
-                yolo_annotated_image.close()
-            if segmented_img:
-                segmented_img.close()
-            if buffered:
-                buffered.close()
-            if buffered_annot:
-                buffered_annot.close()
-            if buffered_seg:
-                buffered_seg.close()
-            gc.collect()
             return JsonResponse({"error": str(e)}, status=500)
+        finally:
+            # Every way out of the analysis, early 400s included
+            image = None
+            memory_governor.after_request()
 
     return JsonResponse({"error": "Invalid request method"}, status=400)
 
 
+@csrf_exempt
+@rate_limited(lambda request: shop_rate_alias(request), lambda request: rate_limit_shop(request))
+@admission_controlled
+async def upload_photo_async(request):
+    """
+    upload_photo for ASGI deployments. The server has already received the
+    upload without holding a thread; decoding and the models run on the
+    bounded offload executor and the usage bookkeeping uses the async ORM,
+    so a worker keeps serving other requests while one is analyzed.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=400)
+
+    image = None
+    try:
+        # The multipart body is parsed (request.FILES) off the event loop too
+        try:
+            image = await inference_offloader.run(decode_request_photo, request)
+            options = response_options(request.POST)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        if job_requested(request.POST):
+            if not request.session.session_key:
+                await request.session.acreate()
+            usage = {"session_key": request.session.session_key, **analysis_log_fields(request, get_domain(request))}
+            job = await inference_offloader.run(enqueue_analysis, image, options, AnalysisJob.SHOPIFY, usage)
+            return JsonResponse(job_accepted_body(job, request), status=202)
+
+        payload, _ = await analyze_payload_async(image, **options)
+        if "error" in payload:
+            return JsonResponse({"error": payload["error"]}, status=400)
+
+        # ----- Log FaceAnalysis event -----
+        session_key = request.session.session_key
+        if not session_key:
+            await request.session.acreate()
+            session_key = request.session.session_key
+
+        domain = get_domain(request)
+        await FaceAnalysis.objects.acreate(session_key=session_key, **analysis_log_fields(request, domain))
+
+        # ----- Face analysis Increment Shop Counter -----
+        if domain:
+            shop_obj = await shops_for_domain(domain).afirst()
+            if shop_obj:
+                try:
+                    shop_obj.analysis_count = F("analysis_count") + 1
+                    await shop_obj.asave(update_fields=["analysis_count"])
+                except Exception as db_err:
+                    print(f"Non-critical error incrementing counter: {db_err}")
+
+        response_data = absolute_image_urls(payload, request)
+
+        return JsonResponse(response_data)
+
+    except InferenceUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    finally:
+        # Every way out of the analysis, early 400s included
+        image = None
+        await inference_offloader.run(memory_governor.after_request)
+
+
+@csrf_exempt
+@rate_limited(lambda request: shop_rate_alias(request), lambda request: rate_limit_shop(request))
+def upload_photo_stream(request):
+    """
+    upload_photo as server-sent events (see recommender/streaming.py): each
+    section of the result is sent as soon as its model has finished, then a
+    "done" event once the analysis has been logged.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=400)
+
+    # Admitted like the JSON views; the slot is held until the analysis ends
+    try:
+        slot = analysis_admission.acquire()
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    try:
+        options = response_options(request.POST)
+        image = decode_request_photo(request)
+        # The session cookie goes out with the response headers, before any event
+        if not request.session.session_key:
+            request.session.create()
+        session_key = request.session.session_key
+    except ValueError as e:
+        analysis_admission.release(slot)
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        analysis_admission.release(slot)
+        return JsonResponse({"error": str(e)}, status=500)
+
+    def finish(payload):
+        log_face_analysis(request, session_key)
+        return {"status": "success"}
+
+    return event_stream_response(stream_analysis(request, image, options, finish, slot))
+
+
+# Helper function to decode the photo of an upload request (ValueError = 400)
+def decode_request_photo(request):
+    # Load image from uploaded file or base64 string
+    if 'photo' in request.FILES:
+        photo_file = request.FILES['photo']
+
+        # ✅ Validate file size (max 10 MB)
+        max_size = 10 * 1024 * 1024  # 10 MB
+        if photo_file.size > max_size:
+            raise ValueError("File too large (max 10 MB allowed).")
+
+        # ✅ Validate file extension
+        valid_extensions = ['jpg', 'jpeg', 'png']
+        extension = photo_file.name.split('.')[-1].lower()
+        if extension not in valid_extensions:
+            raise ValueError("Invalid file type. Only PNG, JPG, and JPEG are allowed.")
+
+        # ✅ Validate dimensions from the header, then decode (bounded)
+        return decode_upload(photo_file)
+
+    data_url = request.POST.get('photo')
+    if not data_url:
+        raise ValueError("No image data provided")
+    header, encoded = data_url.split(",", 1)
+    decoded = base64.b64decode(encoded)
+
+    # ✅ Validate base64 image size (max 10 MB)
+    if len(decoded) > 10 * 1024 * 1024:
+        raise ValueError("Image too large (max 10 MB allowed).")
+
+    # ✅ Validate image format and dimensions (checked on the header, before decoding)
+    return decode_upload(decoded, allowed_formats=("JPEG", "PNG"))
+
+
+# Helper function to find the Shopify shop behind a request's domain
+def shops_for_domain(domain):
+    clean_domain = domain.replace("https://", "").replace("http://", "").strip("/")
+    return Shop.objects.filter(Q(domain=clean_domain) | Q(custom_domain=clean_domain))
+
+
+# Helper function for the rate limiter's name of the request's Shopify shop:
+# the domain its usage is counted against (the `shop` field or Origin, both
+# client-supplied)
+def shop_rate_alias(request):
+    domain = get_domain(request).replace("https://", "").replace("http://", "").strip("/")
+    return f"shopify:{domain}" if domain else ""
+
+
+# Helper function for the rate limiter to look up the shop of shop_rate_alias
+def rate_limit_shop(request):
+    shop_obj = shops_for_domain(get_domain(request)).first()
+    return (f"shopify:{shop_obj.pk}", None, False) if shop_obj else None
+
+
+# Helper function to log a successful analysis and count it for the shop
+def log_face_analysis(request, session_key):
+    domain = get_domain(request)
+    FaceAnalysis.objects.create(session_key=session_key, **analysis_log_fields(request, domain))
+
+    # ----- Face analysis Increment Shop Counter -----
+    if domain:
+        shop_obj = shops_for_domain(domain).first()
+
+        # Atomic Increment
+        if shop_obj:
+            try:
+                shop_obj.analysis_count = F("analysis_count") + 1
+                shop_obj.save(update_fields=["analysis_count"])
+            except Exception as db_err:
+                print(f"Non-critical error incrementing counter: {db_err}")
+
+
+# Helper function for the request details logged with each FaceAnalysis
+def analysis_log_fields(request, domain):
+    return {
+        "ip_address": get_client_ip(request),
+        "device_type": get_device_type(request),
+        "domain": domain,
+    }
+
+
 # Helper function to get client IP address from request headers
 def get_client_ip(request):
+    # Only the last TRUSTED_PROXY_COUNT entries were added by our own proxies;
+    # the client can put anything before them
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        # Handle cases where multiple IPs exist
-        return x_forwarded_for.split(',')[0].strip()
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if x_forwarded_for and proxies:
+        addresses = [address.strip() for address in x_forwarded_for.split(',') if address.strip()]
+        if len(addresses) >= proxies:
+            return addresses[-proxies]
     return request.META.get('REMOTE_ADDR')
 
 
@@ -612,6 +681,73 @@ def filter_logs(request):
     ]
     return JsonResponse({"logs": results})
 
+
+@require_GET
+def serve_artifact(request, token):
+    """
+    Serve a result image through the signed URL from an upload response.
+    404 once the signature has expired or the janitor has evicted the file.
+    """
+    try:
+        key = artifact_key(token, max_age=settings.ARTIFACT_TTL_SECONDS)
+    except signing.BadSignature:
+        raise Http404("Unknown or expired image")
+
+    # Content-addressed: the key never changes meaning, so it is a strong ETag
+    etag = f'"{key}"'
+    cache_control = f"private, max-age={settings.ARTIFACT_TTL_SECONDS}, immutable"
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponseNotModified()
+    else:
+        artifact = artifact_store.open(key)
+        if artifact is None:
+            raise Http404("Unknown or expired image")
+        response = FileResponse(artifact, content_type=mimetypes.guess_type(key)[0] or "application/octet-stream")
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    response["X-Content-Type-Options"] = "nosniff"
+    return response
+
+
+@require_GET
+def analysis_job(request, job_id):
+    """
+    Poll a job-mode analysis: 202 while it is queued or running, then the
+    analysis (as upload_photo would have returned it) under "result", or
+    the reason under "error". 404 once the job has expired.
+    """
+    job = AnalysisJob.objects.defer("image").filter(pk=job_id, expires_at__gt=timezone.now()).first()
+    if job is None:
+        return JsonResponse({"error": "Unknown or expired job"}, status=404)
+
+    body = {"job_id": str(job.pk), "status": job.status}
+    if job.status == AnalysisJob.DONE:
+        body["result"] = absolute_image_urls(job.result, request)
+        return JsonResponse(body)
+    if job.status == AnalysisJob.FAILED:
+        body["error"] = job.error
+        return JsonResponse(body)
+
+    response = JsonResponse(body, status=202)
+    response["Retry-After"] = "1"
+    return response
+
+
+@login_required
+def inference_stats(request):
+    """
+    Runtime counters of the inference pipeline for tuning (staff only).
+    """
+    if not (request.user.is_staff or request.user.is_superuser):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    return JsonResponse({
+        **pipeline_stats(),
+        "memory": memory_governor.stats(),
+        "admission": analysis_admission.stats(),
+        "rate_limits": analysis_rate_limiter.stats(),
+    })
+
 def staff_login(request):
     # Already logged in? Send to dashboard
     if request.user.is_authenticated:
@@ -3,7 +3,7 @@ from .models import WordpressShop, Plan
 
 @admin.register(Plan)
 class PlanAdmin(admin.ModelAdmin):
-    list_display = ('name', 'monthly_limit')
+    list_display = ('name', 'monthly_limit', 'rate_limit_per_minute', 'rate_limit_burst')
     search_fields = ('name',)
 
 @admin.register(WordpressShop)
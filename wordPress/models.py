@@ -7,6 +7,9 @@ class Plan(models.Model):
     PLAN_CHOICES = [('free', 'Free'), ('pro', 'Pro'), ('enterprise', 'Enterprise')]
     name = models.CharField(max_length=20, choices=PLAN_CHOICES, unique=True, default='free')
     monthly_limit = models.IntegerField(default=500)
+    # Analysis request rate (token bucket, see recommender/ratelimit.py)
+    rate_limit_per_minute = models.PositiveIntegerField(default=60)
+    rate_limit_burst = models.PositiveIntegerField(default=10)
 
     def __str__(self):
         return f"{self.get_name_display()} - {self.monthly_limit} scans"
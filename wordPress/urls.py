@@ -6,5 +6,7 @@ urlpatterns = [
     path('finalize/', views.finalize_connection, name='wp-finalize'),
     path('deactivate/', views.deactivate_shop, name='wp-deactivate'),
     path('analyze/', views.wp_analyze_photo, name='wp-analyze'),
+    path('analyze/async/', views.wp_analyze_photo_async, name='wp-analyze-async'),
+    path('analyze/stream/', views.wp_analyze_photo_stream, name='wp-analyze-stream'),
     path('status/', views.wp_shop_status, name='wp-status'),
 ]
\ No newline at end of file
@@ -1,10 +1,8 @@
 import uuid
 import base64
-import io
-import gc
 import json
-from PIL import Image
 
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
@@ -12,9 +10,18 @@ from django.core.cache import cache
 from .models import WordpressShop, Plan
 
 # --- AI Model Imports (Reused from Recommender App) ---
-from recommender.AImodels.ml_model import predict
-from recommender.AImodels.yolo_model import detect_skin_defects_yolo
-from recommender.AImodels.segment_skin_conditions_yolo import segment_skin_conditions 
+from recommender.AImodels.inference import (
+    analyze_payload, analyze_payload_async, response_options, InferenceUnavailable,
+)
+from recommender.AImodels.admission import Overloaded, admission_controlled, analysis_admission, overloaded_response
+from recommender.AImodels.artifacts import absolute_image_urls
+from recommender.AImodels.preprocess import decode_upload
+from recommender.AImodels.memory import memory_governor
+from recommender.AImodels.offload import inference_offloader
+from recommender.jobs import enqueue_analysis, job_accepted_body, job_requested
+from recommender.ratelimit import rate_limited
+from recommender.streaming import event_stream_response, stream_analysis
+from recommender.models import AnalysisJob
 
 def connect_page(request):
     """
@@ -79,6 +86,8 @@ def deactivate_shop(request):
     return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
 
 @csrf_exempt
+@rate_limited(lambda request: wp_rate_alias(request), lambda request: wp_rate_limit_shop(request))
+@admission_controlled
 def wp_analyze_photo(request):
     """
     Step 3: The actual analysis endpoint for WordPress with Dynamic Quota Check.
@@ -102,73 +111,29 @@ def wp_analyze_photo(request):
     # This uses the current_limit property from the model based on the Plan
     max_quota = shop.current_limit
     if shop.analysis_this_month >= max_quota:
-        return JsonResponse({
-            "status": "quota_exceeded",
-            "error": "Quota Ended", 
-            "message": f"You have reached your limit of {max_quota} analyses. Please upgrade your plan."
-        }, status=403)
+        return quota_exceeded_response(max_quota)
 
     # 3. IMAGE PROCESSING & AI ANALYSIS
     image = None
-    cropped_face = None
-    yolo_annotated_image = None
-    segmented_img = None
 
     try:
-        # Load image
-        if 'photo' in request.FILES:
-            photo_file = request.FILES['photo']
-            image = Image.open(photo_file).convert('RGB')
-        else:
-            data_url = request.POST.get('photo')
-            if not data_url:
-                return JsonResponse({"error": "No image data provided"}, status=400)
-            
-            encoded = data_url.split(",", 1)[1] if "," in data_url else data_url
-            decoded = base64.b64decode(encoded)
-            image = Image.open(io.BytesIO(decoded)).convert('RGB')
-
-        # --- A. Run Main Classifier ---
-        preds = predict(image)
-        if "error" in preds:
-            return JsonResponse({"error": preds["error"]}, status=400)
-
-        skin_type = preds['type_pred'].lower()
-        cropped_face = preds.get("cropped_face")
-
-        # Encode Cropped Face
-        buffered = io.BytesIO()
-        cropped_face.save(buffered, format="JPEG")
-        cropped_face_base64 = base64.b64encode(buffered.getvalue()).decode()
-        buffered.close()
-
-        # Eye Colors
-        left_eye_color = preds.get("left_eye_color", "Unknown")
-        right_eye_color = preds.get("right_eye_color", "Unknown")
-        if isinstance(left_eye_color, str) and "closed" not in left_eye_color.lower():
-            left_eye_color = left_eye_color.title()
-        if isinstance(right_eye_color, str) and "closed" not in right_eye_color.lower():
-            right_eye_color = right_eye_color.title()
-
-        # Acne Prediction logic
-        acne_pred = preds.get("acne_pred", "Unknown")
-        acne_confidence = preds.get("acne_confidence", 0)
-        acne_mapping = {"0": "Clear", "1": "Mild", "2": "Moderate", "3": "Severe", "clear": "Clear"}
-        acne_pred_label = acne_mapping.get(str(acne_pred).lower(), "Unknown")
-
-        # --- B. Run YOLOv8 for Defects ---
-        yolo_boxes, yolo_annotated_image = detect_skin_defects_yolo(cropped_face)
-        buffered_annot = io.BytesIO()
-        yolo_annotated_image.save(buffered_annot, format="JPEG")
-        yolo_annotated_base64 = base64.b64encode(buffered_annot.getvalue()).decode()
-        buffered_annot.close()
-
-        # --- C. Run YOLOv8 for Segmentation ---
-        segmented_img, segmentation_results = segment_skin_conditions(cropped_face)
-        buffered_seg = io.BytesIO()
-        segmented_img.save(buffered_seg, format="JPEG")
-        segmented_base64 = base64.b64encode(buffered_seg.getvalue()).decode()
-        buffered_seg.close()
+        # Load image (header checked first, decode bounded by the upload limits)
+        try:
+            options = response_options(request.POST)
+            image = decode_request_photo(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        # Job mode: usage is counted by the job worker once the analysis succeeds
+        if job_requested(request.POST):
+            job = enqueue_analysis(image, options, AnalysisJob.WORDPRESS, {"shop_id": shop.pk})
+            return JsonResponse(job_accepted_body(job, request), status=202)
+
+        # --- A. Run All Models (classifiers, defects, segmentation) ---
+        # A resubmitted photo reuses the cached result but still counts below
+        payload, _ = analyze_payload(image, **options)
+        if "error" in payload:
+            return JsonResponse({"error": payload["error"]}, status=400)
 
         # 4. UPDATE QUOTA
         shop.analysis_this_month += 1
@@ -176,39 +141,195 @@ def wp_analyze_photo(request):
         shop.save()
 
         # 5. PREPARE RESPONSE
-        response_data = {
-            "status": "success",
-            "usage": {
-                "used": shop.analysis_this_month,
-                "limit": max_quota
-            },
-            "skin_type": skin_type.title(),
-            "acne_pred": acne_pred_label,
-            "acne_confidence": round(acne_confidence, 4),
-            "cropped_face": f"data:image/jpeg;base64,{cropped_face_base64}",
-            "type_probs": preds.get("type_probs", []),
-            "yolo_boxes": yolo_boxes,
-            "yolo_annotated": f"data:image/jpeg;base64,{yolo_annotated_base64}",
-            "left_eye_color": left_eye_color,
-            "right_eye_color": right_eye_color,
-            "segmentation_overlay": f"data:image/jpeg;base64,{segmented_base64}",
-            "segmentation_results": segmentation_results
-        }
+        response_data = analysis_response_data(request, shop, max_quota, payload)
+
+        return JsonResponse(response_data)
+
+    except InferenceUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    finally:
+        # Every way out of the analysis, early 400s included
+        image = None
+        memory_governor.after_request()
+
+
+@csrf_exempt
+@rate_limited(lambda request: wp_rate_alias(request), lambda request: wp_rate_limit_shop(request))
+@admission_controlled
+async def wp_analyze_photo_async(request):
+    """
+    wp_analyze_photo for ASGI deployments: decoding and the models run on
+    the bounded offload executor, the shop lookup and quota update use the
+    async ORM, and the event loop keeps serving other uploads meanwhile.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+
+    # 1. AUTHENTICATION (the body is parsed into request.POST and
+    # request.FILES off the event loop; later accesses reuse the result)
+    await sync_to_async(getattr, thread_sensitive=False)(request, "POST")
+    api_key = request.POST.get('api_key')
+    shop_url = request.POST.get('shop_url')
+
+    if not api_key or not shop_url:
+        return JsonResponse({"error": "Missing API Key or Shop URL"}, status=400)
+
+    shop = await (
+        WordpressShop.objects.select_related("plan")
+        .filter(domain=shop_url, api_key=api_key, is_active=True)
+        .afirst()
+    )
+
+    if not shop:
+        return JsonResponse({"error": "Unauthorized: Invalid API Key or inactive shop"}, status=401)
+
+    # 2. DYNAMIC QUOTA CHECK
+    max_quota = shop.current_limit
+    if shop.analysis_this_month >= max_quota:
+        return quota_exceeded_response(max_quota)
+
+    # 3. IMAGE PROCESSING & AI ANALYSIS
+    image = None
+
+    try:
+        try:
+            options = response_options(request.POST)
+            image = await inference_offloader.run(decode_request_photo, request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        if job_requested(request.POST):
+            job = await inference_offloader.run(
+                enqueue_analysis, image, options, AnalysisJob.WORDPRESS, {"shop_id": shop.pk}
+            )
+            return JsonResponse(job_accepted_body(job, request), status=202)
 
-        # Final Memory Cleanup
-        if image: image.close()
-        if cropped_face: cropped_face.close()
-        if yolo_annotated_image: yolo_annotated_image.close()
-        if segmented_img: segmented_img.close()
-        gc.collect()
+        payload, _ = await analyze_payload_async(image, **options)
+        if "error" in payload:
+            return JsonResponse({"error": payload["error"]}, status=400)
+
+        # 4. UPDATE QUOTA
+        shop.analysis_this_month += 1
+        shop.analysis_all_time += 1
+        await shop.asave()
+
+        # 5. PREPARE RESPONSE
+        response_data = analysis_response_data(request, shop, max_quota, payload)
 
         return JsonResponse(response_data)
 
+    except InferenceUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    finally:
+        # Every way out of the analysis, early 400s included
+        image = None
+        await inference_offloader.run(memory_governor.after_request)
+
+
+@csrf_exempt
+@rate_limited(lambda request: wp_rate_alias(request), lambda request: wp_rate_limit_shop(request))
+def wp_analyze_photo_stream(request):
+    """
+    wp_analyze_photo as server-sent events (see recommender/streaming.py):
+    the result sections arrive as their models finish and the final "done"
+    event carries the usage once the analysis has been counted.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+
+    api_key = request.POST.get('api_key')
+    shop_url = request.POST.get('shop_url')
+
+    if not api_key or not shop_url:
+        return JsonResponse({"error": "Missing API Key or Shop URL"}, status=400)
+
+    shop = WordpressShop.objects.filter(domain=shop_url, api_key=api_key, is_active=True).first()
+
+    if not shop:
+        return JsonResponse({"error": "Unauthorized: Invalid API Key or inactive shop"}, status=401)
+
+    max_quota = shop.current_limit
+    if shop.analysis_this_month >= max_quota:
+        return quota_exceeded_response(max_quota)
+
+    # Admitted like the JSON views; the slot is held until the analysis ends
+    try:
+        slot = analysis_admission.acquire()
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    try:
+        options = response_options(request.POST)
+        image = decode_request_photo(request)
+    except ValueError as e:
+        analysis_admission.release(slot)
+        return JsonResponse({"error": str(e)}, status=400)
     except Exception as e:
-        if 'image' in locals() and image: image.close()
-        if 'cropped_face' in locals() and cropped_face: cropped_face.close()
-        gc.collect()
+        analysis_admission.release(slot)
         return JsonResponse({"error": str(e)}, status=500)
+
+    def finish(payload):
+        shop.analysis_this_month += 1
+        shop.analysis_all_time += 1
+        shop.save()
+        return {"status": "success", "usage": {"used": shop.analysis_this_month, "limit": max_quota}}
+
+    return event_stream_response(stream_analysis(request, image, options, finish, slot))
+
+
+def decode_request_photo(request):
+    """Decoded photo of an analyze request (file or base64); ValueError if unusable."""
+    if 'photo' in request.FILES:
+        return decode_upload(request.FILES['photo'])
+
+    data_url = request.POST.get('photo')
+    if not data_url:
+        raise ValueError("No image data provided")
+
+    encoded = data_url.split(",", 1)[1] if "," in data_url else data_url
+    decoded = base64.b64decode(encoded)
+    return decode_upload(decoded)
+
+
+def wp_rate_alias(request):
+    """The rate limiter's name of the request's shop (its api_key and shop_url)."""
+    api_key = request.POST.get('api_key')
+    shop_url = request.POST.get('shop_url')
+    return f"wp:{api_key}:{shop_url}" if api_key and shop_url else ""
+
+
+def wp_rate_limit_shop(request):
+    """The shop wp_rate_alias names, if the key authenticates, for the rate limiter."""
+    shop = (
+        WordpressShop.objects.select_related("plan")
+        .filter(domain=request.POST.get('shop_url'), api_key=request.POST.get('api_key'), is_active=True)
+        .first()
+    )
+    return (f"wp:{shop.pk}", shop.plan, True) if shop else None
+
+
+def quota_exceeded_response(max_quota):
+    return JsonResponse({
+        "status": "quota_exceeded",
+        "error": "Quota Ended", 
+        "message": f"You have reached your limit of {max_quota} analyses. Please upgrade your plan."
+    }, status=403)
+
+
+def analysis_response_data(request, shop, max_quota, payload):
+    return {
+        "status": "success",
+        "usage": {
+            "used": shop.analysis_this_month,
+            "limit": max_quota
+        },
+        **absolute_image_urls(payload, request),
+    }
+
     
 def wp_shop_status(request):
     api_key = request.GET.get('api_key')